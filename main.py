@@ -1,15 +1,37 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog
+import tkinter.font as tkfont
 import subprocess
 import os
 import sys
 import json
 import threading
+import queue
+import selectors
+import codecs
+import gzip
+import mmap
+import bisect
+import heapq
+import itertools
+import contextlib
+import random
+import struct
+from array import array
+from collections import deque, OrderedDict
 import time
 from datetime import datetime
 import uuid
 import shutil
+import re
+import signal
+import argparse
+import http.client
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
 import glob
+import fnmatch
 import webbrowser
 
 # Безопасный импорт psutil
@@ -20,6 +42,20 @@ except ImportError:
     HAS_PSUTIL = False
     print("Предупреждение: psutil не установлен. Мониторинг ресурсов будет отключен.")
 
+# Лимиты процессов через setrlimit есть только в POSIX
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:
+    HAS_RESOURCE = False
+
+# Каталог в SQLite необязателен: модуль sqlite3 есть не во всех сборках Python
+try:
+    import sqlite3
+    HAS_SQLITE = True
+except ImportError:
+    HAS_SQLITE = False
+
 # Условные импорты для macOS
 if sys.platform == "darwin":
     try:
@@ -139,6 +175,475 @@ def get_base_path():
 
 
 BASE_PATH = get_base_path()
+SCRIPTS_FILE = os.path.join(BASE_PATH, "scripts.json")
+SETTINGS_FILE = os.path.join(BASE_PATH, "settings.json")
+# Суффикс резервной копии последней удачной версии файла
+JSON_BACKUP_SUFFIX = ".bak"
+
+
+def load_json_file(path):
+    """Словарь из JSON-файла; пустой, если файла нет.
+
+    Если файл есть, но повреждён (например, после сбоя питания до сброса
+    на диск), загружается резервная копия предыдущей версии.
+    """
+    if not os.path.exists(path):
+        return {}
+    for candidate in (path, path + JSON_BACKUP_SUFFIX):
+        try:
+            with open(candidate, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ошибка загрузки {candidate}: {e}")
+            continue
+        if candidate != path:
+            print(f"{path} повреждён, загружена резервная копия")
+        return data
+    return {}
+
+
+def write_json_atomic(path, data, text=None):
+    """Атомарно записывает JSON: временный файл, fsync и os.replace.
+
+    Прежняя версия сохраняется как <файл>.bak (жёсткой ссылкой, если
+    можно). Файл на диске всегда либо старый, либо новый целиком.
+    """
+    if text is None:
+        text = json.dumps(data, indent=4, ensure_ascii=False)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    if os.path.exists(path):
+        backup_path = path + JSON_BACKUP_SUFFIX
+        try:
+            os.link(path, backup_path + ".tmp")
+            os.replace(backup_path + ".tmp", backup_path)
+        except OSError:
+            try:
+                shutil.copy2(path, backup_path)
+            except OSError as e:
+                print(f"Не удалось сохранить резервную копию {path}: {e}")
+    os.replace(temp_path, path)
+    if hasattr(os, 'O_DIRECTORY'):
+        # Переименование тоже должно дойти до диска
+        try:
+            fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+
+# Задержка отложенной записи каталога и настроек (миллисекунды)
+PERSIST_DELAY_MS = 500
+
+
+class JsonStore:
+    """JSON-файл с отложенной атомарной записью.
+
+    mark_dirty() только отмечает изменение, а flush() записывает текущее
+    состояние, которое возвращает snapshot(). Владелец вызывает flush()
+    с задержкой, поэтому серия изменений даёт одну запись. Текст, не
+    изменившийся с прошлой записи, повторно не пишется.
+    """
+
+    def __init__(self, path, snapshot):
+        self.path = path
+        self.snapshot = snapshot
+        self.dirty = False
+        self._written = None
+
+    def load(self):
+        return load_json_file(self.path)
+
+    def mark_dirty(self, keys=None):
+        # Файл всегда пишется целиком, поэтому изменённые ключи не нужны
+        self.dirty = True
+
+    def flush(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        text = json.dumps(self.snapshot(), indent=4, ensure_ascii=False)
+        if text == self._written:
+            return
+        try:
+            write_json_atomic(self.path, None, text)
+            self._written = text
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Ошибка сохранения {self.path}: {e}")
+
+
+CATALOG_DB_FILE = os.path.join(BASE_PATH, "catalog.db")
+# Версия схемы базы каталога (PRAGMA user_version)
+CATALOG_SCHEMA_VERSION = 1
+# Сколько ждать, пока базу держит другой процесс (секунды)
+CATALOG_BUSY_TIMEOUT = 5.0
+# Сколько последних запусков каждого скрипта хранится в истории
+RUN_HISTORY_LIMIT = 500
+
+# Полный текст скрипта лежит в info, а отдельные столбцы и таблица тегов
+# нужны только для индексированного поиска
+CATALOG_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS scripts (
+        uuid TEXT PRIMARY KEY,
+        name TEXT NOT NULL DEFAULT '',
+        display_name TEXT NOT NULL DEFAULT '',
+        path TEXT NOT NULL DEFAULT '',
+        interpreter TEXT NOT NULL DEFAULT '',
+        is_active INTEGER NOT NULL DEFAULT 0,
+        info TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS scripts_name ON scripts(name)",
+    "CREATE INDEX IF NOT EXISTS scripts_display_name ON scripts(display_name)",
+    "CREATE INDEX IF NOT EXISTS scripts_path ON scripts(path)",
+    "CREATE INDEX IF NOT EXISTS scripts_interpreter ON scripts(interpreter)",
+    """CREATE TABLE IF NOT EXISTS script_tags (
+        uuid TEXT NOT NULL,
+        tag TEXT NOT NULL,
+        PRIMARY KEY (uuid, tag)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS script_tags_tag ON script_tags(tag)",
+    """CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY,
+        uuid TEXT NOT NULL,
+        pid INTEGER,
+        started_at REAL NOT NULL,
+        ended_at REAL,
+        exit_code INTEGER,
+        stopped INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS runs_uuid ON runs(uuid, id)",
+    "CREATE INDEX IF NOT EXISTS runs_started_at ON runs(started_at)",
+    """CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )""",
+)
+
+
+def catalog_row_text(value):
+    """Текст строки базы; по нему же отслеживаются изменения"""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+class SqliteCatalog:
+    """Каталог скриптов, история запусков и настройки в базе SQLite.
+
+    Одно соединение на процесс, общее для всех потоков под блокировкой.
+    WAL позволяет интерфейсу, демону и CLI работать с базой одновременно.
+    """
+
+    def __init__(self, path=CATALOG_DB_FILE, initial=None):
+        """initial() -> (скрипты, настройки) для переноса в новую базу"""
+        self.path = path
+        self._lock = threading.Lock()
+        # Транзакции открываются явно в _transaction()
+        self.connection = sqlite3.connect(path, timeout=CATALOG_BUSY_TIMEOUT,
+                                          check_same_thread=False, isolation_level=None)
+        try:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.created = self._create_schema(initial)
+        except BaseException:
+            self.connection.close()
+            raise
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def _create_schema(self, initial):
+        """Создаёт схему и переносит initial() одной транзакцией; True, если база была пустой.
+
+        Версия схемы фиксируется вместе с перенесёнными данными, поэтому
+        прерванный перенос повторяется при следующем открытии.
+        """
+        with self._transaction() as db:
+            version = db.execute("PRAGMA user_version").fetchone()[0]
+            if version >= CATALOG_SCHEMA_VERSION:
+                return False
+            for statement in CATALOG_SCHEMA:
+                db.execute(statement)
+            if version == 0 and initial is not None:
+                scripts, settings = initial()
+                self._write_scripts(db, {script_uuid: (script_info, catalog_row_text(script_info))
+                                         for script_uuid, script_info in scripts.items()})
+                settings = dict(settings, catalog_backend='sqlite')
+                self._write_settings(db, {key: catalog_row_text(value) for key, value in settings.items()})
+            db.execute(f"PRAGMA user_version = {CATALOG_SCHEMA_VERSION}")
+        return version == 0
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+    def script_rows(self):
+        """[(uuid, текст info)] в порядке добавления"""
+        with self._lock:
+            return self.connection.execute("SELECT uuid, info FROM scripts ORDER BY rowid").fetchall()
+
+    def load_scripts(self):
+        scripts = {}
+        for script_uuid, text in self.script_rows():
+            try:
+                scripts[script_uuid] = json.loads(text)
+            except ValueError as e:
+                print(f"Повреждена запись скрипта {script_uuid} в {self.path}: {e}")
+        return scripts
+
+    def write_scripts(self, changed, removed=()):
+        """Одной транзакцией записывает changed {uuid: (info, текст)} и удаляет removed"""
+        with self._transaction() as db:
+            self._write_scripts(db, changed, removed)
+
+    def _write_scripts(self, db, changed, removed=()):
+        for script_uuid in removed:
+            db.execute("DELETE FROM scripts WHERE uuid = ?", (script_uuid,))
+            db.execute("DELETE FROM script_tags WHERE uuid = ?", (script_uuid,))
+        for script_uuid, (script_info, text) in changed.items():
+            db.execute(
+                "INSERT INTO scripts (uuid, name, display_name, path, interpreter, is_active, info) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(uuid) DO UPDATE SET "
+                "name = excluded.name, display_name = excluded.display_name, path = excluded.path, "
+                "interpreter = excluded.interpreter, is_active = excluded.is_active, info = excluded.info",
+                (script_uuid, script_info.get('name', ''), script_display_name(script_info),
+                 script_info.get('path', ''), script_info.get('interpreter', ''),
+                 int(bool(script_info.get('is_active', False))), text))
+            db.execute("DELETE FROM script_tags WHERE uuid = ?", (script_uuid,))
+            db.executemany("INSERT OR IGNORE INTO script_tags (uuid, tag) VALUES (?, ?)",
+                           [(script_uuid, str(tag)) for tag in script_info.get('tags', [])])
+
+    def find(self, patterns=(), tags=(), interpreter=None, path=None):
+        """uuid скриптов по индексам: шаблоны glob по uuid и именам, любой из тегов,
+        интерпретатор и путь"""
+        clauses, params = [], []
+        if patterns:
+            clauses.append("(" + " OR ".join(["uuid GLOB ? OR name GLOB ? OR display_name GLOB ?"] * len(patterns)) + ")")
+            params.extend(pattern for pattern in patterns for _ in range(3))
+        if tags:
+            clauses.append("uuid IN (SELECT uuid FROM script_tags WHERE tag IN ({}))".format(
+                ", ".join("?" * len(tags))))
+            params.extend(tags)
+        if interpreter is not None:
+            clauses.append("interpreter = ?")
+            params.append(interpreter)
+        if path is not None:
+            clauses.append("path = ?")
+            params.append(path)
+        query = "SELECT uuid FROM scripts"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            rows = self.connection.execute(query + " ORDER BY rowid", params).fetchall()
+        return [row[0] for row in rows]
+
+    def setting_rows(self):
+        with self._lock:
+            return self.connection.execute("SELECT key, value FROM settings").fetchall()
+
+    def load_settings(self):
+        settings = {}
+        for key, text in self.setting_rows():
+            try:
+                settings[key] = json.loads(text)
+            except ValueError as e:
+                print(f"Повреждена настройка {key} в {self.path}: {e}")
+        return settings
+
+    def write_settings(self, changed, removed=()):
+        """Записывает changed {ключ: текст значения} и удаляет removed"""
+        with self._transaction() as db:
+            self._write_settings(db, changed, removed)
+
+    def _write_settings(self, db, changed, removed=()):
+        db.executemany("DELETE FROM settings WHERE key = ?", [(key,) for key in removed])
+        db.executemany("INSERT INTO settings (key, value) VALUES (?, ?) "
+                       "ON CONFLICT(key) DO UPDATE SET value = excluded.value", list(changed.items()))
+
+    def run_started(self, script_uuid, pid, started_at=None):
+        """Добавляет запуск в историю и возвращает его id"""
+        with self._transaction() as db:
+            run_id = db.execute("INSERT INTO runs (uuid, pid, started_at) VALUES (?, ?, ?)",
+                                (script_uuid, pid, started_at or time.time())).lastrowid
+            # Старые запуски скрипта вытесняются
+            db.execute("DELETE FROM runs WHERE uuid = ? AND id <= "
+                       "(SELECT id FROM runs WHERE uuid = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                       (script_uuid, script_uuid, RUN_HISTORY_LIMIT))
+        return run_id
+
+    def run_ended(self, run_id, exit_code=None, stopped=False, ended_at=None):
+        with self._transaction() as db:
+            db.execute("UPDATE runs SET ended_at = ?, exit_code = ?, stopped = ? WHERE id = ?",
+                       (ended_at or time.time(), exit_code, int(stopped), run_id))
+
+    def runs(self, script_uuid, limit=20):
+        """Последние запуски скрипта, новые первыми"""
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT pid, started_at, ended_at, exit_code, stopped FROM runs "
+                "WHERE uuid = ? ORDER BY id DESC LIMIT ?", (script_uuid, limit)).fetchall()
+        return [{'pid': pid, 'started_at': started_at, 'ended_at': ended_at,
+                 'exit_code': exit_code, 'stopped': bool(stopped)}
+                for pid, started_at, ended_at, exit_code, stopped in rows]
+
+    def export_json(self, scripts_file, settings_file):
+        write_json_atomic(scripts_file, self.load_scripts())
+        write_json_atomic(settings_file, self.load_settings())
+
+
+def open_catalog(path=CATALOG_DB_FILE, scripts_file=SCRIPTS_FILE, settings_file=SETTINGS_FILE):
+    """Каталог SQLite или None, если каталог хранится в JSON.
+
+    База используется, если catalog.db уже есть или в settings.json выбран
+    catalog_backend = 'sqlite'; в новую базу переносятся scripts.json и
+    settings.json. Если в настройках базы выбран 'json', её содержимое
+    выгружается обратно в JSON, а сама база откладывается в .bak.
+    """
+    if not HAS_SQLITE:
+        return None
+    if not os.path.exists(path) and load_json_file(settings_file).get('catalog_backend') != 'sqlite':
+        return None
+    catalog = None
+    try:
+        catalog = SqliteCatalog(path, lambda: (load_json_file(scripts_file), load_json_file(settings_file)))
+        if not catalog.created and catalog.load_settings().get('catalog_backend', 'sqlite') != 'sqlite':
+            catalog.export_json(scripts_file, settings_file)
+            catalog.close()
+            catalog = None
+            os.replace(path, path + JSON_BACKUP_SUFFIX)
+            return None
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Ошибка открытия каталога {path}: {e}")
+        if catalog is not None:
+            catalog.close()
+        return None
+    return catalog
+
+
+class SqliteScriptStore:
+    """Каталог скриптов в SQLite с отложенной построчной записью.
+
+    Интерфейс как у JsonStore, но flush() записывает только скрипты,
+    текст которых изменился с прошлой записи, и удаляет исчезнувшие.
+    mark_dirty(keys) сужает сверку до указанных скриптов; snapshot(keys)
+    должен вернуть только их.
+    """
+
+    def __init__(self, catalog, snapshot):
+        self.catalog = catalog
+        self.snapshot = snapshot
+        self.dirty = False
+        # Скрипты для сверки; None - весь каталог
+        self._keys = set()
+        self._written = {}
+
+    def load(self):
+        scripts = {}
+        for script_uuid, text in self.catalog.script_rows():
+            try:
+                scripts[script_uuid] = json.loads(text)
+            except ValueError as e:
+                print(f"Повреждена запись скрипта {script_uuid}: {e}")
+                continue
+            self._written[script_uuid] = text
+        return scripts
+
+    def mark_dirty(self, keys=None):
+        self.dirty = True
+        if keys is None:
+            self._keys = None
+        elif self._keys is not None:
+            self._keys.update(keys)
+
+    def flush(self):
+        if not self.dirty:
+            return
+        keys = self._keys
+        self.dirty = False
+        self._keys = set()
+        snapshot = self.snapshot() if keys is None else self.snapshot(keys)
+        try:
+            changed = {}
+            for script_uuid, script_info in snapshot.items():
+                text = catalog_row_text(script_info)
+                if text != self._written.get(script_uuid):
+                    changed[script_uuid] = (script_info, text)
+            removed = [script_uuid for script_uuid in (self._written if keys is None else keys)
+                       if script_uuid not in snapshot and script_uuid in self._written]
+            if changed or removed:
+                self.catalog.write_scripts(changed, removed)
+        except (TypeError, ValueError, sqlite3.Error) as e:
+            print(f"Ошибка сохранения каталога {self.catalog.path}: {e}")
+            return
+        for script_uuid, (script_info, text) in changed.items():
+            self._written[script_uuid] = text
+        for script_uuid in removed:
+            del self._written[script_uuid]
+
+
+class SqliteSettingsStore:
+    """Настройки в SQLite: flush() записывает только изменившиеся ключи"""
+
+    def __init__(self, catalog, snapshot):
+        self.catalog = catalog
+        self.snapshot = snapshot
+        self.dirty = False
+        self._written = {}
+
+    def load(self):
+        self._written = dict(self.catalog.setting_rows())
+        return self.catalog.load_settings()
+
+    def mark_dirty(self, keys=None):
+        self.dirty = True
+
+    def flush(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+        try:
+            current = {key: catalog_row_text(value) for key, value in self.snapshot().items()}
+            changed = {key: text for key, text in current.items() if self._written.get(key) != text}
+            removed = [key for key in self._written if key not in current]
+            if changed or removed:
+                self.catalog.write_settings(changed, removed)
+        except (TypeError, ValueError, sqlite3.Error) as e:
+            print(f"Ошибка сохранения настроек {self.catalog.path}: {e}")
+            return
+        self._written = current
+
+
+class RunHistoryRecorder:
+    """Записывает запуски скриптов в историю базы по событиям ядра"""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        # Незавершённые запуски: {script_uuid: id строки}
+        self._open_runs = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event, script_uuid, data=None):
+        if event == 'started':
+            run_id = self.catalog.run_started(script_uuid, data)
+            with self._lock:
+                self._open_runs[script_uuid] = run_id
+        elif event in ('exited', 'stopped'):
+            with self._lock:
+                run_id = self._open_runs.pop(script_uuid, None)
+            if run_id is not None:
+                self.catalog.run_ended(run_id, data if event == 'exited' else None, stopped=event == 'stopped')
 
 # Настройки тем
 THEMES = {
@@ -165,85 +670,4439 @@ THEMES = {
 }
 
 
-class ConsoleDialog(tk.Toplevel):
-    def __init__(self, parent, script_name, process, theme="light"):
-        super().__init__(parent)
-        self.theme = theme
-        self.colors = THEMES.get(theme, THEMES["light"])
-        self.script_name = script_name
-        self.process = process
+class ScriptRuntime:
+    """Состояние выполнения одного активного скрипта (без виджетов Tk)"""
 
-        self.title(f"Консоль: {script_name}")
-        self.geometry("800x600")
-        
-        # Для macOS убираем topmost
-        if sys.platform != "darwin":
-            self.attributes('-topmost', True)
-        
-        self.setup_ui()
+    __slots__ = ('script_uuid', 'script_info', 'process', 'pid', 'is_running')
 
-    def setup_ui(self):
+    def __init__(self, script_uuid, script_info):
+        self.script_uuid = script_uuid
+        self.script_info = script_info
+        self.process = None
+        self.pid = None
+        self.is_running = False
+
+    @property
+    def display_name(self):
+        return self.script_info.get('display_name', self.script_info['name'])
+
+
+class ScriptRegistry:
+    """Реестр активных скриптов с поиском по uuid, имени и PID за O(1).
+
+    Порядок обхода совпадает с порядком добавления. Индексы по имени и PID
+    обновляются через update_info() и set_process(), поэтому после смены
+    имени или процесса нужно вызывать именно их.
+    """
+
+    def __init__(self):
+        self._by_uuid = {}
+        self._by_name = {}
+        self._by_pid = {}
+        # Имя, под которым запись проиндексирована (описание могут изменить на месте)
+        self._indexed_names = {}
+
+    def __len__(self):
+        return len(self._by_uuid)
+
+    def __contains__(self, script_uuid):
+        return script_uuid in self._by_uuid
+
+    def __iter__(self):
+        return iter(list(self._by_uuid.values()))
+
+    def uuids(self):
+        return list(self._by_uuid)
+
+    def add(self, script_uuid, script_info):
+        runtime = self._by_uuid.get(script_uuid)
+        if runtime is None:
+            runtime = ScriptRuntime(script_uuid, script_info)
+            self._by_uuid[script_uuid] = runtime
+            self._index_name(runtime)
+        return runtime
+
+    def remove(self, script_uuid):
+        runtime = self._by_uuid.pop(script_uuid, None)
+        if runtime is not None:
+            self._unindex_name(runtime)
+            if runtime.pid is not None and self._by_pid.get(runtime.pid) is runtime:
+                del self._by_pid[runtime.pid]
+        return runtime
+
+    def get(self, script_uuid):
+        return self._by_uuid.get(script_uuid)
+
+    def by_name(self, name):
+        """Все активные скрипты с данным отображаемым именем"""
+        return list(self._by_name.get(name, {}).values())
+
+    def by_pid(self, pid):
+        return self._by_pid.get(pid)
+
+    def running(self):
+        return [runtime for runtime in self._by_uuid.values() if runtime.is_running]
+
+    def _index_name(self, runtime):
+        name = runtime.display_name
+        self._indexed_names[runtime.script_uuid] = name
+        self._by_name.setdefault(name, {})[runtime.script_uuid] = runtime
+
+    def _unindex_name(self, runtime):
+        name = self._indexed_names.pop(runtime.script_uuid, None)
+        same_name = self._by_name.get(name)
+        if same_name is not None:
+            same_name.pop(runtime.script_uuid, None)
+            if not same_name:
+                del self._by_name[name]
+
+    def update_info(self, script_uuid, script_info):
+        """Заменяет описание скрипта (например, после переименования)"""
+        runtime = self._by_uuid.get(script_uuid)
+        if runtime is not None:
+            self._unindex_name(runtime)
+            runtime.script_info = script_info
+            self._index_name(runtime)
+
+    def set_process(self, script_uuid, process):
+        """Привязывает процесс к скрипту (None - скрипт остановлен)"""
+        runtime = self._by_uuid.get(script_uuid)
+        if runtime is None:
+            return
+        if runtime.pid is not None and self._by_pid.get(runtime.pid) is runtime:
+            del self._by_pid[runtime.pid]
+        runtime.process = process
+        runtime.pid = process.pid if process is not None else None
+        runtime.is_running = process is not None
+        if runtime.pid is not None:
+            self._by_pid[runtime.pid] = runtime
+
+
+# Период опроса ресурсов фоновым сборщиком (секунды)
+MONITOR_INTERVAL = 1.0
+# Бюджет CPU менеджера (% одного ядра): выше него опрос замедляется
+MONITOR_CPU_BUDGET = 10.0
+# Во сколько раз реже опрос, пока окно свёрнуто в трей
+MONITOR_BACKGROUND_FACTOR = 5.0
+# Предел замедления опроса из-за бюджета CPU и шаг его изменения
+MONITOR_MAX_SLOWDOWN = 8.0
+MONITOR_SLOWDOWN_STEP = 1.5
+# Как часто интерфейс забирает готовые снимки (миллисекунды)
+MONITOR_POLL_MS = 250
+
+
+# Источник замеров процессов: auto (procfs на Linux, иначе psutil), procfs или psutil
+SAMPLER_BACKENDS = ("auto", "procfs", "psutil")
+# Сколько байт читается из файлов /proc за один pread
+PROCFS_READ_SIZE = 4096
+# Интервалы дорогих сборщиков (секунды): состав дерева процессов, число
+# открытых дескрипторов, USS и число сетевых соединений. CPU, память,
+# потоки и ввод-вывод дёшевы и снимаются каждый тик.
+SAMPLER_COLLECTOR_INTERVALS = {'tree': 5.0, 'fds': 10.0, 'uss': 30.0, 'connections': 60.0}
+# Показатели, которые суммируются по всем процессам дерева
+TREE_SUM_FIELDS = ('cpu', 'memory', 'rss', 'threads', 'read_bytes', 'write_bytes')
+# Показатели дорогих сборщиков, тоже суммируемые по дереву
+TREE_COLLECTED_FIELDS = ('fds', 'uss', 'connections')
+
+
+def dead_sample():
+    return {'alive': False, 'cpu': 0.0, 'memory': 0.0, 'rss': 0, 'uss': 0, 'threads': 0,
+            'fds': 0, 'connections': 0, 'read_bytes': 0, 'write_bytes': 0, 'processes': 0}
+
+
+class SamplerBackend:
+    """Общая часть источников замеров: дерево процессов и дорогие сборщики.
+
+    Замер скрипта - сумма по его процессу и всем потомкам. Дешёвые
+    показатели снимаются каждый тик (sample_pid), дорогие - своими
+    сборщиками не чаще SAMPLER_COLLECTOR_INTERVALS, умноженного на
+    slowdown; между запусками берётся кэш. Срок следующего запуска
+    ведётся отдельно для каждого pid, а первый срок выбирается со
+    случайным сдвигом, поэтому дорогая работа размазана по тикам, а не
+    собрана в редкие пики. Состав дерева - такой же сборщик: обход от
+    корня по спискам прямых детей; умершие потомки выбывают сразу при
+    неудачном замере. Наследники реализуют sample_pid, fds, uss,
+    connections, forget и tracked_pids.
+    """
+
+    name = None
+
+    def __init__(self, track_tree=True):
+        self.track_tree = track_tree
+        self.intervals = dict(SAMPLER_COLLECTOR_INTERVALS)
+        # Множитель интервалов сборщиков, его задаёт ResourceSampler
+        self.slowdown = 1.0
+        # Корневой pid скрипта -> множество pid его потомков
+        self.trees = {}
+        self._due = {collector: {} for collector in self.intervals}
+        self._cache = {collector: {} for collector in self.intervals}
+
+    def children_lookup(self):
+        """Функция pid -> прямые дети; по умолчанию один проход psutil по всем процессам"""
+        children = {}
+        for process in psutil.process_iter(['ppid']):
+            children.setdefault(process.info['ppid'], []).append(process.pid)
+        return lambda pid: children.get(pid, ())
+
+    def _descendants(self, root, children_of):
+        found = set()
+        stack = [root]
+        while stack:
+            for child in children_of(stack.pop()):
+                if child != root and child not in found:
+                    found.add(child)
+                    stack.append(child)
+        return found
+
+    def _due_now(self, collector, pid, now):
+        """Пора ли запускать сборщик для pid; заодно назначает следующий срок"""
+        due = self._due[collector].get(pid)
+        if due is not None and now < due:
+            return False
+        interval = self.intervals[collector] * self.slowdown
+        if due is None:
+            interval *= random.uniform(0.5, 1.0)
+        self._due[collector][pid] = now + interval
+        return True
+
+    def _collect(self, collector, pid, now):
+        cache = self._cache[collector]
+        if self._due_now(collector, pid, now):
+            cache[pid] = getattr(self, collector)(pid) or 0
+        return cache.get(pid, 0)
+
+    def _forget_collected(self, pid):
+        for collector in self.intervals:
+            self._due[collector].pop(pid, None)
+            self._cache[collector].pop(pid, None)
+
+    def sample(self, targets):
+        """Замеры {script_uuid: словарь} по отслеживаемым {script_uuid: pid}"""
+        now = time.monotonic()
+        roots = set(targets.values())
+        for root in list(self.trees):
+            if root not in roots:
+                del self.trees[root]
+        if self.track_tree:
+            stale = [root for root in roots if self._due_now('tree', root, now)]
+            if stale:
+                children_of = self.children_lookup()
+                for root in stale:
+                    self.trees[root] = self._descendants(root, children_of)
+
+        scripts = {}
+        sampled = set()
+        for script_uuid, root in targets.items():
+            sample = self.sample_pid(root, now)
+            if sample is None:
+                self.trees.pop(root, None)
+                scripts[script_uuid] = dead_sample()
+                continue
+            total = dict(sample, processes=1)
+            for field in TREE_COLLECTED_FIELDS:
+                total[field] = self._collect(field, root, now)
+            sampled.add(root)
+            tree = self.trees.get(root, set())
+            for pid in list(tree):
+                sample = self.sample_pid(pid, now)
+                if sample is None:
+                    tree.discard(pid)
+                    continue
+                sampled.add(pid)
+                for field in TREE_SUM_FIELDS:
+                    total[field] += sample[field]
+                for field in TREE_COLLECTED_FIELDS:
+                    total[field] += self._collect(field, pid, now)
+                total['processes'] += 1
+            scripts[script_uuid] = total
+
+        # Забываем процессы, которые больше не отслеживаются
+        for pid in self.tracked_pids() - sampled:
+            self.forget(pid)
+        for pid in set(self._due['fds']) - sampled:
+            self._forget_collected(pid)
+        for pid in set(self._due['tree']) - roots:
+            self._due['tree'].pop(pid, None)
+        return scripts
+
+
+class PsutilSamplerBackend(SamplerBackend):
+    """Замеры процессов через psutil - работает на всех платформах.
+
+    Объекты psutil.Process кэшируются между тиками, поэтому cpu_percent
+    считается как дельта от предыдущего замера без ожидания.
+    """
+
+    name = "psutil"
+
+    def __init__(self, track_tree=True):
+        super().__init__(track_tree)
+        self._processes = {}
+        self._total_memory = psutil.virtual_memory().total
+
+    def tracked_pids(self):
+        return set(self._processes)
+
+    def forget(self, pid):
+        self._processes.pop(pid, None)
+
+    def sample_pid(self, pid, now):
+        """Замер одного процесса или None, если его больше нет"""
+        process = self._processes.get(pid)
+        try:
+            if process is None:
+                process = psutil.Process(pid)
+                process.cpu_percent(interval=None)
+                self._processes[pid] = process
+            with process.oneshot():
+                rss = process.memory_info().rss
+                sample = {
+                    'alive': True,
+                    'cpu': process.cpu_percent(interval=None),
+                    'memory': rss * 100.0 / self._total_memory,
+                    'rss': rss,
+                    'threads': process.num_threads()
+                }
+                sample.update(self._io_bytes(process))
+                return sample
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            self._processes.pop(pid, None)
+            return None
+
+    def uss(self, pid):
+        process = self._processes.get(pid)
+        try:
+            return process.memory_full_info().uss if process else None
+        except (psutil.Error, AttributeError):
+            return None
+
+    def fds(self, pid):
+        # На Windows вместо дескрипторов файлов считаются дескрипторы ядра
+        process = self._processes.get(pid)
+        try:
+            if process is None:
+                return None
+            if hasattr(process, 'num_fds'):
+                return process.num_fds()
+            return process.num_handles()
+        except psutil.Error:
+            return None
+
+    def connections(self, pid):
+        process = self._processes.get(pid)
+        try:
+            if process is None:
+                return None
+            if hasattr(process, 'net_connections'):
+                return len(process.net_connections(kind='all'))
+            return len(process.connections(kind='all'))
+        except psutil.Error:
+            return None
+
+    @staticmethod
+    def _io_bytes(process):
+        # io_counters нет на macOS и может быть закрыт правами доступа
+        try:
+            counters = process.io_counters()
+        except (AttributeError, psutil.AccessDenied):
+            return {'read_bytes': 0, 'write_bytes': 0}
+        return {'read_bytes': counters.read_bytes, 'write_bytes': counters.write_bytes}
+
+    def close(self):
+        self._processes.clear()
+
+
+class ProcfsSamplerBackend(SamplerBackend):
+    """Замеры процессов чтением /proc напрямую (только Linux).
+
+    Для каждого pid один раз открываются /proc/<pid>/stat, statm и io,
+    дальше каждый тик - только os.pread из уже открытых дескрипторов без
+    создания объектов на процесс. Предыдущие значения времени CPU хранятся
+    в заранее выделенных array, которые растут удвоением; ячейка
+    закрепляется за pid. Время старта из stat защищает от повторного
+    использования pid: при его смене файлы открываются заново.
+
+    Держать открытыми три файла на процесс можно, пока хватает лимита
+    дескрипторов; процессы сверх этого читаются открытием файла на тик.
+    Дети процесса берутся из /proc/<pid>/task/<tid>/children.
+    """
+
+    name = "procfs"
+
+    def __init__(self, track_tree=True, capacity=64):
+        super().__init__(track_tree)
+        self._clock_ticks = os.sysconf('SC_CLK_TCK')
+        self._page_size = os.sysconf('SC_PAGE_SIZE')
+        self._total_memory = self._page_size * os.sysconf('SC_PHYS_PAGES')
+        soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0] if HAS_RESOURCE else 1024
+        if soft_limit == resource.RLIM_INFINITY:
+            soft_limit = 65536
+        # Запас дескрипторов оставляем каналам скриптов и журналам
+        self._max_opened = max(0, soft_limit // 2 - 256) // 3
+        # pid -> [ячейка, время старта, fd stat, fd statm, fd io]; fd None - читать
+        # открытием файла, fd io -1 - файл недоступен
+        self._opened = {}
+        self._opened_files = 0
+        self._free_slots = list(range(capacity - 1, -1, -1))
+        self._previous_ticks = array('d', [0.0]) * capacity
+        self._previous_time = array('d', [0.0]) * capacity
+
+    @staticmethod
+    def available():
+        return sys.platform.startswith("linux") and os.path.exists("/proc/self/stat")
+
+    def _grow(self):
+        capacity = len(self._previous_ticks)
+        self._previous_ticks.extend(array('d', [0.0]) * capacity)
+        self._previous_time.extend(array('d', [0.0]) * capacity)
+        self._free_slots.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def _open(self, pid):
+        if not self._free_slots:
+            self._grow()
+        if self._opened_files >= self._max_opened:
+            return [self._free_slots.pop(), None, None, None, None]
+        stat_fd = os.open(f"/proc/{pid}/stat", os.O_RDONLY)
+        try:
+            statm_fd = os.open(f"/proc/{pid}/statm", os.O_RDONLY)
+        except OSError:
+            os.close(stat_fd)
+            raise
+        try:
+            io_fd = os.open(f"/proc/{pid}/io", os.O_RDONLY)
+        except PermissionError:
+            # Файл io бывает закрыт правами доступа - тогда без ввода-вывода
+            io_fd = -1
+        self._opened_files += 1
+        return [self._free_slots.pop(), None, stat_fd, statm_fd, io_fd]
+
+    def _close(self, pid):
+        entry = self._opened.pop(pid, None)
+        if entry is None:
+            return
+        self._free_slots.append(entry[0])
+        if entry[2] is not None:
+            self._opened_files -= 1
+        for fd in entry[2:]:
+            if fd is not None and fd >= 0:
+                os.close(fd)
+
+    @staticmethod
+    def _read(fd, pid, name):
+        if fd is not None:
+            return os.pread(fd, PROCFS_READ_SIZE, 0)
+        with open(f"/proc/{pid}/{name}", 'rb') as f:
+            return f.read(PROCFS_READ_SIZE)
+
+    def tracked_pids(self):
+        return set(self._opened)
+
+    def forget(self, pid):
+        self._close(pid)
+
+    def children_lookup(self):
+        if not os.path.exists(f"/proc/self/task/{os.getpid()}/children"):
+            # Ядро без CONFIG_PROC_CHILDREN - общий проход по всем процессам
+            return super().children_lookup()
+        return self._children
+
+    @staticmethod
+    def _children(pid):
+        children = []
+        try:
+            for tid in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{tid}/children", 'rb') as f:
+                    children.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+        return children
+
+    @staticmethod
+    def fds(pid):
+        try:
+            return len(os.listdir(f"/proc/{pid}/fd"))
+        except OSError:
+            return None
+
+    @staticmethod
+    def connections(pid):
+        """Число сокетов среди открытых дескрипторов"""
+        sockets = 0
+        try:
+            with os.scandir(f"/proc/{pid}/fd") as entries:
+                for entry in entries:
+                    try:
+                        if os.readlink(entry.path).startswith("socket:"):
+                            sockets += 1
+                    except OSError:
+                        pass
+        except OSError:
+            return None
+        return sockets
+
+    def uss(self, pid):
+        """Сумма Private_* из smaps_rollup в байтах или None"""
+        try:
+            with open(f"/proc/{pid}/smaps_rollup", 'rb') as f:
+                text = f.read()
+        except OSError:
+            return None
+        total = 0
+        for line in text.splitlines():
+            if line.startswith(b'Private_'):
+                total += int(line.split()[1]) * 1024
+        return total
+
+    def sample_pid(self, pid, now):
+        """Замер одного процесса или None, если его больше нет"""
+        try:
+            sample = self._read_pid(pid, now)
+        except (OSError, ValueError, IndexError):
+            sample = None
+        if sample is None:
+            self._close(pid)
+        return sample
+
+    def _read_pid(self, pid, now):
+        entry = self._opened.get(pid)
+        if entry is None:
+            entry = self._opened[pid] = self._open(pid)
+        slot, start_time, stat_fd, statm_fd, io_fd = entry
+
+        # Имя процесса в stat может содержать пробелы и скобки
+        fields = self._read(stat_fd, pid, "stat").rpartition(b')')[2].split()
+        if not fields or fields[0] in (b'Z', b'X'):
+            return None
+        if start_time is None:
+            entry[1] = fields[19]
+        elif fields[19] != start_time:
+            # pid занят другим процессом - начинаем заново
+            self._close(pid)
+            return self._read_pid(pid, now)
+        ticks = float(int(fields[11]) + int(fields[12]))
+        rss = int(self._read(statm_fd, pid, "statm").split()[1]) * self._page_size
+
+        cpu = 0.0
+        if start_time is not None:
+            elapsed = now - self._previous_time[slot]
+            if elapsed > 0:
+                cpu = (ticks - self._previous_ticks[slot]) / self._clock_ticks / elapsed * 100.0
+        self._previous_ticks[slot] = ticks
+        self._previous_time[slot] = now
+
+        read_bytes = write_bytes = 0
+        try:
+            io_text = self._read(io_fd, pid, "io") if io_fd != -1 else b''
+        except PermissionError:
+            io_text = b''
+        if io_text:
+            for line in io_text.splitlines():
+                if line.startswith(b'read_bytes:'):
+                    read_bytes = int(line[11:])
+                elif line.startswith(b'write_bytes:'):
+                    write_bytes = int(line[12:])
+        return {
+            'alive': True,
+            'cpu': cpu,
+            'memory': rss * 100.0 / self._total_memory,
+            'rss': rss,
+            'threads': int(fields[17]),
+            'read_bytes': read_bytes,
+            'write_bytes': write_bytes
+        }
+
+    def close(self):
+        for pid in list(self._opened):
+            self._close(pid)
+
+
+def create_sampler_backend(kind="auto", track_tree=True):
+    """Источник замеров процессов по настройке sampler_backend"""
+    if kind == "procfs" or (kind == "auto" and ProcfsSamplerBackend.available()):
+        if ProcfsSamplerBackend.available():
+            return ProcfsSamplerBackend(track_tree)
+        print("Чтение /proc недоступно, замеры идут через psutil")
+    return PsutilSamplerBackend(track_tree)
+
+
+class ResourceSampler(threading.Thread):
+    """Фоновый сборщик нагрузки системы и запущенных скриптов.
+
+    Работает в отдельном потоке, чтобы опрос процессов не блокировал Tk.
+    Замеры процессов делает подключаемый источник: ProcfsSamplerBackend
+    на Linux или PsutilSamplerBackend на остальных платформах. Каждый тик
+    публикуется один снимок в потокобезопасную очередь snapshots.
+
+    Опрос адаптивный: если CPU всего менеджера за тик выше cpu_budget,
+    период тиков и дорогих сборщиков растёт в MONITOR_SLOWDOWN_STEP раз
+    (до MONITOR_MAX_SLOWDOWN), а ниже половины бюджета - возвращается.
+    В фоне (окно в трее) период дополнительно умножается на
+    MONITOR_BACKGROUND_FACTOR.
+    """
+
+    def __init__(self, interval=MONITOR_INTERVAL, backend=None, cpu_budget=MONITOR_CPU_BUDGET):
+        super().__init__(name="ResourceSampler", daemon=True)
+        self.interval = interval
+        self.cpu_budget = cpu_budget
+        self.background = False
+        self.slowdown = 1.0
+        # CPU менеджера (% одного ядра) за последний тик
+        self.manager_cpu = 0.0
+        self.backend = backend or create_sampler_backend()
+        self.snapshots = queue.Queue(maxsize=2)
+        # Последний снимок для потребителей, которым не нужна очередь
+        self.last_snapshot = None
+        # Вызываются из потока сборщика с каждым новым снимком
+        self.listeners = []
+        self._targets = {}
+        self._targets_lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    def set_targets(self, targets):
+        """Задаёт отслеживаемые процессы: {script_uuid: pid}"""
+        with self._targets_lock:
+            self._targets = dict(targets)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def set_background(self, enabled):
+        self.background = enabled
+        self._apply_slowdown()
+
+    @property
+    def current_interval(self):
+        factor = MONITOR_BACKGROUND_FACTOR if self.background else 1.0
+        return self.interval * self.slowdown * factor
+
+    def _apply_slowdown(self):
+        self.backend.slowdown = self.current_interval / self.interval
+
+    def _adapt(self, cpu_time, elapsed):
+        """Подстраивает замедление под бюджет CPU менеджера"""
+        if elapsed <= 0:
+            return
+        self.manager_cpu = cpu_time * 100.0 / elapsed
+        if self.manager_cpu > self.cpu_budget:
+            self.slowdown = min(MONITOR_MAX_SLOWDOWN, self.slowdown * MONITOR_SLOWDOWN_STEP)
+        elif self.manager_cpu < self.cpu_budget / 2:
+            self.slowdown = max(1.0, self.slowdown / MONITOR_SLOWDOWN_STEP)
+        self._apply_slowdown()
+
+    def run(self):
+        # Первый вызов cpu_percent(None) только запоминает точку отсчёта
+        psutil.cpu_percent(interval=None)
+        psutil.cpu_percent(interval=None, percpu=True)
+        last_cpu, last_wall = time.process_time(), time.monotonic()
+        while not self._stop_event.wait(self.current_interval):
+            try:
+                self.publish(self.sample())
+            except Exception as e:
+                print(f"Ошибка мониторинга: {e}")
+            cpu, wall = time.process_time(), time.monotonic()
+            self._adapt(cpu - last_cpu, wall - last_wall)
+            last_cpu, last_wall = cpu, wall
+        self.backend.close()
+
+    def sample(self):
+        """Снимает один замер по системе и всем отслеживаемым процессам"""
+        with self._targets_lock:
+            targets = dict(self._targets)
+
+        return {
+            'time': time.time(),
+            'system': {
+                'cpu': psutil.cpu_percent(interval=None),
+                'memory': psutil.virtual_memory().percent,
+                'per_cpu': psutil.cpu_percent(interval=None, percpu=True)
+            },
+            'scripts': self.backend.sample(targets),
+            'sampler': {
+                'interval': self.current_interval,
+                'slowdown': self.slowdown,
+                'background': self.background,
+                'manager_cpu': self.manager_cpu
+            }
+        }
+
+    def publish(self, snapshot):
+        """Кладёт снимок в очередь, вытесняя самый старый при переполнении"""
+        self.last_snapshot = snapshot
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"Ошибка обработчика снимка ресурсов: {e}")
+        while True:
+            try:
+                self.snapshots.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try:
+                    self.snapshots.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def latest(self):
+        """Забирает все накопленные снимки и возвращает последний (или None)"""
+        snapshot = None
+        while True:
+            try:
+                snapshot = self.snapshots.get_nowait()
+            except queue.Empty:
+                return snapshot
+
+
+# Поля истории метрик: CPU (%), RSS (байты), потоки, открытые дескрипторы,
+# скорость чтения и записи (байт/с)
+METRICS_FIELDS = ("cpu", "rss", "threads", "fds", "io_read", "io_write")
+# Поля, которые при огрублении берутся по максимуму, остальные усредняются
+METRICS_PEAK_FIELDS = ("rss", "threads", "fds")
+# Ярусы истории: (имя, шаг в секундах, число точек) - час по секунде,
+# сутки по минуте и месяц по часу
+METRICS_TIERS = (("1s", 1, 60 * 60), ("1m", 60, 24 * 60), ("1h", 60 * 60, 30 * 24))
+METRICS_DIR = os.path.join(BASE_PATH, "metrics")
+# Период сохранения истории на диск (секунды)
+METRICS_SAVE_INTERVAL = 60.0
+METRICS_FILE_MAGIC = b"PSMH"
+METRICS_FILE_VERSION = 1
+
+
+class MetricsTier:
+    """Кольцевой буфер одного яруса истории фиксированного размера.
+
+    Ячейка выбирается по номеру интервала (время // шаг) по модулю
+    ёмкости, поэтому пропуски в замерах не сдвигают остальные точки,
+    а устаревшие ячейки отбрасываются при чтении по номеру интервала.
+    Значения хранятся в array('f'), номера интервалов - в array('q').
+    """
+
+    __slots__ = ('name', 'step', 'capacity', 'buckets', 'values', '_bucket', '_count', '_acc')
+
+    def __init__(self, name, step, capacity):
+        self.name = name
+        self.step = step
+        self.capacity = capacity
+        self.buckets = array('q', [-1]) * capacity
+        self.values = array('f', [0.0]) * (capacity * len(METRICS_FIELDS))
+        self._bucket = -1
+        self._count = 0
+        self._acc = [0.0] * len(METRICS_FIELDS)
+
+    def add(self, timestamp, sample):
+        """Добавляет замер в текущий интервал и обновляет его ячейку"""
+        width = len(METRICS_FIELDS)
+        bucket = int(timestamp // self.step)
+        slot = bucket % self.capacity
+        base = slot * width
+        if bucket != self._bucket:
+            self._bucket = bucket
+            if self.buckets[slot] == bucket:
+                # Интервал уже частично заполнен до перезагрузки истории
+                self._count = 1
+                self._acc = list(self.values[base:base + width])
+            else:
+                self._count = 0
+                self._acc = [0.0] * width
+        self._count += 1
+        for index, field in enumerate(METRICS_FIELDS):
+            if field in METRICS_PEAK_FIELDS:
+                self._acc[index] = max(self._acc[index], sample[index])
+            else:
+                self._acc[index] += sample[index]
+        self.buckets[slot] = bucket
+        for index, field in enumerate(METRICS_FIELDS):
+            value = self._acc[index]
+            self.values[base + index] = value if field in METRICS_PEAK_FIELDS else value / self._count
+
+    def points(self, since=None):
+        """Точки яруса по возрастанию времени: [[время, значения полей...], ...]"""
+        newest = max(self.buckets)
+        if newest < 0:
+            return []
+        oldest = newest - self.capacity + 1
+        if since is not None:
+            oldest = max(oldest, int(since // self.step))
+        width = len(METRICS_FIELDS)
+        result = []
+        for slot, bucket in enumerate(self.buckets):
+            if bucket >= oldest:
+                base = slot * width
+                result.append([bucket * self.step] + list(self.values[base:base + width]))
+        result.sort()
+        return result
+
+
+class MetricsSeries:
+    """История одного скрипта: по буферу на каждый ярус"""
+
+    def __init__(self):
+        self.tiers = [MetricsTier(name, step, capacity) for name, step, capacity in METRICS_TIERS]
+
+    def add(self, timestamp, sample):
+        for tier in self.tiers:
+            tier.add(timestamp, sample)
+
+    def tier(self, name):
+        for tier in self.tiers:
+            if tier.name == name:
+                return tier
+        raise KeyError(f"Неизвестный ярус истории: {name}")
+
+    def to_bytes(self):
+        header = struct.pack('<4sHHH', METRICS_FILE_MAGIC, METRICS_FILE_VERSION,
+                             len(METRICS_FIELDS), len(self.tiers))
+        parts = [header]
+        for tier in self.tiers:
+            parts.append(struct.pack('<II', tier.step, tier.capacity))
+            parts.append(tier.buckets.tobytes())
+            parts.append(tier.values.tobytes())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Восстанавливает историю; при несовпадении формата бросает ValueError"""
+        series = cls()
+        magic, version, field_count, tier_count = struct.unpack_from('<4sHHH', data)
+        if (magic != METRICS_FILE_MAGIC or version != METRICS_FILE_VERSION
+                or field_count != len(METRICS_FIELDS) or tier_count != len(series.tiers)):
+            raise ValueError("формат файла истории не совпадает")
+        offset = struct.calcsize('<4sHHH')
+        for tier in series.tiers:
+            step, capacity = struct.unpack_from('<II', data, offset)
+            if (step, capacity) != (tier.step, tier.capacity):
+                raise ValueError("ярусы файла истории не совпадают")
+            offset += struct.calcsize('<II')
+            size = len(tier.buckets) * tier.buckets.itemsize
+            tier.buckets = array('q', data[offset:offset + size])
+            offset += size
+            size = len(tier.values) * tier.values.itemsize
+            tier.values = array('f', data[offset:offset + size])
+            offset += size
+        return series
+
+
+class MetricsHistory:
+    """История метрик скриптов с огрублением по ярусам.
+
+    Подписывается на снимки ResourceSampler. Память на скрипт постоянна
+    и не зависит от времени работы. Каждый скрипт хранится в своём
+    двоичном файле <uuid>.bin, который перезаписывается атомарно.
+    Скорость ввода-вывода считается по разнице накопительных счётчиков.
+    """
+
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.series = {}
+        self._io_last = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def _path(self, script_uuid):
+        return os.path.join(self.directory, f"{script_uuid}.bin")
+
+    def _series(self, script_uuid):
+        series = self.series.get(script_uuid)
+        if series is None:
+            series = MetricsSeries()
+            try:
+                with open(self._path(script_uuid), 'rb') as f:
+                    series = MetricsSeries.from_bytes(f.read())
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, struct.error) as e:
+                print(f"Не удалось загрузить историю метрик {script_uuid}: {e}")
+            self.series[script_uuid] = series
+        return series
+
+    def _io_rates(self, script_uuid, timestamp, sample):
+        read_bytes = sample.get('read_bytes', 0)
+        write_bytes = sample.get('write_bytes', 0)
+        previous = self._io_last.get(script_uuid)
+        self._io_last[script_uuid] = (timestamp, read_bytes, write_bytes)
+        if previous is None or timestamp <= previous[0]:
+            return 0.0, 0.0
+        elapsed = timestamp - previous[0]
+        # После перезапуска процесса счётчики начинаются заново
+        return (max(0, read_bytes - previous[1]) / elapsed,
+                max(0, write_bytes - previous[2]) / elapsed)
+
+    def record(self, snapshot):
+        """Слушатель ResourceSampler: добавляет замеры живых скриптов"""
+        timestamp = snapshot['time']
+        with self._lock:
+            for script_uuid, sample in snapshot.get('scripts', {}).items():
+                if not sample.get('alive'):
+                    self._io_last.pop(script_uuid, None)
+                    continue
+                io_read, io_write = self._io_rates(script_uuid, timestamp, sample)
+                self._series(script_uuid).add(timestamp, (
+                    sample.get('cpu', 0.0), sample.get('rss', 0), sample.get('threads', 0),
+                    sample.get('fds', 0), io_read, io_write
+                ))
+                self._dirty.add(script_uuid)
+
+    def query(self, script_uuid, tier="1s", since=None):
+        with self._lock:
+            series = self._series(script_uuid)
+            tier = series.tier(tier)
+            return {'fields': list(METRICS_FIELDS), 'step': tier.step, 'points': tier.points(since)}
+
+    def save(self):
+        """Записывает изменившиеся истории на диск"""
+        with self._lock:
+            pending = {script_uuid: self.series[script_uuid].to_bytes()
+                       for script_uuid in self._dirty if script_uuid in self.series}
+            self._dirty.clear()
+        if not pending:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for script_uuid, data in pending.items():
+            path = self._path(script_uuid)
+            try:
+                with open(path + ".tmp", 'wb') as f:
+                    f.write(data)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                print(f"Не удалось сохранить историю метрик {script_uuid}: {e}")
+
+    def unload(self, script_uuid):
+        """Сохраняет и выгружает историю скрипта из памяти"""
+        self.save()
+        with self._lock:
+            self.series.pop(script_uuid, None)
+            self._io_last.pop(script_uuid, None)
+
+
+# Размер порции, читаемой из канала за один раз
+OUTPUT_CHUNK_SIZE = 65536
+# Как часто проверять завершение процессов, чьи каналы ещё открыты (секунды)
+OUTPUT_EXIT_POLL_INTERVAL = 0.5
+# Сколько порций дочитывать из каналов завершившегося процесса
+OUTPUT_DRAIN_CHUNKS = 16
+
+
+class OutputPump:
+    """Единый поток, читающий stdout и stderr всех запущенных скриптов.
+
+    На POSIX все каналы переводятся в неблокирующий режим и обслуживаются
+    одним циклом selectors, поэтому число потоков не растёт вместе с числом
+    скриптов. Конец вывода определяется по пустому чтению (b''), после чего
+    канал снимается с учёта и больше не нагружает CPU. Завершение процесса
+    проверяется отдельно от EOF: каналы могут держать открытыми его потомки,
+    поэтому после выхода процесса они дочитываются и закрываются.
+
+    На Windows selectors не работает с каналами, поэтому там используется
+    по одному потоку чтения на канал и поток ожидания процесса.
+    """
+
+    def __init__(self):
+        self._use_selector = sys.platform != "win32"
+        self._lock = threading.Lock()
+        self._pending = []
+        self._entries = []
+        self._thread = None
+        if self._use_selector:
+            self._selector = selectors.DefaultSelector()
+            self._wakeup_r, self._wakeup_w = os.pipe()
+            os.set_blocking(self._wakeup_r, False)
+            os.set_blocking(self._wakeup_w, False)
+            self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+
+    def register(self, process, on_output, on_exit):
+        """Передаёт процесс на обслуживание.
+
+        on_output(text) вызывается для каждой прочитанной порции вывода,
+        on_exit(returncode) - один раз после завершения процесса и
+        дочитывания его вывода. Оба колбэка вызываются из потока насоса.
+        """
+        entry = {
+            'process': process,
+            'on_output': on_output,
+            'on_exit': on_exit,
+            # Открытые каналы: {fd: (поток, декодер)}
+            'streams': {}
+        }
+        if not self._use_selector:
+            readers = [threading.Thread(target=self._read_blocking, args=(entry, stream), daemon=True)
+                       for stream in (process.stdout, process.stderr)]
+            for reader in readers:
+                reader.start()
+            threading.Thread(target=self._wait_blocking, args=(entry, readers), daemon=True).start()
+            return
+
+        with self._lock:
+            self._pending.append(entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="OutputPump", daemon=True)
+                self._thread.start()
+        self._wakeup()
+
+    def _wakeup(self):
+        try:
+            os.write(self._wakeup_w, b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run(self):
+        while True:
+            timeout = OUTPUT_EXIT_POLL_INTERVAL if self._entries else None
+            for key, _ in self._selector.select(timeout):
+                if key.data is None:
+                    self._drain_wakeup()
+                else:
+                    self._read_ready(key)
+            self._register_pending()
+            self._reap_exited()
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _register_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for entry in pending:
+            for stream in (entry['process'].stdout, entry['process'].stderr):
+                decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+                fd = stream.fileno()
+                os.set_blocking(fd, False)
+                self._selector.register(fd, selectors.EVENT_READ, entry)
+                entry['streams'][fd] = (stream, decoder)
+            self._entries.append(entry)
+
+    def _read_ready(self, key):
+        entry = key.data
+        stream, decoder = entry['streams'][key.fd]
+        try:
+            data = os.read(key.fd, OUTPUT_CHUNK_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+
+        if data:
+            self._emit(entry, decoder.decode(data))
+        else:
+            # EOF: канал закрыт дочерним процессом
+            self._close_stream(entry, key.fd)
+
+    def _close_stream(self, entry, fd):
+        stream, decoder = entry['streams'].pop(fd)
+        self._emit(entry, decoder.decode(b'', final=True))
+        self._selector.unregister(fd)
+        try:
+            stream.close()
+        except OSError:
+            pass
+
+    def _reap_exited(self):
+        """Завершает учёт вышедших процессов, даже если их каналы унаследовали потомки"""
+        still_running = []
+        for entry in self._entries:
+            returncode = entry['process'].poll()
+            if returncode is None:
+                still_running.append(entry)
+                continue
+            for fd in list(entry['streams']):
+                # Дочитываем то, что процесс успел записать перед выходом
+                for _ in range(OUTPUT_DRAIN_CHUNKS):
+                    try:
+                        data = os.read(fd, OUTPUT_CHUNK_SIZE)
+                    except OSError:
+                        break
+                    if not data:
+                        break
+                    self._emit(entry, entry['streams'][fd][1].decode(data))
+                self._close_stream(entry, fd)
+            self._finish(entry, returncode)
+        self._entries = still_running
+
+    def _read_blocking(self, entry, stream):
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        try:
+            for data in iter(lambda: stream.read1(OUTPUT_CHUNK_SIZE), b''):
+                self._emit(entry, decoder.decode(data))
+        except (OSError, ValueError) as e:
+            print(f"Ошибка чтения вывода: {e}")
+        self._emit(entry, decoder.decode(b'', final=True))
+
+    def _wait_blocking(self, entry, readers):
+        """Сообщает о выходе процесса, не дожидаясь закрытия каналов его потомками"""
+        returncode = entry['process'].wait()
+        for reader in readers:
+            reader.join(OUTPUT_EXIT_POLL_INTERVAL)
+        self._finish(entry, returncode)
+
+    def _emit(self, entry, text):
+        if not text:
+            return
+        try:
+            entry['on_output'](text)
+        except Exception as e:
+            print(f"Ошибка обработки вывода: {e}")
+
+    def _finish(self, entry, returncode):
+        try:
+            entry['on_exit'](returncode)
+        except Exception as e:
+            print(f"Ошибка обработки завершения: {e}")
+
+
+# Лимиты истории вывода одного скрипта в памяти менеджера
+SCROLLBACK_MAX_LINES = 10000
+SCROLLBACK_MAX_BYTES = 4 * 1024 * 1024
+# Сколько последних строк показывать при открытии консоли
+CONSOLE_HISTORY_LINES = 2000
+
+
+class OutputScrollback:
+    """Ограниченная история вывода скрипта.
+
+    Хранит вывод кольцом порций в deque: добавление и вытеснение старых
+    порций выполняются за O(1), строка целиком никогда не копируется.
+    Лимит задаётся числом строк и/или размером в байтах (0 - без лимита).
+    Добавление идёт из потока насоса вывода, чтение - из Tk, поэтому
+    все операции защищены блокировкой.
+    """
+
+    def __init__(self, max_lines=SCROLLBACK_MAX_LINES, max_bytes=SCROLLBACK_MAX_BYTES):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self._chunks = deque()
+        self._lines = 0
+        self._bytes = 0
+        # Сколько символов добавлено за всё время; служит курсором для read_since
+        self.position = 0
+        self._lock = threading.Lock()
+
+    def append(self, text):
+        if not text:
+            return
+        nbytes = len(text.encode('utf-8', errors='replace'))
+        nlines = text.count('\n')
+        with self._lock:
+            self._chunks.append((text, nbytes, nlines))
+            self.position += len(text)
+            self._lines += nlines
+            self._bytes += nbytes
+            self._evict()
+
+    def read_since(self, position):
+        """Вывод, добавленный после курсора position: (текст, новый курсор).
+
+        Если часть вывода уже вытеснена, возвращается всё, что осталось.
+        """
+        with self._lock:
+            end = self.position
+            if position >= end:
+                return '', end
+            result = []
+            start = end
+            for text, _, _ in reversed(self._chunks):
+                start -= len(text)
+                if start <= position:
+                    result.append(text[position - start:])
+                    break
+                result.append(text)
+        result.reverse()
+        return ''.join(result), end
+
+    def _over_limit(self):
+        return ((self.max_lines and self._lines > self.max_lines) or
+                (self.max_bytes and self._bytes > self.max_bytes))
+
+    def _evict(self):
+        while len(self._chunks) > 1 and self._over_limit():
+            _, nbytes, nlines = self._chunks.popleft()
+            self._lines -= nlines
+            self._bytes -= nbytes
+
+        if self._over_limit():
+            # Единственная порция сама превышает лимит - обрезаем её начало
+            text, _, _ = self._chunks.popleft()
+            if self.max_bytes:
+                # Обрезаем по байтам; разрезанный многобайтовый символ отбрасывается
+                data = text.encode('utf-8', errors='replace')
+                if len(data) > self.max_bytes:
+                    text = data[-self.max_bytes:].decode('utf-8', errors='ignore')
+            if self.max_lines:
+                text = '\n'.join(text.split('\n')[-(self.max_lines + 1):])
+            self._chunks.append((text, len(text.encode('utf-8', errors='replace')), text.count('\n')))
+            self._lines = self._chunks[0][2]
+            self._bytes = self._chunks[0][1]
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self._lines = 0
+            self._bytes = 0
+
+    def __len__(self):
+        return self._lines
+
+    def tail_chunks(self, line_count=CONSOLE_HISTORY_LINES):
+        """Возвращает порции, покрывающие последние line_count строк.
+
+        Первая порция обрезается по границе строки, остальные отдаются
+        как есть, поэтому их можно вставлять в виджет по очереди.
+        """
+        with self._lock:
+            result = []
+            lines = 0
+            for text, _, nlines in reversed(self._chunks):
+                result.append(text)
+                lines += nlines
+                if lines > line_count:
+                    break
+
+        result.reverse()
+        if lines > line_count and result:
+            # Отбрасываем лишние строки в самой старой порции
+            skip = lines - line_count
+            head = result[0]
+            pos = 0
+            for _ in range(skip):
+                pos = head.index('\n', pos) + 1
+            result[0] = head[pos:]
+        return result
+
+    def tail(self, line_count=CONSOLE_HISTORY_LINES):
+        """Последние line_count строк одной строкой"""
+        return ''.join(self.tail_chunks(line_count))
+
+
+# Журналы вывода скриптов на диске
+LOGS_DIR = os.path.join(BASE_PATH, "logs")
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_ROTATE_INTERVAL = 24 * 60 * 60
+LOG_BUFFER_SIZE = 64 * 1024
+LOG_FLUSH_INTERVAL = 1.0
+
+
+class RotatingScriptLog:
+    """Журнал вывода одного скрипта с ротацией по размеру и времени.
+
+    Файл открывается только на дописывание с буферизацией. При превышении
+    max_bytes или по истечении rotate_interval секунд текущий файл
+    переименовывается в <имя>.1, старые сегменты сдвигаются, а самые
+    старые сверх backup_count удаляются. Повёрнутые сегменты при
+    необходимости сжимаются gzip в фоновом потоке.
+    """
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 rotate_interval=LOG_ROTATE_INTERVAL, compress=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_interval = rotate_interval
+        self.compress = compress
+        self._lock = threading.Lock()
+        # Занят, пока идёт сжатие предыдущего сегмента; сдвиг сегментов ждёт его
+        self._compress_lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._opened_at = 0
+        self._dirty = False
+        self._open()
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'ab', buffering=LOG_BUFFER_SIZE)
+        self._size = self._file.tell()
+        self._opened_at = time.time()
+
+    def write(self, text):
+        data = text.encode('utf-8', errors='replace')
+        with self._lock:
+            if self._file is None:
+                return
+            if self._should_rotate(len(data)):
+                self._rotate()
+            self._file.write(data)
+            self._size += len(data)
+            self._dirty = True
+
+    def _should_rotate(self, incoming):
+        if self._size == 0:
+            return False
+        if self.max_bytes and self._size + incoming > self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.time() - self._opened_at >= self.rotate_interval
+
+    def segment_path(self, index):
+        """Путь к повёрнутому сегменту с номером index (сжатому или нет)"""
+        plain = f"{self.path}.{index}"
+        return plain + ".gz" if os.path.exists(plain + ".gz") else plain
+
+    def segments(self):
+        """Все существующие файлы журнала от самого старого к текущему"""
+        result = []
+        for index in range(self.backup_count, 0, -1):
+            path = self.segment_path(index)
+            if os.path.exists(path):
+                result.append(path)
+        if os.path.exists(self.path):
+            result.append(self.path)
+        return result
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+
+        self._compress_lock.acquire()
+        compressing = False
+        try:
+            if self.backup_count > 0:
+                oldest = self.segment_path(self.backup_count)
+                if os.path.exists(oldest):
+                    os.remove(oldest)
+                for index in range(self.backup_count - 1, 0, -1):
+                    source = self.segment_path(index)
+                    if os.path.exists(source):
+                        suffix = ".gz" if source.endswith(".gz") else ""
+                        os.replace(source, f"{self.path}.{index + 1}{suffix}")
+                rotated = f"{self.path}.1"
+                os.replace(self.path, rotated)
+                if self.compress:
+                    # Блокировку освободит поток сжатия
+                    threading.Thread(target=self._compress, args=(rotated,), daemon=True).start()
+                    compressing = True
+            else:
+                os.remove(self.path)
+        except OSError as e:
+            # Например, файл открыт в просмотрщике на Windows - пишем дальше в текущий
+            print(f"Ошибка ротации журнала: {e}")
+        finally:
+            if not compressing:
+                self._compress_lock.release()
+
+        self._open()
+
+    def _compress(self, path):
+        try:
+            with open(path, 'rb') as source, gzip.open(path + ".gz.tmp", 'wb') as target:
+                shutil.copyfileobj(source, target, LOG_BUFFER_SIZE)
+            os.replace(path + ".gz.tmp", path + ".gz")
+            os.remove(path)
+        except OSError as e:
+            print(f"Ошибка сжатия журнала: {e}")
+        finally:
+            self._compress_lock.release()
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None and self._dirty:
+                self._file.flush()
+                self._dirty = False
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ScriptLogManager:
+    """Журналы всех запущенных скриптов и их периодический сброс на диск.
+
+    Один фоновый поток раз в LOG_FLUSH_INTERVAL сбрасывает буферы, чтобы
+    вывод редко пишущих скриптов не застревал в памяти.
+    """
+
+    def __init__(self, directory=LOGS_DIR, settings=None):
+        self.directory = directory
+        self.settings = settings if settings is not None else {}
+        self._logs = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def enabled(self):
+        return self.settings.get('script_logs', True)
+
+    def path_for(self, script_uuid):
+        return os.path.join(self.directory, f"{script_uuid}.log")
+
+    def segments(self, script_uuid):
+        """Файлы журнала скрипта от самого старого сегмента к текущему"""
+        path = self.path_for(script_uuid)
+        rotated = []
+        for segment in glob.glob(glob.escape(path) + ".*"):
+            suffix = segment[len(path) + 1:]
+            index = suffix[:-3] if suffix.endswith(".gz") else suffix
+            if index.isdigit():
+                rotated.append((int(index), segment))
+        result = [segment for _, segment in sorted(rotated, reverse=True)]
+        if os.path.exists(path):
+            result.append(path)
+        return result
+
+    def open(self, script_uuid):
+        """Возвращает журнал скрипта, открывая его при необходимости"""
+        with self._lock:
+            log = self._logs.get(script_uuid)
+            if log is None:
+                log = RotatingScriptLog(
+                    self.path_for(script_uuid),
+                    max_bytes=self.settings.get('log_max_bytes', LOG_MAX_BYTES),
+                    backup_count=self.settings.get('log_backup_count', LOG_BACKUP_COUNT),
+                    rotate_interval=self.settings.get('log_rotate_interval', LOG_ROTATE_INTERVAL),
+                    compress=self.settings.get('log_compress', True)
+                )
+                self._logs[script_uuid] = log
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="LogFlusher", daemon=True)
+                self._flusher.start()
+            return log
+
+    def close(self, script_uuid):
+        with self._lock:
+            log = self._logs.pop(script_uuid, None)
+        if log:
+            log.close()
+
+    def close_all(self):
+        with self._lock:
+            logs, self._logs = list(self._logs.values()), {}
+        for log in logs:
+            log.close()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(LOG_FLUSH_INTERVAL)
+            with self._lock:
+                logs = list(self._logs.values())
+            for log in logs:
+                try:
+                    log.flush()
+                except (OSError, ValueError) as e:
+                    print(f"Ошибка записи журнала: {e}")
+
+
+# Размер блока разреженного индекса строк журнала
+LOG_INDEX_BLOCK = 64 * 1024
+
+
+class LogLineIndex:
+    """Разреженный индекс строк большого файла журнала поверх mmap.
+
+    Для каждого блока в LOG_INDEX_BLOCK байт хранится число переводов
+    строки до его начала, поэтому память индекса не зависит от числа строк.
+    Переход к строке - бинарный поиск блока и короткий проход внутри него.
+    Индекс строится в фоновом потоке и дорастает при дописывании файла,
+    а навигация по смещениям работает и до его завершения.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = None
+        self._lock = threading.Lock()
+        self.size = 0
+        self.block_lines = array('Q', [0])
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.remap()
+
+    def remap(self):
+        """Перечитывает размер файла; возвращает True, если он изменился"""
+        size = os.fstat(self._file.fileno()).st_size
+        with self._lock:
+            if size == self.size and (self._mm is not None or size == 0):
+                return False
+            if size < self.size:
+                # Файл обрезан - индекс строим заново
+                self.block_lines = array('Q', [0])
+            if self._mm is not None:
+                self._mm.close()
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+            self.size = size
+        return True
+
+    def is_replaced(self):
+        """True, если по пути уже другой файл: журнал повёрнут переименованием"""
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            return False  # новый файл ещё не создан
+        opened = os.fstat(self._file.fileno())
+        return (current.st_ino, current.st_dev) != (opened.st_ino, opened.st_dev)
+
+    def start_indexing(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._build, name="LogLineIndex", daemon=True)
+            self._thread.start()
+
+    def _build(self):
+        while not self._stop_event.is_set():
+            with self._lock:
+                start = (len(self.block_lines) - 1) * LOG_INDEX_BLOCK
+                end = start + LOG_INDEX_BLOCK
+                if self._mm is None or end > self.size:
+                    return
+                count = self._mm[start:end].count(b'\n')
+                self.block_lines.append(self.block_lines[-1] + count)
+
+    @property
+    def progress(self):
+        """Доля проиндексированного файла от 0 до 1"""
+        if not self.size:
+            return 1.0
+        return min(1.0, (len(self.block_lines) - 1) * LOG_INDEX_BLOCK / self.size)
+
+    def is_complete(self):
+        return self.size - (len(self.block_lines) - 1) * LOG_INDEX_BLOCK < LOG_INDEX_BLOCK
+
+    def line_start(self, offset):
+        """Смещение начала строки, содержащей offset"""
+        with self._lock:
+            if self._mm is None or offset <= 0:
+                return 0
+            offset = min(offset, self.size)
+            return self._mm.rfind(b'\n', 0, offset) + 1
+
+    def forward(self, offset, count):
+        """Смещение на count строк ниже offset"""
+        with self._lock:
+            for _ in range(count):
+                if self._mm is None:
+                    break
+                pos = self._mm.find(b'\n', offset)
+                if pos == -1 or pos + 1 >= self.size:
+                    break
+                offset = pos + 1
+        return offset
+
+    def backward(self, offset, count):
+        """Смещение на count строк выше offset"""
+        with self._lock:
+            for _ in range(count):
+                if self._mm is None or offset <= 0:
+                    return 0
+                offset = self._mm.rfind(b'\n', 0, offset - 1) + 1
+        return offset
+
+    def last_lines_offset(self, count):
+        """Смещение, с которого видны последние count строк"""
+        end = self.size
+        if end and self._mm is not None and self._mm[end - 1:end] == b'\n':
+            end -= 1
+        return self.backward(self.line_start(end), max(count - 1, 0))
+
+    def read_lines(self, offset, count):
+        """Читает до count строк начиная с offset; возвращает (текст, конец)"""
+        with self._lock:
+            if self._mm is None:
+                return '', 0
+            end = offset
+            for _ in range(count):
+                pos = self._mm.find(b'\n', end)
+                if pos == -1:
+                    end = self.size
+                    break
+                end = pos + 1
+            data = self._mm[offset:end]
+        return data.decode('utf-8', errors='replace'), end
+
+    def line_number(self, offset):
+        """Номер строки (с 0) по смещению или None, если блок ещё не проиндексирован"""
+        block = offset // LOG_INDEX_BLOCK
+        with self._lock:
+            if block >= len(self.block_lines) or self._mm is None:
+                return None
+            start = block * LOG_INDEX_BLOCK
+            return self.block_lines[block] + self._mm[start:offset].count(b'\n')
+
+    def offset_of_line(self, line):
+        """Смещение начала строки line (с 0) или None, если индекс до неё не дошёл"""
+        with self._lock:
+            if self._mm is None:
+                return 0
+            block = bisect.bisect_right(self.block_lines, line) - 1
+            if block == len(self.block_lines) - 1 and not self.is_complete():
+                return None
+            offset = block * LOG_INDEX_BLOCK
+            if block > 0:
+                # Начало блока может попасть в середину строки
+                offset = self._mm.rfind(b'\n', 0, offset) + 1
+            skip = line - self.block_lines[block]
+            for _ in range(skip):
+                pos = self._mm.find(b'\n', offset)
+                if pos == -1:
+                    break
+                offset = pos + 1
+            return offset
+
+    def total_lines(self):
+        """Общее число строк или None, пока индекс не готов"""
+        if not self.is_complete():
+            return None
+        with self._lock:
+            if self._mm is None:
+                return 0
+            start = (len(self.block_lines) - 1) * LOG_INDEX_BLOCK
+            total = self.block_lines[-1] + self._mm[start:self.size].count(b'\n')
+            if self.size and self._mm[self.size - 1:self.size] != b'\n':
+                total += 1
+            return total
+
+    def close(self):
+        self._stop_event.set()
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+            self._file.close()
+
+
+# Размер порции файла при поиске по журналу
+SEARCH_CHUNK_SIZE = 1024 * 1024
+# Сколько последних совпадений хранить на один источник
+SEARCH_MAX_RESULTS = 1000
+# Число потоков для поиска по всем скриптам
+SEARCH_WORKERS = 4
+# Сколько пар (файл, запрос) хранит кэш поиска
+SEARCH_CACHE_ENTRIES = 256
+
+
+class OutputSearch:
+    """Поиск подстроки или регулярного выражения в выводе скрипта.
+
+    Файлы журналов читаются порциями по SEARCH_CHUNK_SIZE, поэтому поиск
+    по большим журналам не требует памяти под весь файл и может быть
+    прерван между порциями. Для каждого файла запоминается, до какого
+    места он просмотрен и что найдено: повторный запрос по неизменному
+    сегменту отдаётся из кэша, а по дописываемому журналу - дочитывает
+    только новые строки.
+    """
+
+    def __init__(self, pattern, regex=False, case_sensitive=False, max_results=SEARCH_MAX_RESULTS):
+        self.pattern = pattern
+        self.regex = regex
+        self.case_sensitive = case_sensitive
+        self.max_results = max_results
+        if regex:
+            self._compiled = re.compile(pattern, 0 if case_sensitive else re.IGNORECASE)
+        else:
+            self._needle = pattern if case_sensitive else pattern.lower()
+
+    @property
+    def key(self):
+        return (self.pattern, self.regex, self.case_sensitive)
+
+    def match_positions(self, text):
+        """Позиции начала совпадений в тексте"""
+        if self.regex:
+            for match in self._compiled.finditer(text):
+                yield match.start()
+            return
+        haystack = text if self.case_sensitive else text.lower()
+        pos = haystack.find(self._needle)
+        while pos != -1:
+            yield pos
+            pos = haystack.find(self._needle, pos + max(1, len(self._needle)))
+
+    def scan_text(self, text, first_line=0):
+        """Совпадения в тексте из целых строк: [(номер строки, строка)]"""
+        matches = []
+        line = first_line
+        counted_to = 0
+        last_line_start = -1
+        for pos in self.match_positions(text):
+            line += text.count('\n', counted_to, pos)
+            counted_to = pos
+            line_start = text.rfind('\n', 0, pos) + 1
+            if line_start == last_line_start:
+                continue
+            last_line_start = line_start
+            line_end = text.find('\n', pos)
+            if line_end == -1:
+                line_end = len(text)
+            matches.append((line, text[line_start:line_end].rstrip('\r')))
+        return matches
+
+    def scan_file(self, path, start_offset=0, start_line=0, stop_event=None):
+        """Просматривает файл с указанного места.
+
+        Возвращает (совпадения, смещение конца просмотра, номер строки
+        в этом месте). Просмотр идёт до последнего полного перевода строки,
+        незаконченная строка останется для следующего раза.
+        """
+        matches = deque(maxlen=self.max_results)
+        compressed = path.endswith(".gz")
+        opener = gzip.open if compressed else open
+        offset = 0 if compressed else start_offset
+        line = 0 if compressed else start_line
+        carry = b''
+        with opener(path, 'rb') as f:
+            if offset:
+                f.seek(offset)
+            while stop_event is None or not stop_event.is_set():
+                chunk = f.read(SEARCH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                data = carry + chunk
+                cut = data.rfind(b'\n') + 1
+                data, carry = data[:cut], data[cut:]
+                if not data:
+                    continue
+                text = data.decode('utf-8', errors='replace')
+                matches.extend(self.scan_text(text, line))
+                line += data.count(b'\n')
+                offset += len(data)
+        if compressed and carry:
+            # Сжатый сегмент больше не растёт - учитываем и последнюю строку
+            matches.extend(self.scan_text(carry.decode('utf-8', errors='replace'), line))
+        return list(matches), offset, line
+
+
+class SearchCache:
+    """Кэш результатов поиска по файлам журналов для повторных запросов.
+
+    Хранит не больше max_entries пар (файл, запрос), вытесняя давно не
+    использованные; записи удалённых (ротированных) файлов выбрасываются.
+    """
+
+    def __init__(self, max_entries=SEARCH_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def search_file(self, search, path, stop_event=None):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.invalidate(path)
+            return []
+        identity = (stat.st_dev, stat.st_ino)
+        cache_key = (path, search.key)
+
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+
+        if entry and entry['identity'] == identity and entry['size'] == stat.st_size:
+            return list(entry['matches'])
+
+        start_offset = start_line = 0
+        matches = deque(maxlen=search.max_results)
+        if (entry and entry['identity'] == identity and stat.st_size > entry['size']
+                and not path.endswith(".gz")):
+            # Журнал дописан - просматриваем только новую часть
+            start_offset, start_line = entry['offset'], entry['line']
+            matches.extend(entry['matches'])
+
+        new_matches, offset, line = search.scan_file(path, start_offset, start_line, stop_event)
+        matches.extend(new_matches)
+
+        if stop_event is None or not stop_event.is_set():
+            with self._lock:
+                self._entries[cache_key] = {
+                    'identity': identity, 'size': stat.st_size,
+                    'offset': offset, 'line': line, 'matches': list(matches)
+                }
+                self._entries.move_to_end(cache_key)
+                if len(self._entries) > self.max_entries:
+                    self._evict()
+        return list(matches)
+
+    def _evict(self):
+        """Убирает записи исчезнувших файлов, затем самые давние"""
+        for key in [key for key in self._entries if not os.path.exists(key[0])]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, path=None):
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == path]:
+                    del self._entries[key]
+
+
+class TaskScheduler(threading.Thread):
+    """Отложенные вызовы в одном фоновом потоке.
+
+    Задачи хранятся в куче по времени срабатывания, поэтому сотня
+    ожидающих перезапусков не требует сотни таймеров-потоков.
+    """
+
+    def __init__(self):
+        super().__init__(name="TaskScheduler", daemon=True)
+        self._heap = []
+        self._counter = itertools.count()
+        self._cancelled = set()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def call_later(self, delay, function, *args):
+        """Планирует function(*args) через delay секунд; возвращает ключ для cancel()"""
+        with self._condition:
+            handle = next(self._counter)
+            heapq.heappush(self._heap, (time.monotonic() + delay, handle, function, args))
+            self._condition.notify()
+        return handle
+
+    def cancel(self, handle):
+        if handle is None:
+            return
+        with self._condition:
+            if any(task[1] == handle for task in self._heap):
+                self._cancelled.add(handle)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    delay = self._heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._condition.wait(delay)
+                if self._stopped:
+                    return
+                _, handle, function, args = heapq.heappop(self._heap)
+                if handle in self._cancelled:
+                    self._cancelled.discard(handle)
+                    continue
+            try:
+                function(*args)
+            except Exception as e:
+                print(f"Ошибка отложенной задачи: {e}")
+
+
+# Политики автоматического перезапуска: никогда, при ненулевом коде выхода, всегда
+RESTART_POLICIES = ("never", "on-failure", "always")
+# Задержка перед перезапуском: база * 2^сбоев, не больше максимума (секунды)
+RESTART_BACKOFF_BASE = 1.0
+RESTART_BACKOFF_MAX = 60.0
+# Случайный разброс задержки, доля от неё
+RESTART_JITTER = 0.2
+# Если скрипт проработал дольше, счётчик сбоев обнуляется (секунды)
+RESTART_RESET_UPTIME = 30.0
+# Столько перезапусков за окно (секунды) считается циклом сбоев
+CRASH_LOOP_RESTARTS = 5
+CRASH_LOOP_WINDOW = 60.0
+
+
+class RestartState:
+    """Состояние автоперезапуска одного скрипта"""
+
+    __slots__ = ('failures', 'restart_times', 'started_at', 'pending', 'next_restart', 'crash_loop')
+
+    def __init__(self):
+        self.failures = 0
+        self.restart_times = deque()
+        self.started_at = None
+        self.pending = None
+        self.next_restart = None
+        self.crash_loop = False
+
+
+def restart_delay(failures, base=RESTART_BACKOFF_BASE, maximum=RESTART_BACKOFF_MAX, jitter=RESTART_JITTER):
+    """Экспоненциальная задержка перезапуска со случайным разбросом"""
+    delay = min(maximum, base * (2 ** min(failures, 32)))
+    return delay * random.uniform(1 - jitter, 1 + jitter)
+
+
+# Сколько скриптов одновременно могут находиться в стадии запуска
+LAUNCH_MAX_CONCURRENT = max(2, (os.cpu_count() or 4) // 2)
+# Минимальный интервал между двумя запусками из очереди (секунды)
+LAUNCH_INTERVAL = 0.1
+# Без маркера готовности скрипт считается готовым после такого времени работы (секунды)
+LAUNCH_READY_AFTER = 1.0
+# Дольше этого запуск не занимает слот, даже если маркер так и не появился (секунды)
+LAUNCH_STARTUP_TIMEOUT = 60.0
+
+
+class LaunchScheduler(threading.Thread):
+    """Очередь запусков перед ScriptSupervisor.start().
+
+    Одновременно запускается не больше max_concurrent скриптов: слот
+    занят, пока скрипт не станет готов - напечатает ready_marker или
+    проработает ready_after секунд. Из очереди первыми берутся скрипты с
+    большим priority, а скрипт с depends_on ждёт готовности зависимостей
+    (неактивные зависимости пропускаются, остановленные ставятся в очередь).
+    """
+
+    def __init__(self, supervisor):
+        super().__init__(name="LaunchScheduler", daemon=True)
+        self.supervisor = supervisor
+        self.queued = set()
+        self.ready = set()
+        self._queue = []
+        self._counter = itertools.count()
+        # script_uuid -> (момент готовности по времени работы или None, крайний срок слота)
+        self._starting = {}
+        self._markers = {}
+        self._last_launch = 0.0
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def setting(self, key, default):
+        return float(self.supervisor.settings.get(key, default))
+
+    def dependencies(self, script_info):
+        """uuid активных зависимостей скрипта (depends_on - uuid или имена)"""
+        registry = self.supervisor.registry
+        result = []
+        for name in script_info.get('depends_on', []):
+            if name in registry:
+                result.append(name)
+                continue
+            matches = registry.by_name(name)
+            if matches:
+                result.extend(runtime.script_uuid for runtime in matches)
+            else:
+                print(f"Зависимость {name} не активна и пропущена")
+        return result
+
+    def enqueue(self, script_uuids):
+        """Ставит скрипты и их остановленные зависимости в очередь запуска"""
+        failed = []
+        with self._condition:
+            for script_uuid in script_uuids:
+                self._enqueue(script_uuid, [], failed)
+            self._condition.notify()
+        for script_uuid, error in failed:
+            self.supervisor._emit('launch_failed', script_uuid, error)
+
+    def _enqueue(self, script_uuid, path, failed):
+        """Ставит скрипт в очередь после зависимостей; False при циклической зависимости"""
+        runtime = self.supervisor.registry.get(script_uuid)
+        if runtime is None or runtime.is_running or script_uuid in self.queued:
+            return True
+        if script_uuid in path:
+            failed.append((path[0], "Циклическая зависимость: " + " -> ".join(path + [script_uuid])))
+            return False
+        for dependency in self.dependencies(runtime.script_info):
+            if not self._enqueue(dependency, path + [script_uuid], failed):
+                return False
+        self.queued.add(script_uuid)
+        priority = int(runtime.script_info.get('priority', 0))
+        heapq.heappush(self._queue, (-priority, next(self._counter), script_uuid))
+        return True
+
+    def cancel(self, script_uuid):
+        with self._condition:
+            self.queued.discard(script_uuid)
+
+    def cancel_all(self):
+        """Очищает очередь; возвращает uuid снятых с неё скриптов"""
+        with self._condition:
+            cancelled = list(self.queued)
+            self.queued.clear()
+            self._queue.clear()
+        return cancelled
+
+    def on_launched(self, script_uuid, script_info):
+        """Скрипт запущен (из очереди или напрямую) - ждём его готовности"""
+        now = time.monotonic()
+        marker = script_info.get('ready_marker')
+        with self._condition:
+            self.ready.discard(script_uuid)
+            if marker:
+                self._markers[script_uuid] = (marker, '')
+                ready_at = None
+            else:
+                ready_at = now + float(script_info.get('ready_after',
+                                                       self.setting('ready_after', LAUNCH_READY_AFTER)))
+            self._starting[script_uuid] = (ready_at, now + self.setting('startup_timeout', LAUNCH_STARTUP_TIMEOUT))
+            self._condition.notify()
+
+    def on_output(self, script_uuid, text):
+        """Ищет маркер готовности в выводе, в том числе на стыке фрагментов"""
+        with self._condition:
+            entry = self._markers.get(script_uuid)
+            if entry is None:
+                return
+            marker, tail = entry
+            if marker in tail + text:
+                self._set_ready(script_uuid)
+            else:
+                self._markers[script_uuid] = (marker, (tail + text)[-(len(marker) - 1):] if len(marker) > 1 else '')
+
+    def mark_ready(self, script_uuid):
+        with self._condition:
+            self._set_ready(script_uuid)
+
+    def _set_ready(self, script_uuid):
+        self._markers.pop(script_uuid, None)
+        self._starting.pop(script_uuid, None)
+        self.ready.add(script_uuid)
+        self._condition.notify()
+
+    def on_exit(self, script_uuid):
+        with self._condition:
+            self.ready.discard(script_uuid)
+            self._starting.pop(script_uuid, None)
+            self._markers.pop(script_uuid, None)
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _next_launch(self):
+        """Следующий скрипт, который можно запустить сейчас, или None"""
+        registry = self.supervisor.registry
+        deferred = []
+        chosen = None
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            script_uuid = entry[2]
+            runtime = registry.get(script_uuid)
+            if script_uuid not in self.queued or runtime is None or runtime.is_running:
+                self.queued.discard(script_uuid)
+                continue
+            if all(dependency in self.ready for dependency in self.dependencies(runtime.script_info)):
+                chosen = script_uuid
+                break
+            deferred.append(entry)
+        for entry in deferred:
+            heapq.heappush(self._queue, entry)
+        return chosen
+
+    def run(self):
+        while True:
+            launch = None
+            with self._condition:
+                if self._stopped:
+                    return
+                now = time.monotonic()
+                wakeup = now + 1.0
+                for script_uuid, (ready_at, deadline) in list(self._starting.items()):
+                    if ready_at is not None and now >= ready_at:
+                        del self._starting[script_uuid]
+                        self.ready.add(script_uuid)
+                    elif now >= deadline:
+                        # Скрипт работает, но маркер так и не напечатал: считаем его
+                        # готовым, иначе зависимые скрипты остались бы в очереди навсегда
+                        self._set_ready(script_uuid)
+                        print(f"Скрипт {script_uuid} не сообщил о готовности за отведённое время")
+                    else:
+                        wakeup = min(wakeup, ready_at if ready_at is not None else deadline)
+
+                max_concurrent = int(self.setting('max_concurrent_startups', LAUNCH_MAX_CONCURRENT))
+                next_allowed = self._last_launch + self.setting('launch_interval', LAUNCH_INTERVAL)
+                if self.queued and len(self._starting) < max_concurrent:
+                    if now < next_allowed:
+                        wakeup = min(wakeup, next_allowed)
+                    else:
+                        launch = self._next_launch()
+                        if launch is not None:
+                            self.queued.discard(launch)
+                            self._last_launch = now
+
+                if launch is None:
+                    self._condition.wait(max(0.0, wakeup - now))
+                    continue
+
+            try:
+                self.supervisor._launch(launch)
+            except Exception as e:
+                print(f"Ошибка запуска скрипта {launch}: {e}")
+                self.supervisor._launch_failed(launch, e)
+
+
+# Действия при превышении лимита: остановить, перезапустить или понизить приоритет
+LIMIT_ACTIONS = ("kill", "restart", "throttle")
+# Сколько замеров подряд лимит должен быть превышен, прежде чем сработает сторож
+LIMIT_BREACH_SAMPLES = 3
+# Приоритет (nice), до которого понижается скрипт действием throttle
+THROTTLE_NICE = 19
+# Период квоты cgroup cpu.max (микросекунды)
+CGROUP_CPU_PERIOD = 100000
+
+
+def script_limits(script_info):
+    """Заданные лимиты ресурсов скрипта.
+
+    Ключи: max_memory_mb, cpu_percent (доля одного ядра), cpu_affinity
+    (список ядер), nice, max_open_files, max_runtime (секунды) и action
+    (действие из LIMIT_ACTIONS при превышении). Одно действие без
+    лимитов (сохранено старым диалогом) лимитом не считается.
+    """
+    limits = {key: value for key, value in script_info.get('limits', {}).items() if value}
+    if limits.keys() <= {'action'}:
+        return {}
+    return limits
+
+
+class CgroupLimits:
+    """Лимиты памяти и CPU через cgroups v2.
+
+    Работает только в делегированном менеджеру каталоге (настройка
+    cgroup_root), в котором нет своих процессов: для каждого скрипта
+    там создаётся дочерняя группа с memory.max и cpu.max.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.available = bool(root) and sys.platform.startswith("linux") and self._enable_controllers()
+        # Значение oom_kill из memory.events на момент запуска скрипта
+        self._oom_base = {}
+
+    def _enable_controllers(self):
+        control = os.path.join(self.root, "cgroup.subtree_control")
+        try:
+            with open(control, 'r') as f:
+                enabled = f.read().split()
+            missing = [name for name in ("memory", "cpu") if name not in enabled]
+            if missing:
+                with open(control, 'w') as f:
+                    f.write(" ".join("+" + name for name in missing))
+            return True
+        except OSError as e:
+            print(f"cgroups v2 недоступны в {self.root}: {e}")
+            return False
+
+    def path_for(self, script_uuid):
+        return os.path.join(self.root, f"psm-{script_uuid}")
+
+    def prepare(self, script_uuid, limits):
+        """Создаёт группу скрипта; возвращает (путь к cgroup.procs, применённые лимиты)"""
+        if not self.available or not ({'max_memory_mb', 'cpu_percent'} & set(limits)):
+            return None, set()
+        path = self.path_for(script_uuid)
+        applied = set()
+        try:
+            os.makedirs(path, exist_ok=True)
+            if 'max_memory_mb' in limits:
+                with open(os.path.join(path, "memory.max"), 'w') as f:
+                    f.write(str(int(float(limits['max_memory_mb']) * 1024 * 1024)))
+                applied.add('memory')
+                self._oom_base[script_uuid] = self._read_oom_kills(script_uuid)
+            if 'cpu_percent' in limits:
+                quota = max(1000, int(CGROUP_CPU_PERIOD * float(limits['cpu_percent']) / 100))
+                with open(os.path.join(path, "cpu.max"), 'w') as f:
+                    f.write(f"{quota} {CGROUP_CPU_PERIOD}")
+                applied.add('cpu')
+        except OSError as e:
+            print(f"Не удалось настроить cgroup скрипта {script_uuid}: {e}")
+            return None, set()
+        return os.path.join(path, "cgroup.procs"), applied
+
+    def _read_oom_kills(self, script_uuid):
+        try:
+            with open(os.path.join(self.path_for(script_uuid), "memory.events"), 'r') as f:
+                for line in f:
+                    key, _, value = line.partition(' ')
+                    if key == 'oom_kill':
+                        return int(value)
+        except (OSError, ValueError):
+            pass
+        return 0
+
+    def oom_kills(self, script_uuid):
+        """Сколько процессов группы скрипта убил OOM с его запуска"""
+        base = self._oom_base.get(script_uuid)
+        if base is None:
+            return 0
+        return max(0, self._read_oom_kills(script_uuid) - base)
+
+    def release(self, script_uuid):
+        if not self.available:
+            return
+        self._oom_base.pop(script_uuid, None)
+        try:
+            os.rmdir(self.path_for(script_uuid))
+        except OSError:
+            # Группы нет или в ней ещё остались процессы
+            pass
+
+
+# Запуск через оболочку, которая вступает в cgroup и заменяет себя
+# скриптом: процесс попадает в группу до exec, и всё, что он породит,
+# тоже под её лимитами. Аргументы: cgroup.procs, интерпретатор, скрипт
+CGROUP_TRAMPOLINE = ('/bin/sh', '-c', 'echo $$ > "$0" && exec "$@"')
+
+
+def cgroup_command(command, cgroup_procs):
+    """Команда запуска, которая до exec переносит процесс в cgroup"""
+    return [*CGROUP_TRAMPOLINE, cgroup_procs, *command]
+
+
+def apply_limits_after_spawn(pid, limits):
+    """Применяет лимиты к только что запущенному процессу по его PID.
+
+    preexec_fn небезопасен в многопоточном менеджере (дочерний процесс
+    может зависнуть на блокировке другого потока), поэтому nice, rlimit
+    и привязка к ядрам задаются снаружи (cgroup задаёт cgroup_command).
+    Всё на уровне лучших усилий: ошибка (например, отрицательный nice
+    без прав) не мешает работе, превышения поймает сторож.
+    """
+    nice = limits.get('nice')
+    if nice and hasattr(os, 'setpriority'):
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, int(nice))
+        except (OSError, ValueError) as e:
+            print(f"Не удалось задать приоритет процессу {pid}: {e}")
+    open_files = limits.get('max_open_files')
+    if open_files:
+        try:
+            if HAS_RESOURCE and hasattr(resource, 'prlimit'):
+                resource.prlimit(pid, resource.RLIMIT_NOFILE, (int(open_files), int(open_files)))
+            elif HAS_PSUTIL and hasattr(psutil.Process, 'rlimit'):
+                psutil.Process(pid).rlimit(psutil.RLIMIT_NOFILE, (int(open_files), int(open_files)))
+            else:
+                print("Лимит открытых файлов на этой платформе не поддерживается")
+        except Exception as e:
+            print(f"Не удалось ограничить число файлов процесса {pid}: {e}")
+    if limits.get('cpu_affinity'):
+        try:
+            set_tree_affinity(pid, [int(cpu) for cpu in limits['cpu_affinity']])
+        except ValueError as e:
+            print(f"Неверная привязка к ядрам процесса {pid}: {e}")
+
+
+class LimitWatchdog:
+    """Сторож лимитов по снимкам ResourceSampler.
+
+    Проверяет то, что не удалось поручить ядру ОС: память и CPU без
+    cgroups и время работы. Превышение засчитывается после
+    LIMIT_BREACH_SAMPLES замеров подряд, чтобы не реагировать на пики.
+    """
+
+    def __init__(self, supervisor):
+        self.supervisor = supervisor
+        # script_uuid -> лимиты, которые уже соблюдает ядро ОС
+        self.enforced = {}
+        self.throttled = set()
+        self._counters = {}
+        # Сколько OOM-убийств в cgroup скрипта уже сообщено
+        self._oom_reported = {}
+
+    def reset(self, script_uuid, enforced=()):
+        self.enforced[script_uuid] = set(enforced)
+        self.throttled.discard(script_uuid)
+        self._oom_reported.pop(script_uuid, None)
+        for kind in ('memory', 'cpu'):
+            self._counters.pop((script_uuid, kind), None)
+
+    def check(self, snapshot):
+        registry = self.supervisor.registry
+        for script_uuid, sample in snapshot['scripts'].items():
+            runtime = registry.get(script_uuid)
+            if runtime is None or not sample['alive'] or script_uuid in self.supervisor.stopping:
+                continue
+            limits = script_limits(runtime.script_info)
+            if not limits:
+                continue
+            enforced = self.enforced.get(script_uuid, ())
+            if 'memory' in enforced and self.take_oom_kills(script_uuid):
+                # Ядро убило процесс из дерева скрипта по memory.max
+                self.supervisor.limit_exceeded(script_uuid, 'oom', sample['rss'] / (1024 * 1024),
+                                               float(limits['max_memory_mb']))
+                continue
+            if 'max_memory_mb' in limits and 'memory' not in enforced:
+                self._observe(runtime, 'memory', sample['rss'] / (1024 * 1024), float(limits['max_memory_mb']))
+            if 'cpu_percent' in limits and 'cpu' not in enforced and script_uuid not in self.throttled:
+                self._observe(runtime, 'cpu', sample['cpu'], float(limits['cpu_percent']))
+
+    def take_oom_kills(self, script_uuid):
+        """True, если с прошлой проверки в cgroup скрипта были новые OOM-убийства"""
+        kills = self.supervisor.cgroups.oom_kills(script_uuid)
+        if kills <= self._oom_reported.get(script_uuid, 0):
+            return False
+        self._oom_reported[script_uuid] = kills
+        return True
+
+    def _observe(self, runtime, kind, value, limit):
+        key = (runtime.script_uuid, kind)
+        if value <= limit:
+            self._counters.pop(key, None)
+            return
+        self._counters[key] = self._counters.get(key, 0) + 1
+        if self._counters[key] >= LIMIT_BREACH_SAMPLES:
+            self._counters.pop(key, None)
+            self.supervisor.limit_exceeded(runtime.script_uuid, kind, value, limit)
+
+
+# Режимы распределения скриптов по ядрам: выключено, по кругу, на наименее загруженные
+AFFINITY_MODES = ("off", "round-robin", "least-loaded")
+# Сколько ядер отводится самому менеджеру (его потокам и Tk), когда распределение включено
+AFFINITY_MANAGER_CPUS = 1
+# Предполагаемая нагрузка только что назначенного скрипта, пока нет замеров (%)
+AFFINITY_NEW_SCRIPT_LOAD = 50.0
+# Задержка перебалансировки после запуска и остановки скриптов (секунды)
+AFFINITY_REBALANCE_DELAY = 1.0
+
+
+def get_cpu_affinity(pid=0):
+    """Отсортированный список ядер процесса или None, если платформа не поддерживает привязку"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(pid))
+    if HAS_PSUTIL:
+        try:
+            return sorted(psutil.Process(pid or os.getpid()).cpu_affinity())
+        except (AttributeError, psutil.Error):
+            pass
+    return None
+
+
+def set_cpu_affinity(pid, cpus):
+    """Привязывает процесс (на Linux - поток) к ядрам; True при успехе"""
+    if hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(pid, cpus)
+            return True
+        except OSError:
+            return False
+    if HAS_PSUTIL:
+        try:
+            psutil.Process(pid or os.getpid()).cpu_affinity(list(cpus))
+            return True
+        except (AttributeError, psutil.Error):
+            pass
+    return False
+
+
+def set_tree_affinity(pid, cpus):
+    """Привязывает к ядрам запущенный скрипт целиком: все процессы его дерева
+    и на Linux - каждый их поток; True, если привязан хотя бы корневой процесс"""
+    pids = [pid]
+    if HAS_PSUTIL:
+        try:
+            pids += [child.pid for child in psutil.Process(pid).children(recursive=True)]
+        except psutil.Error:
+            pass
+    elif os.path.isdir(f"/proc/{pid}/task"):
+        index = 0
+        while index < len(pids):
+            pids.extend(ProcfsSamplerBackend._children(pids[index]))
+            index += 1
+
+    result = False
+    for tree_pid in pids:
+        task_dir = f"/proc/{tree_pid}/task"
+        if hasattr(os, 'sched_setaffinity') and os.path.isdir(task_dir):
+            # sched_setaffinity меняет только один поток, поэтому обходим все
+            try:
+                tids = os.listdir(task_dir)
+            except OSError:
+                continue
+            # Список, а не генератор: any() не должен остановиться на первом успехе
+            applied = any([set_cpu_affinity(int(tid), cpus) for tid in tids])
+        else:
+            applied = set_cpu_affinity(tree_pid, cpus)
+        if tree_pid == pid:
+            result = applied
+    return result
+
+
+class AffinityPlanner:
+    """Распределение скриптов по ядрам CPU.
+
+    Режим задаётся настройкой affinity_mode. Скрипту назначается одно
+    ядро: по кругу или самое свободное по последним замерам per-CPU.
+    Явная привязка cpu_affinity из лимитов скрипта имеет приоритет.
+    Потоки самого менеджера закрепляются на первых manager_cpus ядрах,
+    скрипты - на остальных. При запуске и остановке скриптов число
+    скриптов на ядрах выравнивается.
+    """
+
+    def __init__(self, supervisor):
+        self.supervisor = supervisor
+        self.all_cpus = get_cpu_affinity() or []
+        self.assignments = {}
+        self.explicit = set()
+        self.per_cpu_load = []
+        self._fresh = {}
+        self._next = 0
+        self._rebalance_pending = None
+        self._lock = threading.Lock()
+
+    def mode(self):
+        mode = self.supervisor.settings.get('affinity_mode', 'off')
+        if mode not in AFFINITY_MODES or len(self.all_cpus) < 2:
+            return 'off'
+        return mode
+
+    def manager_cpus(self):
+        count = int(self.supervisor.settings.get('manager_cpus', AFFINITY_MANAGER_CPUS))
+        if self.mode() == 'off' or count <= 0 or count >= len(self.all_cpus):
+            return list(self.all_cpus)
+        return self.all_cpus[:count]
+
+    def worker_cpus(self):
+        reserved = set(self.manager_cpus())
+        workers = [cpu for cpu in self.all_cpus if cpu not in reserved]
+        return workers or list(self.all_cpus)
+
+    def pin_manager(self):
+        """Закрепляет все потоки менеджера; новые потоки наследуют привязку"""
+        if not self.all_cpus:
+            return
+        cpus = self.manager_cpus()
+        task_dir = "/proc/self/task"
+        if os.path.isdir(task_dir) and hasattr(os, 'sched_setaffinity'):
+            for tid in os.listdir(task_dir):
+                set_cpu_affinity(int(tid), cpus)
+        else:
+            set_cpu_affinity(0, cpus)
+
+    def refresh(self):
+        """Применяет изменённые настройки: закрепление менеджера и распределение скриптов"""
+        self.pin_manager()
+        if self.mode() == 'off':
+            with self._lock:
+                self.assignments = {uuid_: cpus for uuid_, cpus in self.assignments.items()
+                                    if uuid_ in self.explicit}
+            for runtime in self.supervisor.registry.running():
+                if runtime.script_uuid not in self.explicit and runtime.pid:
+                    set_tree_affinity(runtime.pid, self.all_cpus)
+        else:
+            self.rebalance(force=True)
+
+    def on_snapshot(self, snapshot):
+        with self._lock:
+            self.per_cpu_load = snapshot['system'].get('per_cpu', [])
+            self._fresh.clear()
+
+    def assign(self, script_uuid, explicit=None):
+        """Ядра для запускаемого скрипта или None, если привязка не нужна"""
+        with self._lock:
+            if explicit:
+                self.explicit.add(script_uuid)
+                self.assignments[script_uuid] = list(explicit)
+                return list(explicit)
+            self.explicit.discard(script_uuid)
+            mode = self.mode()
+            if mode == 'off':
+                return None
+            workers = self.worker_cpus()
+            if mode == 'round-robin':
+                cpu = workers[self._next % len(workers)]
+                self._next += 1
+            else:
+                cpu = min(workers, key=self._score)
+            self._fresh[cpu] = self._fresh.get(cpu, 0) + 1
+            self.assignments[script_uuid] = [cpu]
+            return [cpu]
+
+    def _score(self, cpu):
+        load = self.per_cpu_load[cpu] if cpu < len(self.per_cpu_load) else 0.0
+        assigned = sum(1 for cpus in self.assignments.values() if cpus == [cpu])
+        return load + AFFINITY_NEW_SCRIPT_LOAD * self._fresh.get(cpu, 0), assigned
+
+    def release(self, script_uuid):
+        with self._lock:
+            if self.assignments.pop(script_uuid, None) is None:
+                return
+            self.explicit.discard(script_uuid)
+        self.schedule_rebalance()
+
+    def schedule_rebalance(self):
+        if self.mode() == 'off':
+            return
+        scheduler = self.supervisor.scheduler
+        scheduler.cancel(self._rebalance_pending)
+        self._rebalance_pending = scheduler.call_later(AFFINITY_REBALANCE_DELAY, self.rebalance)
+
+    def rebalance(self, force=False):
+        """Переносит скрипты с самых занятых ядер на свободные, пока разница больше одного"""
+        self._rebalance_pending = None
+        if self.mode() == 'off':
+            return
+        registry = self.supervisor.registry
+        moves = []
+        with self._lock:
+            workers = self.worker_cpus()
+            per_cpu = {cpu: [] for cpu in workers}
+            for script_uuid, cpus in self.assignments.items():
+                if script_uuid in self.explicit:
+                    continue
+                if len(cpus) == 1 and cpus[0] in per_cpu:
+                    per_cpu[cpus[0]].append(script_uuid)
+                elif force:
+                    # Ядро больше не рабочее (изменились настройки) - переносим
+                    target = min(per_cpu, key=lambda cpu: len(per_cpu[cpu]))
+                    per_cpu[target].append(script_uuid)
+                    moves.append((script_uuid, target))
+            while True:
+                busiest = max(per_cpu, key=lambda cpu: len(per_cpu[cpu]))
+                idlest = min(per_cpu, key=lambda cpu: len(per_cpu[cpu]))
+                if len(per_cpu[busiest]) - len(per_cpu[idlest]) <= 1:
+                    break
+                script_uuid = per_cpu[busiest].pop()
+                per_cpu[idlest].append(script_uuid)
+                moves.append((script_uuid, idlest))
+            for script_uuid, cpu in moves:
+                self.assignments[script_uuid] = [cpu]
+
+        for script_uuid, cpu in moves:
+            runtime = registry.get(script_uuid)
+            if runtime is not None and runtime.pid and runtime.is_running:
+                set_tree_affinity(runtime.pid, [cpu])
+
+
+# Сколько ждать завершения скрипта после terminate() до kill() (секунды)
+STOP_GRACE_PERIOD = 3.0
+# Период проверки останавливаемых процессов (секунды)
+STOP_POLL_INTERVAL = 0.05
+
+
+def signal_process_tree(process, kill=False):
+    """Завершает скрипт вместе со всеми его дочерними процессами.
+
+    На POSIX скрипт запускается в своей сессии, поэтому сигнал уходит
+    всей группе процессов. На Windows группа не получает сигналов, и
+    потомки завершаются по списку psutil.
+    """
+    if sys.platform == "win32":
+        if HAS_PSUTIL:
+            try:
+                for child in psutil.Process(process.pid).children(recursive=True):
+                    try:
+                        child.kill()
+                    except psutil.Error:
+                        pass
+            except psutil.Error:
+                pass
+        try:
+            (process.kill if kill else process.terminate)()
+        except OSError:
+            pass
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    except OSError:
+        # Группа недоступна (например, скрипт сменил её сам) - хотя бы сам процесс
+        try:
+            (process.kill if kill else process.terminate)()
+        except OSError:
+            pass
+
+
+def process_group_alive(process):
+    """Остались ли живые процессы в группе скрипта (только POSIX)"""
+    if sys.platform == "win32":
+        return False
+    try:
+        os.killpg(process.pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+class StopOperation:
+    """Асинхронная остановка группы скриптов.
+
+    Всем процессам сигнал отправляется сразу, а завершения ждёт один
+    фоновый поток. on_progress(operation) вызывается из него после
+    каждого остановленного скрипта.
+    """
+
+    def __init__(self, script_uuids, on_progress=None):
+        self.script_uuids = list(script_uuids)
+        self.total = len(self.script_uuids)
+        self.stopped = []
+        self.killed = []
+        self.on_progress = on_progress
+        self.done = threading.Event()
+
+    @property
+    def completed(self):
+        return len(self.stopped)
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def _progress(self):
+        if self.on_progress:
+            try:
+                self.on_progress(self)
+            except Exception as e:
+                print(f"Ошибка обработчика остановки: {e}")
+
+
+class ScriptSupervisor:
+    """Ядро управления процессами скриптов, не зависящее от Tk.
+
+    Запускает и останавливает процессы, собирает их вывод в историю
+    и журналы, следит за ресурсами. Интерфейс (Tk-окно или управляющий
+    API демона) подписывается на события через add_listener():
+    listener(событие, script_uuid, данные), где событие - 'started',
+    'output', 'exited', 'stopping', 'stopped', 'restarting' (данные -
+    задержка), 'crashloop', 'queued', 'launch_failed' (данные - текст
+    ошибки) или 'limit_exceeded' (данные - описание превышения). Слушатели вызываются из любых
+    потоков и не должны блокировать.
+    """
+
+    is_remote = False
+
+    def __init__(self, settings, logs_dir=LOGS_DIR, metrics_dir=METRICS_DIR):
+        self.settings = settings
+        self.registry = ScriptRegistry()
+        self.output_pump = OutputPump()
+        self.script_logs = ScriptLogManager(logs_dir, settings)
+        self.scrollbacks = {}
+        self.exit_codes = {}
+        # Скрипты, которым отправлен сигнал остановки, но процесс ещё жив
+        self.stopping = set()
+        self.restarts = {}
+        # Скрипты, поставленные в очередь автоперезапуском
+        self.auto_restarting = set()
+        # Незавершённые StopOperation: их поток должен дожить до SIGKILL
+        self.operations = set()
+        # Менеджер завершает работу: новые запуски запрещены
+        self.closing = False
+        self.scheduler = TaskScheduler()
+        self.scheduler.start()
+        self.launcher = LaunchScheduler(self)
+        self.launcher.start()
+        self.cgroups = CgroupLimits(settings.get('cgroup_root'))
+        self.affinity = AffinityPlanner(self)
+        self.affinity.pin_manager()
+        self.watchdog = LimitWatchdog(self)
+        # Последнее превышение лимита по каждому скрипту
+        self.limit_breaches = {}
+        # Накопительные счётчики: запуски, автоперезапуски, байты и строки вывода
+        self.script_counters = {}
+        self.exporter = None
+        self.sampler = ResourceSampler(
+            backend=create_sampler_backend(settings.get('sampler_backend', "auto"),
+                                           settings.get('track_process_tree', True)),
+            cpu_budget=float(settings.get('monitor_cpu_budget', MONITOR_CPU_BUDGET))) if HAS_PSUTIL else None
+        self.history = None
+        if self.sampler:
+            self.sampler.listeners.append(self.watchdog.check)
+            self.sampler.listeners.append(self.affinity.on_snapshot)
+            if settings.get('metrics_history', True):
+                self.history = MetricsHistory(metrics_dir)
+                self.sampler.listeners.append(self.history.record)
+                self.scheduler.call_later(METRICS_SAVE_INTERVAL, self._save_history)
+        if settings.get('metrics_exporter_port'):
+            try:
+                self.exporter = MetricsExporter(self, port=int(settings['metrics_exporter_port']))
+            except OSError as e:
+                print(f"Не удалось запустить экспортёр метрик: {e}")
+            else:
+                if self.sampler:
+                    self.sampler.listeners.append(self.exporter.update)
+                self.exporter.start()
+        self.monitoring = True
+        self._listeners = []
+        self._lock = threading.RLock()
+        if self.sampler:
+            self.sampler.start()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _emit(self, event, script_uuid, data=None):
+        for listener in list(self._listeners):
+            try:
+                listener(event, script_uuid, data)
+            except Exception as e:
+                print(f"Ошибка обработчика события {event}: {e}")
+
+    def _update_sampler_targets(self):
+        if not self.sampler:
+            return
+        with self._lock:
+            # Без мониторинга сборщик нужен только истории, экспортёру и сторожу лимитов
+            collect_all = self.monitoring or self.history or self.exporter
+            self.sampler.set_targets({
+                runtime.script_uuid: runtime.pid
+                for runtime in self.registry.running()
+                if runtime.pid and (collect_all or script_limits(runtime.script_info))
+            })
+
+    def set_monitoring(self, enabled):
+        if enabled != self.monitoring:
+            self.monitoring = enabled
+            self._update_sampler_targets()
+
+    def set_background(self, enabled):
+        """Окно интерфейса скрыто: опрос ресурсов можно делать реже"""
+        if self.sampler:
+            self.sampler.set_background(enabled)
+
+    def activate(self, script_uuid, script_info):
+        with self._lock:
+            return self.registry.add(script_uuid, script_info)
+
+    def deactivate(self, script_uuid):
+        # Процесс дозавершит StopOperation, запись убирается сразу
+        self.stop_many([script_uuid])
+        with self._lock:
+            self.registry.remove(script_uuid)
+            self.restarts.pop(script_uuid, None)
+            self.script_counters.pop(script_uuid, None)
+        if self.history:
+            self.history.unload(script_uuid)
+
+    def update_info(self, script_uuid, script_info):
+        with self._lock:
+            self.registry.update_info(script_uuid, script_info)
+
+    def is_running(self, script_uuid):
+        runtime = self.registry.get(script_uuid)
+        return runtime is not None and runtime.is_running
+
+    def start(self, script_uuid):
+        """Запускает скрипт вручную; при ошибке бросает исключение.
+
+        Ручной запуск отменяет ожидающий перезапуск и снимает признак
+        цикла сбоев.
+        """
+        with self._lock:
+            state = self.restarts.get(script_uuid)
+            if state is not None:
+                self.scheduler.cancel(state.pending)
+                state.pending = state.next_restart = None
+                state.crash_loop = False
+                state.restart_times.clear()
+        return self._launch(script_uuid)
+
+    @property
+    def queued(self):
+        return self.launcher.queued
+
+    def enqueue_start(self, script_uuids):
+        """Запускает скрипты через очередь запусков; ошибки приходят событием 'launch_failed'"""
+        script_uuids = [script_uuid for script_uuid in script_uuids if not self.is_running(script_uuid)]
+        for script_uuid in script_uuids:
+            state = self.restarts.get(script_uuid)
+            if state is not None:
+                self._cancel_restart(script_uuid)
+                state.crash_loop = False
+                state.restart_times.clear()
+        self.auto_restarting.difference_update(script_uuids)
+        self.launcher.enqueue(script_uuids)
+        for script_uuid in script_uuids:
+            self._emit('queued', script_uuid)
+
+    def _launch_failed(self, script_uuid, error):
+        """Запуск из очереди не удался"""
+        if script_uuid in self.auto_restarting:
+            # Неудачный автоперезапуск - такой же сбой, как падение скрипта
+            self.auto_restarting.discard(script_uuid)
+            runtime = self.registry.get(script_uuid)
+            self._emit('exited', script_uuid, None)
+            if runtime is not None:
+                self._schedule_restart(runtime, None)
+        else:
+            self._emit('launch_failed', script_uuid, str(error))
+
+    def _launch(self, script_uuid):
+        with self._lock:
+            runtime = self.registry.get(script_uuid)
+            if runtime is None:
+                raise KeyError(f"Скрипт {script_uuid} не активен")
+            if self.closing:
+                raise RuntimeError("Менеджер завершает работу")
+            if script_uuid in self.stopping:
+                raise RuntimeError("Скрипт ещё останавливается")
+            if runtime.is_running:
+                return runtime
+            script_info = runtime.script_info
+
+            interpreter = script_info['interpreter']
+            if not os.path.exists(interpreter):
+                interpreter = find_system_python()
+
+            limits = script_limits(script_info)
+            cgroup_procs, enforced = self.cgroups.prepare(script_uuid, limits)
+            cpus = self.affinity.assign(script_uuid, limits.get('cpu_affinity'))
+            if cpus:
+                limits = dict(limits, cpu_affinity=cpus)
+
+            if sys.platform == "win32":
+                process = subprocess.Popen(
+                    [interpreter, script_info['path']],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    stdin=subprocess.PIPE,
+                    universal_newlines=False,
+                    creationflags=subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP
+                )
+            else:
+                command = [interpreter, script_info['path']]
+                if cgroup_procs:
+                    # Если вступить в группу не удалось, оболочка завершится с ошибкой в выводе
+                    command = cgroup_command(command, cgroup_procs)
+                process = subprocess.Popen(
+                    command,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    stdin=subprocess.PIPE,
+                    universal_newlines=False,
+                    start_new_session=True
+                )
+            if limits:
+                apply_limits_after_spawn(process.pid, limits)
+
+            self.registry.set_process(script_uuid, process)
+            self.auto_restarting.discard(script_uuid)
+            self.restarts.setdefault(script_uuid, RestartState()).started_at = time.monotonic()
+            self.counters(script_uuid)['starts'] += 1
+            self.exit_codes.pop(script_uuid, None)
+            self.limit_breaches.pop(script_uuid, None)
+            self.watchdog.reset(script_uuid, enforced)
+            if limits.get('max_runtime'):
+                self.scheduler.call_later(float(limits['max_runtime']), self._check_runtime, script_uuid, process)
+            self.scrollbacks[script_uuid] = OutputScrollback(
+                self.settings.get('scrollback_max_lines', SCROLLBACK_MAX_LINES),
+                self.settings.get('scrollback_max_bytes', SCROLLBACK_MAX_BYTES)
+            )
+            # До подключения вывода, чтобы не пропустить ранний маркер готовности
+            self.launcher.on_launched(script_uuid, script_info)
+            self.monitor_script_output(runtime)
+
+        self._update_sampler_targets()
+        self.affinity.schedule_rebalance()
+        self._emit('started', script_uuid, process.pid)
+        return runtime
+
+    def stop(self, script_uuid):
+        """Останавливает скрипт и ждёт завершения процесса"""
+        self.stop_many([script_uuid]).wait()
+
+    def grace_period(self, script_uuid):
+        runtime = self.registry.get(script_uuid)
+        if runtime and 'stop_timeout' in runtime.script_info:
+            return float(runtime.script_info['stop_timeout'])
+        return float(self.settings.get('stop_grace_period', STOP_GRACE_PERIOD))
+
+    def stop_all(self, on_progress=None, final=False):
+        """Останавливает все скрипты и снимает очередь запусков и автоперезапуски.
+
+        Операция завершается, только когда закончены и начатые раньше
+        остановки. С final=True новые запуски больше не выполняются - так
+        завершается менеджер.
+        """
+        with self._lock:
+            if final:
+                self.closing = True
+            cancelled = self.launcher.cancel_all()
+            for script_uuid in list(self.restarts):
+                self._cancel_restart(script_uuid)
+            self.auto_restarting.clear()
+            earlier = [operation for operation in self.operations if not operation.done.is_set()]
+            script_uuids = [runtime.script_uuid for runtime in self.registry.running()]
+        for script_uuid in cancelled:
+            self._emit('stopped', script_uuid)
+        return self.stop_many(script_uuids, on_progress, after=earlier)
+
+    def stop_many(self, script_uuids, on_progress=None, restart=False, after=()):
+        """Останавливает скрипты параллельно, не блокируя вызывающий поток.
+
+        Всей группе процессов каждого скрипта сразу отправляется SIGTERM;
+        тем, кто не завершился за отведённое время, - SIGKILL. С restart=True каждый скрипт
+        ставится в очередь запусков, как только завершился его процесс; не
+        запущенные скрипты - сразу. Операция завершается не раньше
+        операций after. Возвращает StopOperation.
+        """
+        targets = []
+        now = time.monotonic()
+        with self._lock:
+            for script_uuid in script_uuids:
+                self._cancel_restart(script_uuid)
+                self.launcher.cancel(script_uuid)
+                self.auto_restarting.discard(script_uuid)
+                runtime = self.registry.get(script_uuid)
+                if runtime is None or script_uuid in self.stopping:
+                    continue
+                if not runtime.process:
+                    if restart:
+                        targets.append((script_uuid, None, now))
+                    continue
+                self.stopping.add(script_uuid)
+                signal_process_tree(runtime.process)
+                targets.append((script_uuid, runtime.process, now + self.grace_period(script_uuid)))
+
+        operation = StopOperation([target[0] for target in targets], on_progress)
+        with self._lock:
+            self.operations.add(operation)
+        for script_uuid, process, _ in targets:
+            if process is not None:
+                self._emit('stopping', script_uuid)
+        threading.Thread(target=self._reap, args=(operation, targets, restart, after),
+                         name="StopOperation", daemon=True).start()
+        return operation
+
+    def restart_many(self, script_uuids, on_progress=None):
+        return self.stop_many(script_uuids, on_progress, restart=True)
+
+    def _reap(self, operation, targets, restart, after=()):
+        """Ждёт завершения всех процессов операции одним потоком"""
+        pending = targets
+        while True:
+            still_running = []
+            now = time.monotonic()
+            for script_uuid, process, deadline in pending:
+                # Скрипт остановлен, когда завершилась вся его группа процессов;
+                # после SIGKILL в группе могут оставаться только зомби
+                if process is None or (process.poll() is not None and (
+                        script_uuid in operation.killed or not process_group_alive(process))):
+                    self._finish_stop(operation, script_uuid, process, restart)
+                    continue
+                if now >= deadline and script_uuid not in operation.killed:
+                    signal_process_tree(process, kill=True)
+                    operation.killed.append(script_uuid)
+                still_running.append((script_uuid, process, deadline))
+            pending = still_running
+            if not pending:
+                break
+            time.sleep(STOP_POLL_INTERVAL)
+        for earlier in after:
+            earlier.wait()
+        with self._lock:
+            self.operations.discard(operation)
+        operation.done.set()
+
+    def _finish_stop(self, operation, script_uuid, process, restart):
+        with self._lock:
+            self.stopping.discard(script_uuid)
+            runtime = self.registry.get(script_uuid)
+            if process is not None and runtime is not None and runtime.process is process:
+                self.registry.set_process(script_uuid, None)
+                self.launcher.on_exit(script_uuid)
+                self.cgroups.release(script_uuid)
+                self.affinity.release(script_uuid)
+        if process is not None:
+            self._update_sampler_targets()
+            self._emit('stopped', script_uuid)
+        if restart and runtime is not None:
+            # Через очередь: соблюдаются лимит одновременных запусков, приоритеты и depends_on
+            self.enqueue_start([script_uuid])
+        operation.stopped.append(script_uuid)
+        operation._progress()
+
+    def send_input(self, script_uuid, text):
+        """Передаёт строку на stdin скрипта"""
+        runtime = self.registry.get(script_uuid)
+        process = runtime.process if runtime else None
+        if process is None or process.poll() is not None:
+            raise RuntimeError("Скрипт не запущен")
+        process.stdin.write((text + '\n').encode('utf-8'))
+        process.stdin.flush()
+
+    def monitor_script_output(self, runtime):
+        """Передаёт вывод скрипта общему насосу вывода"""
+        process = runtime.process
+        script_uuid = runtime.script_uuid
+        scrollback = self.scrollbacks[script_uuid]
+
+        log = None
+        if self.script_logs.enabled():
+            try:
+                log = self.script_logs.open(script_uuid)
+                log.write(f"=== Запуск {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} (PID {process.pid}) ===\n")
+            except OSError as e:
+                print(f"Ошибка открытия журнала: {e}")
+                log = None
+
+        counters = self.counters(script_uuid)
+
+        def on_output(decoded):
+            counters['output_bytes'] += len(decoded.encode('utf-8', 'replace'))
+            counters['output_lines'] += decoded.count('\n')
+            scrollback.append(decoded)
+            self.launcher.on_output(script_uuid, decoded)
+            if log is not None:
+                log.write(decoded)
+            self._emit('output', script_uuid, decoded)
+
+        def on_exit(returncode):
+            if log is not None:
+                log.write(f"=== Завершён с кодом {returncode} ===\n")
+                log.flush()
+            self.on_script_exit(script_uuid, process, returncode)
+
+        self.output_pump.register(process, on_output, on_exit)
+
+    def on_script_exit(self, script_uuid, process, returncode):
+        with self._lock:
+            runtime = self.registry.get(script_uuid)
+            if runtime is None or runtime.process is not process or script_uuid in self.stopping:
+                # Скрипт уже остановлен, перезапущен, убран из активных
+                # или его остановку завершит StopOperation
+                return
+            runtime.is_running = False
+            self.exit_codes[script_uuid] = returncode
+        if 'memory' in self.watchdog.enforced.get(script_uuid, ()) and self.watchdog.take_oom_kills(script_uuid):
+            # memory.events читается до удаления группы
+            limit = float(script_limits(runtime.script_info).get('max_memory_mb', 0))
+            self.limit_exceeded(script_uuid, 'oom', limit, limit, act=False)
+        self.launcher.on_exit(script_uuid)
+        self.cgroups.release(script_uuid)
+        self.affinity.release(script_uuid)
+        self._update_sampler_targets()
+        self._emit('exited', script_uuid, returncode)
+        self._schedule_restart(runtime, returncode)
+
+    def _check_runtime(self, script_uuid, process):
+        runtime = self.registry.get(script_uuid)
+        if runtime is None or runtime.process is not process or not runtime.is_running:
+            return
+        limit = float(script_limits(runtime.script_info).get('max_runtime', 0))
+        self.limit_exceeded(script_uuid, 'runtime', limit, limit)
+
+    def limit_exceeded(self, script_uuid, kind, value, limit, act=True):
+        """Реагирует на превышение лимита действием из настроек скрипта.
+
+        С act=False только сообщает: скрипт уже завершён (например, его
+        процесс убил OOM), а перезапуском займётся его политика.
+        """
+        runtime = self.registry.get(script_uuid)
+        if runtime is None:
+            return
+        action = script_limits(runtime.script_info).get('action', 'kill')
+        if action == 'throttle' and kind != 'cpu':
+            # Понижение приоритета не поможет ни памяти, ни времени работы
+            action = 'restart'
+
+        units = {'memory': "МБ", 'oom': "МБ", 'cpu': "%", 'runtime': "с"}[kind]
+        names = {'memory': "памяти", 'oom': "памяти (OOM)", 'cpu': "CPU", 'runtime': "времени работы"}
+        actions = {'kill': "скрипт остановлен", 'restart': "скрипт перезапущен",
+                   'throttle': "приоритет скрипта понижен"}
+        message = (f"Превышен лимит {names[kind]}: {value:.1f} {units} при лимите {limit:g} {units}, "
+                   f"{actions[action] if act else 'процесс завершён ядром'}")
+        breach = {'limit': kind, 'value': value, 'max': limit, 'action': action if act else None,
+                  'time': time.time(), 'message': message}
+        self.limit_breaches[script_uuid] = breach
+        print(f"{runtime.display_name}: {message}")
+        self._notice(script_uuid, f"=== {message} ===\n")
+        self._emit('limit_exceeded', script_uuid, breach)
+
+        if not act:
+            return
+        if action == 'throttle':
+            self.watchdog.throttled.add(script_uuid)
+            try:
+                if HAS_PSUTIL:
+                    psutil.Process(runtime.pid).nice(
+                        THROTTLE_NICE if sys.platform != "win32" else psutil.IDLE_PRIORITY_CLASS)
+                else:
+                    os.setpriority(os.PRIO_PROCESS, runtime.pid, THROTTLE_NICE)
+            except Exception as e:
+                print(f"Не удалось понизить приоритет скрипта {runtime.display_name}: {e}")
+        elif action == 'restart':
+            self.restart_many([script_uuid])
+        else:
+            self.stop_many([script_uuid])
+
+    def _notice(self, script_uuid, text):
+        """Служебное сообщение в вывод скрипта: история, журнал и консоль"""
+        scrollback = self.scrollbacks.get(script_uuid)
+        if scrollback is not None:
+            scrollback.append(text)
+        if self.script_logs.enabled():
+            try:
+                self.script_logs.open(script_uuid).write(text)
+            except OSError:
+                pass
+        self._emit('output', script_uuid, text)
+
+    def _cancel_restart(self, script_uuid):
+        state = self.restarts.get(script_uuid)
+        if state is not None and state.pending is not None:
+            self.scheduler.cancel(state.pending)
+            state.pending = state.next_restart = None
+
+    def _schedule_restart(self, runtime, returncode):
+        """Планирует перезапуск завершившегося скрипта по его политике"""
+        policy = runtime.script_info.get('restart_policy', 'never')
+        if policy == 'never' or (policy == 'on-failure' and returncode == 0):
+            return
+        script_uuid = runtime.script_uuid
+
+        with self._lock:
+            state = self.restarts.setdefault(script_uuid, RestartState())
+            now = time.monotonic()
+            if state.started_at is not None and now - state.started_at >= RESTART_RESET_UPTIME:
+                state.failures = 0
+            while state.restart_times and now - state.restart_times[0] > CRASH_LOOP_WINDOW:
+                state.restart_times.popleft()
+            if len(state.restart_times) >= CRASH_LOOP_RESTARTS:
+                state.crash_loop = True
+            else:
+                delay = restart_delay(
+                    state.failures,
+                    float(self.settings.get('restart_backoff_base', RESTART_BACKOFF_BASE)),
+                    float(self.settings.get('restart_backoff_max', RESTART_BACKOFF_MAX))
+                )
+                state.failures += 1
+                state.restart_times.append(now)
+                state.next_restart = now + delay
+                state.pending = self.scheduler.call_later(delay, self._auto_restart, script_uuid)
+
+        if state.crash_loop:
+            print(f"Скрипт {runtime.display_name} перезапускается слишком часто, автоперезапуск остановлен")
+            self._emit('crashloop', script_uuid, len(state.restart_times))
+        else:
+            self._emit('restarting', script_uuid, delay)
+
+    def _auto_restart(self, script_uuid):
+        with self._lock:
+            state = self.restarts.get(script_uuid)
+            runtime = self.registry.get(script_uuid)
+            if state is None or runtime is None:
+                return
+            state.pending = state.next_restart = None
+            if runtime.is_running or script_uuid in self.stopping:
+                return
+            self.counters(script_uuid)['restarts'] += 1
+            # Ошибку запуска из очереди _launch_failed превратит в следующий перезапуск
+            self.auto_restarting.add(script_uuid)
+        self.launcher.enqueue([script_uuid])
+        self._emit('queued', script_uuid)
+
+    def counters(self, script_uuid):
+        counters = self.script_counters.get(script_uuid)
+        if counters is None:
+            counters = self.script_counters[script_uuid] = {
+                'starts': 0, 'restarts': 0, 'output_bytes': 0, 'output_lines': 0
+            }
+        return counters
+
+    def uptime(self, script_uuid):
+        """Секунды с последнего запуска работающего скрипта или None"""
+        state = self.restarts.get(script_uuid)
+        if not self.is_running(script_uuid) or state is None or state.started_at is None:
+            return None
+        return time.monotonic() - state.started_at
+
+    def restart_status(self, script_uuid):
+        """Состояние автоперезапуска: цикл сбоев и секунды до перезапуска"""
+        state = self.restarts.get(script_uuid)
+        if state is None:
+            return {'crash_loop': False, 'next_restart': None, 'failures': 0}
+        next_restart = state.next_restart
+        return {
+            'crash_loop': state.crash_loop,
+            'next_restart': max(0.0, next_restart - time.monotonic()) if next_restart is not None else None,
+            'failures': state.failures
+        }
+
+    def autostart(self):
+        """Ставит в очередь запуска активные скрипты с флагом autostart"""
+        self.enqueue_start([runtime.script_uuid for runtime in self.registry
+                            if runtime.script_info.get('autostart', False)])
+
+    def scrollback(self, script_uuid):
+        return self.scrollbacks.get(script_uuid)
+
+    def watch(self, script_uuid):
+        """Локальному ядру подписка на вывод не нужна - он приходит событиями"""
+
+    def unwatch(self, script_uuid):
+        pass
+
+    def tail(self, script_uuid, line_count=CONSOLE_HISTORY_LINES):
+        """Последние строки вывода и курсор конца истории"""
+        scrollback = self.scrollbacks.get(script_uuid)
+        if scrollback is None:
+            return '', 0
+        return scrollback.tail(line_count), scrollback.position
+
+    def read_output(self, script_uuid, position):
+        scrollback = self.scrollbacks.get(script_uuid)
+        if scrollback is None:
+            return '', 0
+        return scrollback.read_since(position)
+
+    def status(self):
+        """Состояние всех активных скриптов в виде простых словарей"""
+        with self._lock:
+            return [{
+                'uuid': runtime.script_uuid,
+                'name': runtime.display_name,
+                'path': runtime.script_info.get('path'),
+                'running': runtime.is_running,
+                'stopping': runtime.script_uuid in self.stopping,
+                'queued': runtime.script_uuid in self.launcher.queued,
+                'ready': runtime.script_uuid in self.launcher.ready,
+                'pid': runtime.pid if runtime.is_running else None,
+                'exit_code': self.exit_codes.get(runtime.script_uuid),
+                'restart_policy': runtime.script_info.get('restart_policy', 'never'),
+                'limit_breach': self.limit_breaches.get(runtime.script_uuid),
+                'cpus': self.affinity.assignments.get(runtime.script_uuid) if runtime.is_running else None,
+                'uptime': self.uptime(runtime.script_uuid),
+                **self.counters(runtime.script_uuid),
+                **self.restart_status(runtime.script_uuid)
+            } for runtime in self.registry]
+
+    def latest_snapshot(self):
+        """Новый снимок ресурсов для интерфейса или None"""
+        return self.sampler.latest() if self.sampler else None
+
+    def metrics(self):
+        """Последний снимок ресурсов без изъятия из очереди"""
+        return self.sampler.last_snapshot if self.sampler else None
+
+    def metrics_history(self, script_uuid, tier="1s", since=None):
+        """История метрик скрипта: {'fields', 'step', 'points'}"""
+        if not self.history:
+            return {'fields': list(METRICS_FIELDS), 'step': 0, 'points': []}
+        return self.history.query(script_uuid, tier, since)
+
+    def _save_history(self):
+        self.history.save()
+        self.scheduler.call_later(METRICS_SAVE_INTERVAL, self._save_history)
+
+    def shutdown(self, stop_scripts=True):
+        with self._lock:
+            self.closing = True
+        self.scheduler.stop()
+        self.launcher.stop()
+        if stop_scripts:
+            self.stop_all(final=True).wait()
+        if self.sampler:
+            self.sampler.stop()
+        if self.exporter:
+            self.exporter.stop()
+        if self.history:
+            self.history.save()
+        self.script_logs.close_all()
+
+
+# Файл с адресом и токеном запущенного демона
+DAEMON_STATE_FILE = os.path.join(BASE_PATH, "daemon.json")
+DAEMON_HOST = "127.0.0.1"
+# Таймаут запросов к управляющему API (секунды)
+DAEMON_REQUEST_TIMEOUT = 10
+# Период опроса демона подключённым интерфейсом (секунды)
+REMOTE_POLL_INTERVAL = 0.5
+# Таймаут запросов остановки, которые ждут завершения процессов (секунды)
+DAEMON_STOP_TIMEOUT = 120
+# Сколько запросов остановки интерфейс отправляет демону одновременно
+REMOTE_STOP_JOBS = 16
+
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик управляющего API: JSON поверх HTTP на localhost"""
+
+    server_version = "PSM"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        if self.headers.get('X-PSM-Token') != self.server.token:
+            self.send_json(403, {'error': 'Неверный токен'})
+            return
+
+        parsed = urlparse(self.path)
+        handler = self.server.routes.get((method, parsed.path))
+        if handler is None:
+            self.send_json(404, {'error': f"Неизвестный запрос {method} {parsed.path}"})
+            return
+
+        try:
+            if method == 'POST':
+                length = int(self.headers.get('Content-Length') or 0)
+                params = json.loads(self.rfile.read(length) or b'{}') if length else {}
+            else:
+                params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+            if not isinstance(params, dict):
+                self.send_json(400, {'error': "Тело запроса должно быть JSON-объектом"})
+                return
+            self.send_json(200, handler(params))
+        except KeyError as e:
+            self.send_json(404, {'error': f"Не найдено: {e}"})
+        except (ValueError, TypeError, AttributeError, RuntimeError, OSError) as e:
+            self.send_json(400, {'error': str(e)})
+
+    def send_json(self, code, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ControlServer:
+    """Управляющий API ядра: start, stop, status, tail, metrics и history"""
+
+    def __init__(self, supervisor, host=DAEMON_HOST, port=0, token=None):
+        self.supervisor = supervisor
+        self.token = token or uuid.uuid4().hex
+        self.httpd = ThreadingHTTPServer((host, port), ControlRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.token = self.token
+        self.httpd.routes = {
+            ('GET', '/status'): self.handle_status,
+            ('GET', '/metrics'): self.handle_metrics,
+            ('GET', '/tail'): self.handle_tail,
+            ('GET', '/history'): self.handle_history,
+            ('POST', '/output'): self.handle_output,
+            ('POST', '/start'): self.handle_start,
+            ('POST', '/stop'): self.handle_stop,
+            ('POST', '/restart'): self.handle_restart,
+            ('POST', '/input'): self.handle_input,
+            ('POST', '/activate'): self.handle_activate,
+            ('POST', '/deactivate'): self.handle_deactivate,
+            ('POST', '/update'): self.handle_update,
+            ('POST', '/shutdown'): self.handle_shutdown,
+        }
+        self.shutdown_requested = threading.Event()
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.httpd.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="ControlServer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle_status(self, params):
+        return {'scripts': self.supervisor.status()}
+
+    def handle_metrics(self, params):
+        return self.supervisor.metrics() or {}
+
+    def handle_tail(self, params):
+        text, position = self.supervisor.tail(params['uuid'], int(params.get('lines', CONSOLE_HISTORY_LINES)))
+        return {'text': text, 'position': position}
+
+    def handle_history(self, params):
+        since = params.get('since')
+        return self.supervisor.metrics_history(params['uuid'], params.get('tier', "1s"),
+                                               float(since) if since else None)
+
+    def handle_output(self, params):
+        result = {}
+        for script_uuid, position in params.get('positions', {}).items():
+            text, position = self.supervisor.read_output(script_uuid, int(position))
+            result[script_uuid] = {'text': text, 'position': position}
+        return result
+
+    def handle_start(self, params):
+        script_uuids = params.get('uuids') or [params['uuid']]
+        for script_uuid in script_uuids:
+            if script_uuid not in self.supervisor.registry:
+                raise KeyError(f"Скрипт {script_uuid} не активен")
+        self.supervisor.enqueue_start(script_uuids)
+        return {'ok': True, 'queued': script_uuids}
+
+    def handle_stop(self, params):
+        operation = self.supervisor.stop_many(params.get('uuids') or [params['uuid']])
+        operation.wait()
+        return {'ok': True, 'stopped': operation.stopped, 'killed': operation.killed}
+
+    def handle_restart(self, params):
+        operation = self.supervisor.restart_many(params.get('uuids') or [params['uuid']])
+        operation.wait()
+        return {'ok': True, 'restarted': operation.stopped, 'killed': operation.killed}
+
+    def handle_input(self, params):
+        self.supervisor.send_input(params['uuid'], params['text'])
+        return {'ok': True}
+
+    def handle_activate(self, params):
+        self.supervisor.activate(params['uuid'], params['info'])
+        return {'ok': True}
+
+    def handle_deactivate(self, params):
+        self.supervisor.deactivate(params['uuid'])
+        return {'ok': True}
+
+    def handle_update(self, params):
+        self.supervisor.update_info(params['uuid'], params['info'])
+        return {'ok': True}
+
+    def handle_shutdown(self, params):
+        self.shutdown_requested.set()
+        return {'ok': True}
+
+
+# Адрес встроенного экспортёра метрик Prometheus
+METRICS_EXPORTER_HOST = "127.0.0.1"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def openmetrics_escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Отдаёт готовый текст метрик; psutil и Tk не затрагиваются"""
+
+    server_version = "PSM"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if urlparse(self.path).path not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.exporter.body()
+        self.send_response(200)
+        self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsExporter:
+    """Экспорт метрик скриптов в формате OpenMetrics для Prometheus.
+
+    Текст собирается в потоке ResourceSampler по каждому снимку и
+    кэшируется, а запрос /metrics только отдаёт готовые байты. Поэтому
+    частый опрос не добавляет вызовов psutil и не касается потока Tk.
+    Без psutil текст собирается при запросе из состояния ядра.
+    """
+
+    def __init__(self, supervisor, host=METRICS_EXPORTER_HOST, port=0):
+        self.supervisor = supervisor
+        self.httpd = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.exporter = self
+        self._cached = None
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.httpd.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="MetricsExporter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def update(self, snapshot):
+        """Слушатель ResourceSampler: пересобирает кэш по новому снимку"""
+        self._cached = self.render(snapshot)
+
+    def body(self):
+        cached = self._cached
+        return cached if cached is not None else self.render(self.supervisor.metrics())
+
+    def render(self, snapshot):
+        lines = []
+        samples = snapshot['scripts'] if snapshot else {}
+        if snapshot:
+            system = snapshot['system']
+            sampler = snapshot.get('sampler', {})
+            lines += [
+                "# TYPE psm_sampler_interval_seconds gauge",
+                "# HELP psm_sampler_interval_seconds Текущий период опроса ресурсов, с.",
+                f"psm_sampler_interval_seconds {sampler.get('interval', MONITOR_INTERVAL)}",
+                "# TYPE psm_manager_cpu_percent gauge",
+                "# HELP psm_manager_cpu_percent CPU самого менеджера, % одного ядра.",
+                f"psm_manager_cpu_percent {sampler.get('manager_cpu', 0.0)}",
+            ]
+            lines += [
+                "# TYPE psm_system_cpu_percent gauge",
+                "# HELP psm_system_cpu_percent Загрузка CPU системы, %.",
+                f"psm_system_cpu_percent {system['cpu']}",
+                "# TYPE psm_system_memory_percent gauge",
+                "# HELP psm_system_memory_percent Занятая память системы, %.",
+                f"psm_system_memory_percent {system['memory']}",
+            ]
+
+        families = {}
+
+        def add(name, kind, help_text, labels, value, suffix=""):
+            family = families.setdefault(name, [f"# TYPE {name} {kind}", f"# HELP {name} {help_text}"])
+            family.append(f"{name}{suffix}{{{labels}}} {value}")
+
+        for status in self.supervisor.status():
+            labels = f'script="{openmetrics_escape(status["uuid"])}",name="{openmetrics_escape(status["name"])}"'
+            add("psm_script_up", "gauge", "Скрипт запущен (1) или нет (0).", labels, int(status['running']))
+            add("psm_script_starts", "counter", "Число запусков скрипта.", labels, status['starts'], "_total")
+            add("psm_script_restarts", "counter", "Число автоматических перезапусков.", labels,
+                status['restarts'], "_total")
+            add("psm_script_output_bytes", "counter", "Байты вывода скрипта.", labels,
+                status['output_bytes'], "_total")
+            add("psm_script_output_lines", "counter", "Строки вывода скрипта.", labels,
+                status['output_lines'], "_total")
+            add("psm_script_crash_loop", "gauge", "Автоперезапуск остановлен циклом сбоев.", labels,
+                int(bool(status['crash_loop'])))
+            if status['uptime'] is not None:
+                add("psm_script_uptime_seconds", "gauge", "Время с последнего запуска, с.", labels,
+                    round(status['uptime'], 3))
+            if status['exit_code'] is not None:
+                add("psm_script_exit_code", "gauge", "Код последнего завершения.", labels, status['exit_code'])
+            sample = samples.get(status['uuid'])
+            if status['running'] and sample and sample['alive']:
+                add("psm_script_cpu_percent", "gauge", "Загрузка CPU скриптом, %.", labels, sample['cpu'])
+                add("psm_script_rss_bytes", "gauge", "Резидентная память скрипта, байты.", labels, sample['rss'])
+                add("psm_script_uss_bytes", "gauge", "Уникальная память скрипта, байты.", labels, sample.get('uss', 0))
+                add("psm_script_processes", "gauge", "Процессов в дереве скрипта.", labels,
+                    sample.get('processes', 1))
+                add("psm_script_connections", "gauge", "Открытые сокеты скрипта.", labels,
+                    sample.get('connections', 0))
+                add("psm_script_threads", "gauge", "Число потоков скрипта.", labels, sample.get('threads', 0))
+                add("psm_script_open_fds", "gauge", "Открытые дескрипторы скрипта.", labels, sample.get('fds', 0))
+
+        for family in families.values():
+            lines += family
+        lines.append("# EOF")
+        return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+def read_daemon_state():
+    """Адрес и токен запущенного демона или None"""
+    try:
+        with open(DAEMON_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class DaemonClient:
+    """Клиент управляющего API демона"""
+
+    def __init__(self, state):
+        self.host = state.get('host', DAEMON_HOST)
+        self.port = state['port']
+        self.token = state['token']
+
+    @classmethod
+    def connect(cls):
+        """Клиент к работающему демону или None, если демон не отвечает"""
+        state = read_daemon_state()
+        if not state:
+            return None
+        client = cls(state)
+        try:
+            client.request('GET', '/status')
+        except (OSError, RuntimeError):
+            return None
+        return client
+
+    def request(self, method, path, payload=None, timeout=DAEMON_REQUEST_TIMEOUT):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        try:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else None
+            headers = {'X-PSM-Token': self.token, 'Content-Type': 'application/json'}
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            data = json.loads(response.read() or b'{}')
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RuntimeError(data.get('error', f"HTTP {response.status}"))
+        return data
+
+
+class RemoteProcess:
+    """Процесс, запущенный демоном; известен только его PID"""
+
+    def __init__(self, pid):
+        self.pid = pid
+
+    def poll(self):
+        return None
+
+
+class RemoteSupervisor:
+    """Подключение интерфейса к демону с тем же интерфейсом, что у ScriptSupervisor.
+
+    Фоновый поток опрашивает демон: зеркалирует состояние скриптов в
+    локальный реестр, забирает новый вывод отслеживаемых скриптов и
+    последний снимок ресурсов, и рассылает те же события, что и ядро.
+    Команды (активация, запуск, ввод и т.п.) меняют локальное зеркало
+    сразу, а запросы к демону выполняет тот же поток между опросами,
+    поэтому медленный демон не блокирует интерфейс. Ошибка команды
+    приходит событием 'request_failed' (данные - текст ошибки).
+    """
+
+    is_remote = True
+
+    def __init__(self, client, settings, logs_dir=LOGS_DIR):
+        self.client = client
+        self.settings = settings
+        self.registry = ScriptRegistry()
+        # Журналы пишет демон; локально нужны только пути к ним
+        self.script_logs = ScriptLogManager(logs_dir, settings)
+        self.scrollbacks = {}
+        self.exit_codes = {}
+        self.stopping = set()
+        self.queued = set()
+        self.restart_states = {}
+        self.limit_breaches = {}
+        self._watched = {}
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._snapshots = queue.Queue(maxsize=1)
+        self._stop_event = threading.Event()
+        self._commands = queue.Queue()
+        # Скрипты с невыполненными командами: {script_uuid: число команд}.
+        # Опрос не трогает их в зеркале, пока демон не ответил
+        self._in_flight = {}
+        self.poll_status()
+        threading.Thread(target=self._poll_loop, name="RemoteSupervisor", daemon=True).start()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _emit(self, event, script_uuid, data=None):
+        for listener in list(self._listeners):
+            try:
+                listener(event, script_uuid, data)
+            except Exception as e:
+                print(f"Ошибка обработчика события {event}: {e}")
+
+    def _submit(self, script_uuids, error_text, request, on_result=None):
+        """Ставит запрос к демону о скриптах script_uuids в очередь потока опроса"""
+        with self._lock:
+            for script_uuid in script_uuids:
+                self._in_flight[script_uuid] = self._in_flight.get(script_uuid, 0) + 1
+        self._commands.put((script_uuids, error_text, request, on_result))
+
+    def _run_command(self, script_uuids, error_text, request, on_result):
+        try:
+            result = request()
+        except (OSError, RuntimeError, ValueError) as e:
+            error = e
+        else:
+            error = None
+        with self._lock:
+            for script_uuid in script_uuids:
+                self._in_flight[script_uuid] -= 1
+                if not self._in_flight[script_uuid]:
+                    del self._in_flight[script_uuid]
+        if error is None:
+            if on_result:
+                on_result(result)
+            return
+        print(f"{error_text}: {error}")
+        try:
+            # Локальное зеркало уже изменено - возвращаем его к состоянию демона
+            self.poll_status()
+        except (OSError, RuntimeError, ValueError):
+            pass
+        # Одно событие на запрос: интерфейс показывает одну ошибку и сверяет всю панель
+        self._emit('request_failed', script_uuids[0], f"{error_text}: {error}")
+
+    def _poll_loop(self):
+        next_poll = time.monotonic() + REMOTE_POLL_INTERVAL
+        while not self._stop_event.is_set():
+            try:
+                command = self._commands.get(timeout=max(0.0, next_poll - time.monotonic()))
+            except queue.Empty:
+                command = None
+            if self._stop_event.is_set():
+                break
+            if command is not None:
+                self._run_command(*command)
+                continue
+            next_poll = time.monotonic() + REMOTE_POLL_INTERVAL
+            try:
+                self.poll_status()
+                self.poll_output()
+                snapshot = self.client.request('GET', '/metrics')
+                if snapshot:
+                    try:
+                        self._snapshots.get_nowait()
+                    except queue.Empty:
+                        pass
+                    self._snapshots.put_nowait(snapshot)
+            except (OSError, RuntimeError, ValueError) as e:
+                print(f"Ошибка связи с демоном: {e}")
+
+    def poll_status(self):
+        """Зеркалирует состояние скриптов демона в локальный реестр"""
+        scripts = self.client.request('GET', '/status')['scripts']
+        events = []
+        with self._lock:
+            remote_uuids = set()
+            for item in scripts:
+                script_uuid = item['uuid']
+                remote_uuids.add(script_uuid)
+                if script_uuid in self._in_flight:
+                    continue
+                runtime = self.registry.get(script_uuid)
+                if runtime is None:
+                    runtime = self.registry.add(script_uuid, {'name': item['name'], 'path': item.get('path')})
+                if item.get('queued'):
+                    self.queued.add(script_uuid)
+                elif script_uuid in self.queued:
+                    self.queued.discard(script_uuid)
+                    if not item['running']:
+                        events.append(('stopped', script_uuid, None))
+                if item.get('stopping') and script_uuid not in self.stopping:
+                    self.stopping.add(script_uuid)
+                    events.append(('stopping', script_uuid, None))
+                breach = item.get('limit_breach')
+                if breach and breach != self.limit_breaches.get(script_uuid):
+                    self.limit_breaches[script_uuid] = breach
+                    events.append(('limit_exceeded', script_uuid, breach))
+                restart = {key: item.get(key) for key in ('crash_loop', 'next_restart', 'failures')}
+                previous = self.restart_states.get(script_uuid)
+                self.restart_states[script_uuid] = restart
+                if previous is not None and restart['crash_loop'] and not previous['crash_loop']:
+                    events.append(('crashloop', script_uuid, None))
+                elif (previous is not None and restart['next_restart'] is not None
+                      and previous['next_restart'] is None):
+                    events.append(('restarting', script_uuid, restart['next_restart']))
+                if item['running'] and (not runtime.is_running or runtime.pid != item['pid']):
+                    self.registry.set_process(script_uuid, RemoteProcess(item['pid']))
+                    events.append(('started', script_uuid, item['pid']))
+                elif not item['running'] and runtime.is_running:
+                    self.registry.set_process(script_uuid, None)
+                    self.exit_codes[script_uuid] = item.get('exit_code')
+                    events.append(('exited', script_uuid, item.get('exit_code')))
+            for script_uuid in self.registry.uuids():
+                if script_uuid not in remote_uuids and script_uuid not in self._in_flight:
+                    self.registry.remove(script_uuid)
+        for event in events:
+            self._emit(*event)
+
+    def poll_output(self):
+        with self._lock:
+            # Для None хвост ещё не получен
+            positions = {script_uuid: position for script_uuid, position in self._watched.items()
+                         if position is not None}
+        if not positions:
+            return
+        result = self.client.request('POST', '/output', {'positions': positions})
+        for script_uuid, chunk in result.items():
+            with self._lock:
+                if script_uuid not in self._watched:
+                    continue
+                self._watched[script_uuid] = chunk['position']
+            if chunk['text']:
+                self.scrollbacks[script_uuid].append(chunk['text'])
+                self._emit('output', script_uuid, chunk['text'])
+
+    def set_monitoring(self, enabled):
+        self.monitoring = enabled
+
+    def set_background(self, enabled):
+        """Частотой опроса ресурсов управляет сам демон"""
+
+    def activate(self, script_uuid, script_info):
+        self._submit([script_uuid], "Не удалось активировать скрипт",
+                     lambda: self.client.request('POST', '/activate', {'uuid': script_uuid, 'info': script_info}))
+        with self._lock:
+            return self.registry.add(script_uuid, script_info)
+
+    def deactivate(self, script_uuid):
+        self._submit([script_uuid], "Не удалось деактивировать скрипт",
+                     lambda: self.client.request('POST', '/deactivate', {'uuid': script_uuid}))
+        with self._lock:
+            self.registry.remove(script_uuid)
+
+    def update_info(self, script_uuid, script_info):
+        self._submit([script_uuid], "Не удалось обновить настройки скрипта",
+                     lambda: self.client.request('POST', '/update', {'uuid': script_uuid, 'info': script_info}))
+        with self._lock:
+            self.registry.update_info(script_uuid, script_info)
+
+    def is_running(self, script_uuid):
+        runtime = self.registry.get(script_uuid)
+        return runtime is not None and runtime.is_running
+
+    def start(self, script_uuid):
+        self.enqueue_start([script_uuid])
+        return self.registry.get(script_uuid)
+
+    def enqueue_start(self, script_uuids):
+        if not script_uuids:
+            return
+        script_uuids = list(script_uuids)
+        self._submit(script_uuids, "Не удалось запустить скрипт",
+                     lambda: self.client.request('POST', '/start', {'uuids': script_uuids}))
+        with self._lock:
+            self.queued.update(script_uuids)
+        for script_uuid in script_uuids:
+            self._emit('queued', script_uuid)
+
+    def stop(self, script_uuid):
+        self.stop_many([script_uuid]).wait()
+
+    def stop_many(self, script_uuids, on_progress=None, restart=False):
+        """Останавливает скрипты в демоне параллельными запросами; не блокирует"""
+        operation = StopOperation(script_uuids, on_progress)
+        with self._lock:
+            self.stopping.update(operation.script_uuids)
+        for script_uuid in operation.script_uuids:
+            self._emit('stopping', script_uuid)
+
+        def stop_one(script_uuid):
+            error = None
+            try:
+                result = self.client.request('POST', '/restart' if restart else '/stop',
+                                             {'uuid': script_uuid}, timeout=DAEMON_STOP_TIMEOUT)
+                operation.killed.extend(result.get('killed', []))
+            except (OSError, RuntimeError) as e:
+                error = e
+                print(f"Ошибка остановки скрипта {script_uuid}: {e}")
+            with self._lock:
+                self.stopping.discard(script_uuid)
+                # Если демон не ответил, процесс мог остаться - его состояние уточнит опрос
+                if not restart and error is None:
+                    self.registry.set_process(script_uuid, None)
+            if error is None:
+                self._emit('stopped', script_uuid)
+            else:
+                self._emit('request_failed', script_uuid, f"Не удалось остановить скрипт: {error}")
+            operation.stopped.append(script_uuid)
+            operation._progress()
+
+        def run():
+            if operation.script_uuids:
+                with ThreadPoolExecutor(max_workers=min(REMOTE_STOP_JOBS, operation.total)) as executor:
+                    list(executor.map(stop_one, operation.script_uuids))
+            if restart:
+                self.poll_status()
+            operation.done.set()
+
+        threading.Thread(target=run, name="RemoteStopOperation", daemon=True).start()
+        return operation
+
+    def restart_many(self, script_uuids, on_progress=None):
+        return self.stop_many(script_uuids, on_progress, restart=True)
+
+    def stop_all(self, on_progress=None, final=False):
+        """Останавливает в демоне работающие и ожидающие запуска скрипты"""
+        with self._lock:
+            script_uuids = [runtime.script_uuid for runtime in self.registry.running()]
+            script_uuids += [script_uuid for script_uuid in self.queued if script_uuid not in script_uuids]
+        return self.stop_many(script_uuids, on_progress)
+
+    def restart_status(self, script_uuid):
+        return self.restart_states.get(script_uuid) or {'crash_loop': False, 'next_restart': None, 'failures': 0}
+
+    def autostart(self):
+        """Автозапуском скриптов занимается сам демон"""
+
+    def send_input(self, script_uuid, text):
+        self._submit([script_uuid], "Не удалось отправить ввод",
+                     lambda: self.client.request('POST', '/input', {'uuid': script_uuid, 'text': text}))
+
+    def scrollback(self, script_uuid):
+        return self.scrollbacks.get(script_uuid)
+
+    def watch(self, script_uuid):
+        """Начинает получать вывод скрипта; история из хвоста демона приходит событием 'output'"""
+        scrollback = OutputScrollback(
+            self.settings.get('scrollback_max_lines', SCROLLBACK_MAX_LINES),
+            self.settings.get('scrollback_max_bytes', SCROLLBACK_MAX_BYTES)
+        )
+        with self._lock:
+            self.scrollbacks[script_uuid] = scrollback
+            self._watched[script_uuid] = None
+
+        def on_tail(data):
+            with self._lock:
+                if script_uuid not in self._watched:
+                    return
+                self._watched[script_uuid] = data['position']
+            if data['text']:
+                scrollback.append(data['text'])
+                self._emit('output', script_uuid, data['text'])
+
+        self._submit([script_uuid], "Не удалось получить вывод скрипта",
+                     lambda: self.client.request('GET', f'/tail?uuid={script_uuid}&lines={CONSOLE_HISTORY_LINES}'),
+                     on_tail)
+
+    def unwatch(self, script_uuid):
+        with self._lock:
+            self._watched.pop(script_uuid, None)
+
+    def latest_snapshot(self):
+        try:
+            return self._snapshots.get_nowait()
+        except queue.Empty:
+            return None
+
+    def metrics(self):
+        return self.client.request('GET', '/metrics')
+
+    def metrics_history(self, script_uuid, tier="1s", since=None):
+        path = f'/history?uuid={script_uuid}&tier={tier}'
+        if since is not None:
+            path += f'&since={since}'
+        return self.client.request('GET', path)
+
+    def shutdown(self, stop_scripts=False):
+        """Отключается от демона; скрипты продолжают работать в нём"""
+        self._stop_event.set()
+        self._commands.put(None)
+
+
+# Период сброса накопленного вывода в консоль (миллисекунды)
+CONSOLE_FLUSH_MS = 50
+# Максимум строк в виджете консоли, старые строки удаляются
+CONSOLE_MAX_LINES = 5000
+
+
+class ConsoleDialog(tk.Toplevel):
+    def __init__(self, parent, script_name, on_input, theme="light", max_lines=CONSOLE_MAX_LINES,
+                 log_path=None, on_search=None, on_close=None):
+        super().__init__(parent)
+        self.theme = theme
+        self.colors = THEMES.get(theme, THEMES["light"])
+        self.script_name = script_name
+        # Передаёт строку на stdin скрипта; бросает исключение, если скрипт не запущен
+        self.on_input = on_input
+        self.max_lines = max_lines
+        self.log_path = log_path
+        self.on_search = on_search
+        # Владелец отписывается от вывода и закрывает окно; без него - просто destroy
+        self.on_close = on_close
+        self.closed = False
+
+        # Вывод копится здесь из любых потоков и сбрасывается в Text пачкой
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_job = None
+
+        self.title(f"Консоль: {script_name}")
+        self.geometry("800x600")
+        
+        # Для macOS убираем topmost
+        if sys.platform != "darwin":
+            self.attributes('-topmost', True)
+        
+        self.setup_ui()
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self._flush_job = self.after(CONSOLE_FLUSH_MS, self.flush_output)
+
+    def setup_ui(self):
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        output_frame = ttk.LabelFrame(main_frame, text="Вывод консоли", padding=5)
+        output_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+
+        self.output_text = tk.Text(
+            output_frame,
+            wrap=tk.WORD,
+            bg=self.colors["console_bg"],
+            fg=self.colors["console_fg"],
+            font=("Menlo" if sys.platform == "darwin" else "Consolas", 10),
+            insertbackground=self.colors["console_fg"],
+            state=tk.DISABLED
+        )
+
+        scrollbar = ttk.Scrollbar(output_frame, orient=tk.VERTICAL, command=self.output_text.yview)
+        self.output_text.configure(yscrollcommand=scrollbar.set)
+
+        self.output_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        input_frame = ttk.Frame(main_frame)
+        input_frame.pack(fill=tk.X, pady=(0, 10))
+
+        ttk.Label(input_frame, text="Ввод:").pack(side=tk.LEFT, padx=(0, 5))
+        self.input_entry = ttk.Entry(input_frame)
+        self.input_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        self.input_entry.bind('<Return>', self.send_input)
+        ttk.Button(input_frame, text="Отправить", command=self.send_input).pack(side=tk.RIGHT)
+
+        buttons_frame = ttk.Frame(main_frame)
+        buttons_frame.pack(fill=tk.X)
+        ttk.Button(buttons_frame, text="Очистить вывод", command=self.clear_output).pack(side=tk.LEFT)
+        self.autoscroll_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(buttons_frame, text="Автопрокрутка",
+                        variable=self.autoscroll_var).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(buttons_frame, text="Закрыть", command=self.close).pack(side=tk.RIGHT)
+        if self.log_path:
+            ttk.Button(buttons_frame, text="Открыть журнал",
+                       command=self.open_log_viewer).pack(side=tk.RIGHT, padx=(0, 5))
+        if self.on_search:
+            ttk.Button(buttons_frame, text="Поиск",
+                       command=self.on_search).pack(side=tk.RIGHT, padx=(0, 5))
+
+        self.output_text.tag_configure("highlight", background="#555500")
+
+    def close(self):
+        """Закрытие кнопкой и крестиком окна"""
+        if self.on_close:
+            self.on_close()
+        else:
+            self.destroy()
+
+    def destroy(self):
+        with self._pending_lock:
+            self.closed = True
+            self._pending = []
+        if self._flush_job:
+            self.after_cancel(self._flush_job)
+            self._flush_job = None
+        super().destroy()
+
+    def open_log_viewer(self):
+        """Открывает полный журнал скрипта в просмотрщике"""
+        if not self.log_path or not os.path.exists(self.log_path):
+            messagebox.showinfo("Журнал", "Журнал скрипта пока пуст", parent=self)
+            return
+        try:
+            return LogViewerDialog(self, self.script_name, self.log_path, self.theme)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Ошибка", f"Не удалось открыть журнал: {str(e)}", parent=self)
+
+    def clear_output(self):
+        with self._pending_lock:
+            self._pending = []
+        self.output_text.config(state=tk.NORMAL)
+        self.output_text.delete(1.0, tk.END)
+        self.output_text.config(state=tk.DISABLED)
+
+    def send_input(self, event=None):
+        input_text = self.input_entry.get()
+        if input_text:
+            try:
+                self.on_input(input_text)
+                self.append_text(f"> {input_text}\n")
+                self.input_entry.delete(0, tk.END)
+            except Exception as e:
+                self.append_text(f"Ошибка ввода: {str(e)}\n")
+
+    def append_text(self, text):
+        """Ставит текст в очередь вывода; безопасно вызывать из любого потока"""
+        with self._pending_lock:
+            # Вывод в закрытое окно некому показать
+            if not self.closed:
+                self._pending.append(text)
+
+    def flush_output(self):
+        """Периодически вставляет накопленный вывод одной операцией"""
+        self.flush_pending()
+        self._flush_job = self.after(CONSOLE_FLUSH_MS, self.flush_output)
+
+    def flush_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+
+        if pending:
+            text = ''.join(pending)
+            if text.count('\n') > self.max_lines:
+                # Всё равно будет обрезано - не вставляем лишнего
+                text = '\n'.join(text.split('\n')[-(self.max_lines + 1):])
+            self.insert_output([text])
+
+    def insert_output(self, chunks):
+        self.output_text.config(state=tk.NORMAL)
+        for chunk in chunks:
+            self.output_text.insert(tk.END, chunk)
+        self.trim_output()
+        if self.autoscroll_var.get():
+            self.output_text.see(tk.END)
+        self.output_text.config(state=tk.DISABLED)
+
+    def trim_output(self):
+        """Удаляет самые старые строки сверх лимита виджета"""
+        line_count = int(self.output_text.index('end-1c').split('.')[0])
+        excess = line_count - self.max_lines
+        if excess > 0:
+            self.output_text.delete('1.0', f'{excess + 1}.0')
+
+    def goto_text(self, text):
+        """Прокручивает консоль к последней строке с заданным текстом"""
+        self.flush_pending()
+        index = self.output_text.search(text, tk.END, stopindex="1.0", backwards=True, exact=True)
+        if not index:
+            return False
+        self.autoscroll_var.set(False)
+        self.output_text.tag_remove("highlight", "1.0", tk.END)
+        self.output_text.tag_add("highlight", f"{index} linestart", f"{index} lineend")
+        self.output_text.see(index)
+        return True
+
+    def load_historical_output(self, scrollback, line_count=CONSOLE_HISTORY_LINES):
+        """Показывает последние строки из истории вывода скрипта"""
+        chunks = scrollback.tail_chunks(min(line_count, self.max_lines))
+        if chunks:
+            self.insert_output(chunks)
+
+
+# Сколько строк сверх видимых вставлять в просмотрщик журнала
+LOG_VIEW_MARGIN = 20
+# Период проверки роста файла и прогресса индексации (миллисекунды)
+LOG_VIEW_REFRESH_MS = 500
+
+
+class LogViewerDialog(tk.Toplevel):
+    """Просмотр файла журнала любого размера.
+
+    Файл отображается через mmap, а в Text вставляются только видимые
+    строки и небольшой запас, поэтому открытие и прокрутка не зависят
+    от размера журнала. Позиция хранится как смещение в байтах, а номера
+    строк берутся из разреженного индекса, который строится в фоне.
+    """
+
+    def __init__(self, parent, script_name, log_path, theme="light"):
+        super().__init__(parent)
+        self.colors = THEMES.get(theme, THEMES["light"])
+        self.log_path = log_path
+        self.index = LogLineIndex(log_path)
+        self.index.start_indexing()
+        self.top = 0
+        self._refresh_job = None
+
+        self.title(f"Журнал: {script_name}")
+        self.geometry("900x600")
+        self.transient(parent)
+
+        self.setup_ui()
+        self.update_idletasks()
+        self.scroll_to_end()
+        self._refresh_job = self.after(LOG_VIEW_REFRESH_MS, self.refresh)
+
+    def setup_ui(self):
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        output_frame = ttk.Frame(main_frame)
+        output_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+
+        self.text_font = tkfont.Font(family="Menlo" if sys.platform == "darwin" else "Consolas", size=10)
+        self.output_text = tk.Text(
+            output_frame,
+            wrap=tk.NONE,
+            bg=self.colors["console_bg"],
+            fg=self.colors["console_fg"],
+            font=self.text_font,
+            state=tk.DISABLED
+        )
+        self.output_text.tag_configure("highlight", background="#555500")
+
+        self.v_scrollbar = ttk.Scrollbar(output_frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        h_scrollbar = ttk.Scrollbar(output_frame, orient=tk.HORIZONTAL, command=self.output_text.xview)
+        self.output_text.configure(xscrollcommand=h_scrollbar.set)
+
+        self.output_text.grid(row=0, column=0, sticky="nsew")
+        self.v_scrollbar.grid(row=0, column=1, sticky="ns")
+        h_scrollbar.grid(row=1, column=0, sticky="ew")
+        output_frame.rowconfigure(0, weight=1)
+        output_frame.columnconfigure(0, weight=1)
+
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.output_text.bind(sequence, self.on_mouse_wheel)
+        self.bind("<Prior>", lambda e: self.scroll_lines(-self.visible_lines()))
+        self.bind("<Next>", lambda e: self.scroll_lines(self.visible_lines()))
+        self.bind("<Up>", lambda e: self.scroll_lines(-1))
+        self.bind("<Down>", lambda e: self.scroll_lines(1))
+        self.bind("<Home>", lambda e: self.scroll_to(0))
+        self.bind("<End>", lambda e: self.scroll_to_end())
+        self.output_text.bind("<Configure>", lambda e: self.render())
+
+        buttons_frame = ttk.Frame(main_frame)
+        buttons_frame.pack(fill=tk.X)
+        self.follow_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(buttons_frame, text="Следить за концом файла",
+                        variable=self.follow_var).pack(side=tk.LEFT)
+        self.status_label = ttk.Label(buttons_frame, text="")
+        self.status_label.pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(buttons_frame, text="Закрыть", command=self.destroy).pack(side=tk.RIGHT)
+
+    def destroy(self):
+        if self._refresh_job:
+            self.after_cancel(self._refresh_job)
+            self._refresh_job = None
+        self.index.close()
+        super().destroy()
+
+    def visible_lines(self):
+        height = self.output_text.winfo_height()
+        return max(1, height // max(1, self.text_font.metrics('linespace')))
+
+    def render(self):
+        """Вставляет в Text только видимое окно строк"""
+        text, end = self.index.read_lines(self.top, self.visible_lines() + LOG_VIEW_MARGIN)
+        self.output_text.config(state=tk.NORMAL)
+        self.output_text.delete('1.0', tk.END)
+        self.output_text.insert('1.0', text)
+        self.output_text.config(state=tk.DISABLED)
+
+        size = self.index.size or 1
+        visible_end = self.index.forward(self.top, self.visible_lines())
+        if visible_end <= self.top:
+            visible_end = end
+        self.v_scrollbar.set(self.top / size, max(visible_end, self.top) / size)
+        self.update_status()
+
+    def update_status(self):
+        line = self.index.line_number(self.top)
+        total = self.index.total_lines()
+        if total is None:
+            status = f"Индексация: {self.index.progress * 100:.0f}%"
+        else:
+            status = f"Строк: {total}"
+        if line is not None:
+            status = f"Строка {line + 1}. {status}"
+        self.status_label.config(text=f"{status}. Размер: {self.index.size / (1024 * 1024):.1f} МБ")
+
+    def scroll_to(self, offset):
+        self.top = self.index.line_start(offset)
+        self.follow_var.set(self.top >= self.index.last_lines_offset(self.visible_lines()))
+        self.render()
+
+    def scroll_to_end(self):
+        self.top = self.index.last_lines_offset(self.visible_lines())
+        self.render()
+
+    def scroll_lines(self, count):
+        if count > 0:
+            self.top = self.index.forward(self.top, count)
+            # Не уходим за последний экран
+            self.top = min(self.top, self.index.last_lines_offset(self.visible_lines()))
+        elif count < 0:
+            self.top = self.index.backward(self.top, -count)
+        self.follow_var.set(self.top >= self.index.last_lines_offset(self.visible_lines()))
+        self.render()
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == tk.MOVETO:
+            self.scroll_to(int(float(value) * self.index.size))
+        elif action == tk.SCROLL:
+            step = self.visible_lines() if unit == tk.PAGES else 1
+            self.scroll_lines(int(value) * step)
+
+    def on_mouse_wheel(self, event):
+        if event.num == 4:
+            self.scroll_lines(-3)
+        elif event.num == 5:
+            self.scroll_lines(3)
+        else:
+            delta = event.delta if sys.platform == "darwin" else event.delta // 120
+            self.scroll_lines(-delta * 3)
+        return "break"
+
+    def goto_line(self, line):
+        """Показывает строку line (с 0) и подсвечивает её"""
+        offset = self.index.offset_of_line(line)
+        if offset is None:
+            # Индекс ещё не дошёл до нужного места - повторим позже
+            self.after(LOG_VIEW_REFRESH_MS, self.goto_line, line)
+            return
+        self.follow_var.set(False)
+        self.top = self.index.backward(offset, self.visible_lines() // 2)
+        self.render()
+        row = self.index.line_number(offset) - self.index.line_number(self.top) + 1
+        self.output_text.tag_add("highlight", f"{row}.0", f"{row}.end")
+
+    def refresh(self):
+        """Подхватывает дописанные строки и обновляет прогресс индексации"""
+        try:
+            if self.index.is_replaced():
+                # После поворота старый файл переименован и позже сжимается - открываем новый
+                index = LogLineIndex(self.log_path)
+                self.index.close()
+                self.index = index
+                self.index.start_indexing()
+                self.top = 0
+                if self.follow_var.get():
+                    self.scroll_to_end()
+                else:
+                    self.render()
+            elif self.index.remap():
+                self.index.start_indexing()
+                if self.follow_var.get():
+                    self.scroll_to_end()
+            self.update_status()
+        except (OSError, ValueError) as e:
+            print(f"Ошибка чтения журнала: {e}")
+        self._refresh_job = self.after(LOG_VIEW_REFRESH_MS, self.refresh)
+
+
+# Период опроса результатов фонового поиска (миллисекунды)
+SEARCH_POLL_MS = 100
+
+
+class SearchDialog(tk.Toplevel):
+    """Поиск по истории вывода одного или всех скриптов.
+
+    Поиск выполняется в пуле потоков, результаты забираются из очереди
+    по таймеру и добавляются в список по мере готовности.
+    """
+
+    def __init__(self, parent, scripts, search_function, on_open_result,
+                 script_uuid=None, theme="light"):
+        super().__init__(parent)
+        self.colors = THEMES.get(theme, THEMES["light"])
+        self.scripts = scripts
+        self.search_function = search_function
+        self.on_open_result = on_open_result
+        self.script_uuid = script_uuid
+        self.results = {}
+        self._queue = queue.Queue()
+        self._stop_event = None
+        self._poll_job = None
+        self._pending_jobs = 0
+
+        self.title("Поиск в выводе скриптов")
+        self.geometry("900x500")
+        self.transient(parent)
+
+        self.init_ui()
+
+    def init_ui(self):
         main_frame = ttk.Frame(self, padding=10)
         main_frame.pack(fill=tk.BOTH, expand=True)
 
-        output_frame = ttk.LabelFrame(main_frame, text="Вывод консоли", padding=5)
-        output_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        query_frame = ttk.Frame(main_frame)
+        query_frame.pack(fill=tk.X, pady=(0, 5))
 
-        self.output_text = tk.Text(
-            output_frame,
-            wrap=tk.WORD,
-            bg=self.colors["console_bg"],
-            fg=self.colors["console_fg"],
-            font=("Menlo" if sys.platform == "darwin" else "Consolas", 10),
-            insertbackground=self.colors["console_fg"],
-            state=tk.DISABLED
-        )
+        ttk.Label(query_frame, text="Искать:").pack(side=tk.LEFT, padx=(0, 5))
+        self.query_var = tk.StringVar()
+        query_entry = ttk.Entry(query_frame, textvariable=self.query_var)
+        query_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        query_entry.bind('<Return>', lambda e: self.start_search())
+        query_entry.focus_set()
+        ttk.Button(query_frame, text="Найти", command=self.start_search).pack(side=tk.LEFT, padx=2)
+        ttk.Button(query_frame, text="Стоп", command=self.stop_search).pack(side=tk.LEFT, padx=2)
 
-        scrollbar = ttk.Scrollbar(output_frame, orient=tk.VERTICAL, command=self.output_text.yview)
-        self.output_text.configure(yscrollcommand=scrollbar.set)
+        options_frame = ttk.Frame(main_frame)
+        options_frame.pack(fill=tk.X, pady=(0, 5))
+        self.regex_var = tk.BooleanVar(value=False)
+        self.case_var = tk.BooleanVar(value=False)
+        self.all_scripts_var = tk.BooleanVar(value=self.script_uuid is None)
+        ttk.Checkbutton(options_frame, text="Регулярное выражение",
+                        variable=self.regex_var).pack(side=tk.LEFT)
+        ttk.Checkbutton(options_frame, text="Учитывать регистр",
+                        variable=self.case_var).pack(side=tk.LEFT, padx=(10, 0))
+        all_check = ttk.Checkbutton(options_frame, text="Во всех скриптах",
+                                    variable=self.all_scripts_var)
+        all_check.pack(side=tk.LEFT, padx=(10, 0))
+        if self.script_uuid is None:
+            all_check.config(state=tk.DISABLED)
 
-        self.output_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        tree_frame = ttk.Frame(main_frame)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.results_tree = ttk.Treeview(tree_frame, columns=("script", "source", "line", "text"),
+                                         show="headings")
+        self.results_tree.heading("script", text="Скрипт")
+        self.results_tree.heading("source", text="Источник")
+        self.results_tree.heading("line", text="Строка")
+        self.results_tree.heading("text", text="Текст")
+        self.results_tree.column("script", width=140)
+        self.results_tree.column("source", width=110)
+        self.results_tree.column("line", width=70, anchor=tk.E)
+        self.results_tree.column("text", width=500)
+
+        scrollbar = ttk.Scrollbar(tree_frame, orient=tk.VERTICAL, command=self.results_tree.yview)
+        self.results_tree.configure(yscrollcommand=scrollbar.set)
+        self.results_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.results_tree.bind("<Double-Button-1>", self.open_selected)
 
-        input_frame = ttk.Frame(main_frame)
-        input_frame.pack(fill=tk.X, pady=(0, 10))
+        bottom_frame = ttk.Frame(main_frame)
+        bottom_frame.pack(fill=tk.X, pady=(5, 0))
+        self.status_label = ttk.Label(bottom_frame, text="")
+        self.status_label.pack(side=tk.LEFT)
+        ttk.Button(bottom_frame, text="Закрыть", command=self.destroy).pack(side=tk.RIGHT)
 
-        ttk.Label(input_frame, text="Ввод:").pack(side=tk.LEFT, padx=(0, 5))
-        self.input_entry = ttk.Entry(input_frame)
-        self.input_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
-        self.input_entry.bind('<Return>', self.send_input)
-        ttk.Button(input_frame, text="Отправить", command=self.send_input).pack(side=tk.RIGHT)
+    def destroy(self):
+        self.stop_search()
+        super().destroy()
 
-        buttons_frame = ttk.Frame(main_frame)
-        buttons_frame.pack(fill=tk.X)
-        ttk.Button(buttons_frame, text="Очистить вывод", command=self.clear_output).pack(side=tk.LEFT)
-        ttk.Button(buttons_frame, text="Закрыть", command=self.destroy).pack(side=tk.RIGHT)
+    def start_search(self):
+        query = self.query_var.get()
+        if not query:
+            return
+        try:
+            search = OutputSearch(query, regex=self.regex_var.get(), case_sensitive=self.case_var.get())
+        except re.error as e:
+            messagebox.showerror("Ошибка", f"Неверное регулярное выражение: {str(e)}", parent=self)
+            return
 
-    def clear_output(self):
-        self.output_text.config(state=tk.NORMAL)
-        self.output_text.delete(1.0, tk.END)
-        self.output_text.config(state=tk.DISABLED)
+        self.stop_search()
+        self.results_tree.delete(*self.results_tree.get_children())
+        self.results = {}
 
-    def send_input(self, event=None):
-        input_text = self.input_entry.get()
-        if input_text and self.process and self.process.poll() is None:
+        if self.all_scripts_var.get() or self.script_uuid is None:
+            targets = list(self.scripts)
+        else:
+            targets = [(script_uuid, name) for script_uuid, name in self.scripts
+                       if script_uuid == self.script_uuid]
+
+        self._stop_event = threading.Event()
+        self._queue = queue.Queue()
+        self._pending_jobs = len(targets)
+        self.status_label.config(text="Поиск...")
+        threading.Thread(target=self._run_search, args=(search, targets, self._stop_event, self._queue),
+                         daemon=True).start()
+        self._poll_job = self.after(SEARCH_POLL_MS, self.poll_results)
+
+    def _run_search(self, search, targets, stop_event, results_queue):
+        def search_one(target):
+            script_uuid, name = target
             try:
-                self.process.stdin.write((input_text + '\n').encode('utf-8'))
-                self.process.stdin.flush()
-                self.append_text(f"> {input_text}\n")
-                self.input_entry.delete(0, tk.END)
+                results = self.search_function(search, script_uuid, stop_event)
             except Exception as e:
-                self.append_text(f"Ошибка ввода: {str(e)}\n")
+                print(f"Ошибка поиска: {e}")
+                results = []
+            results_queue.put((name, results))
 
-    def append_text(self, text):
-        self.output_text.config(state=tk.NORMAL)
-        self.output_text.insert(tk.END, text)
-        self.output_text.see(tk.END)
-        self.output_text.config(state=tk.DISABLED)
+        with ThreadPoolExecutor(max_workers=SEARCH_WORKERS) as pool:
+            list(pool.map(search_one, targets))
+
+    def poll_results(self):
+        self._poll_job = None
+        while True:
+            try:
+                name, results = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._pending_jobs -= 1
+            for result in results:
+                source = "история" if result['source'] == 'scrollback' else os.path.basename(result['source'])
+                item = self.results_tree.insert("", "end", values=(name, source, result['line'] + 1,
+                                                                   result['text'][:500]))
+                self.results[item] = result
 
-    def load_historical_output(self, historical_output):
-        if historical_output:
-            self.append_text(historical_output)
+        if self._pending_jobs > 0 and not self._stop_event.is_set():
+            self.status_label.config(text=f"Поиск... найдено: {len(self.results)}")
+            self._poll_job = self.after(SEARCH_POLL_MS, self.poll_results)
+        else:
+            self.status_label.config(text=f"Найдено: {len(self.results)}")
+
+    def stop_search(self):
+        if self._stop_event:
+            self._stop_event.set()
+        if self._poll_job:
+            self.after_cancel(self._poll_job)
+            self._poll_job = None
+            self.status_label.config(text=f"Остановлено. Найдено: {len(self.results)}")
+
+    def open_selected(self, event=None):
+        selection = self.results_tree.selection()
+        if selection and selection[0] in self.results:
+            self.on_open_result(self.results[selection[0]])
 
 
 class ErrorDialog(tk.Toplevel):
@@ -301,13 +5160,21 @@ class ErrorDialog(tk.Toplevel):
         messagebox.showinfo("Успех", "Ошибка скопирована в буфер обмена")
 
 
+# Подписи режимов распределения по ядрам в настройках
+AFFINITY_MODE_LABELS = {
+    "off": "Выключено",
+    "round-robin": "По кругу",
+    "least-loaded": "На наименее загруженные ядра"
+}
+
+
 class SettingsDialog(tk.Toplevel):
     def __init__(self, parent, settings):
         super().__init__(parent)
         self.settings = settings
         self.parent = parent
         self.title("Настройки Python Script Manager")
-        self.geometry("500x450")
+        self.geometry("500x630")
         self.resizable(False, False)
         self.transient(parent)
         self.grab_set()
@@ -341,6 +5208,11 @@ class SettingsDialog(tk.Toplevel):
         ttk.Checkbutton(autostart_frame, text="Включить мониторинг производительности",
                        variable=self.monitoring_var).pack(anchor=tk.W, pady=(5, 0))
 
+        if HAS_SQLITE:
+            self.sqlite_catalog_var = tk.BooleanVar(value=self.settings.get('catalog_backend') == 'sqlite')
+            ttk.Checkbutton(autostart_frame, text="Хранить каталог в базе SQLite (нужен перезапуск)",
+                           variable=self.sqlite_catalog_var).pack(anchor=tk.W, pady=(5, 0))
+
         interpreter_frame = ttk.LabelFrame(main_frame, text="Интерпретатор Python", padding=10)
         interpreter_frame.pack(fill=tk.X, pady=(0, 10))
 
@@ -355,6 +5227,21 @@ class SettingsDialog(tk.Toplevel):
         ttk.Button(interpreter_frame, text="Показать установленные пакеты",
                   command=self.show_packages).pack(anchor=tk.W, pady=(5, 0))
 
+        affinity_frame = ttk.LabelFrame(main_frame, text="Распределение скриптов по ядрам CPU", padding=10)
+        affinity_frame.pack(fill=tk.X, pady=(0, 10))
+
+        self.affinity_var = tk.StringVar(
+            value=AFFINITY_MODE_LABELS[self.settings.get('affinity_mode', 'off')])
+        ttk.Combobox(affinity_frame, textvariable=self.affinity_var, state="readonly",
+                     values=[AFFINITY_MODE_LABELS[mode] for mode in AFFINITY_MODES]).pack(fill=tk.X)
+
+        exporter_frame = ttk.LabelFrame(main_frame, text="Экспорт метрик Prometheus", padding=10)
+        exporter_frame.pack(fill=tk.X, pady=(0, 10))
+
+        ttk.Label(exporter_frame, text="Порт на localhost (0 - выключен, нужен перезапуск):").pack(side=tk.LEFT)
+        self.exporter_port_var = tk.StringVar(value=str(self.settings.get('metrics_exporter_port') or 0))
+        ttk.Entry(exporter_frame, textvariable=self.exporter_port_var, width=8).pack(side=tk.RIGHT)
+
         buttons_frame = ttk.Frame(main_frame)
         buttons_frame.pack(fill=tk.X, pady=10)
         ttk.Button(buttons_frame, text="Сохранить", command=self.save_settings).pack(side=tk.RIGHT)
@@ -458,13 +5345,124 @@ class SettingsDialog(tk.Toplevel):
             messagebox.showerror("Ошибка", f"Ошибка: {str(e)}")
 
     def save_settings(self):
+        try:
+            exporter_port = int(self.exporter_port_var.get() or 0)
+            if not 0 <= exporter_port <= 65535:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Ошибка", "Порт экспортёра метрик должен быть числом от 0 до 65535", parent=self)
+            return
+        self.settings['metrics_exporter_port'] = exporter_port
         self.settings['default_interpreter'] = self.interpreter_var.get()
         self.settings['performance_monitoring'] = self.monitoring_var.get()
+        self.settings['affinity_mode'] = next(
+            mode for mode in AFFINITY_MODES if AFFINITY_MODE_LABELS[mode] == self.affinity_var.get())
         if hasattr(self, 'autostart_var'):
             self.settings['autostart'] = self.autostart_var.get()
+        if hasattr(self, 'sqlite_catalog_var'):
+            self.settings['catalog_backend'] = 'sqlite' if self.sqlite_catalog_var.get() else 'json'
+        self.destroy()
+
+
+# Поля диалога лимитов: ключ, подпись и преобразование введённого текста
+LIMIT_FIELDS = (
+    ('max_memory_mb', "Память, МБ", float),
+    ('cpu_percent', "CPU, % одного ядра", float),
+    ('cpu_affinity', "Ядра CPU (через запятую)", lambda text: [int(cpu) for cpu in text.split(',') if cpu.strip()]),
+    ('nice', "Приоритет nice (-20..19)", int),
+    ('max_open_files', "Открытых файлов", int),
+    ('max_runtime', "Время работы, с", float),
+)
+
+# Подписи действий при превышении лимита
+LIMIT_ACTION_LABELS = {
+    "kill": "Остановить",
+    "restart": "Перезапустить",
+    "throttle": "Понизить приоритет (только CPU)"
+}
+
+
+class ScriptLimitsDialog(tk.Toplevel):
+    """Диалог лимитов ресурсов скрипта; пустое поле - без лимита"""
+    def __init__(self, parent, limits):
+        super().__init__(parent)
+        self.limits = dict(limits)
+        self.result = None
+
+        self.title("Лимиты ресурсов")
+        self.resizable(False, False)
+        self.transient(parent)
+        self.grab_set()
+
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.vars = {}
+        for row, (key, label, _) in enumerate(LIMIT_FIELDS):
+            value = self.limits.get(key, "")
+            if isinstance(value, list):
+                value = ", ".join(str(cpu) for cpu in value)
+            ttk.Label(main_frame, text=label + ":").grid(row=row, column=0, sticky=tk.W, pady=2)
+            self.vars[key] = tk.StringVar(value=str(value))
+            ttk.Entry(main_frame, textvariable=self.vars[key], width=20).grid(row=row, column=1, sticky=tk.EW, pady=2)
+
+        ttk.Label(main_frame, text="При превышении:").grid(row=len(LIMIT_FIELDS), column=0, sticky=tk.W, pady=2)
+        self.action_var = tk.StringVar(value=LIMIT_ACTION_LABELS[self.limits.get('action', 'kill')])
+        ttk.Combobox(main_frame, textvariable=self.action_var, state="readonly",
+                     values=[LIMIT_ACTION_LABELS[action] for action in LIMIT_ACTIONS]).grid(
+            row=len(LIMIT_FIELDS), column=1, sticky=tk.EW, pady=2)
+
+        buttons_frame = ttk.Frame(main_frame)
+        buttons_frame.grid(row=len(LIMIT_FIELDS) + 1, column=0, columnspan=2, sticky=tk.EW, pady=(10, 0))
+        ttk.Button(buttons_frame, text="Сохранить", command=self.save).pack(side=tk.RIGHT)
+        ttk.Button(buttons_frame, text="Отмена", command=self.destroy).pack(side=tk.RIGHT, padx=(5, 0))
+
+    @staticmethod
+    def check(key, value):
+        """Текст ошибки, если значение лимита вне допустимого диапазона"""
+        if key == 'nice':
+            if not -20 <= value <= 19:
+                return "допустимы значения от -20 до 19"
+        elif key == 'cpu_affinity':
+            cpu_count = os.cpu_count() or 1
+            if not value:
+                return "не указано ни одного ядра"
+            if any(cpu < 0 or cpu >= cpu_count for cpu in value):
+                return f"допустимы номера ядер от 0 до {cpu_count - 1}"
+        elif value <= 0:
+            return "значение должно быть больше нуля"
+        return None
+
+    def save(self):
+        limits = {}
+        for key, label, convert in LIMIT_FIELDS:
+            text = self.vars[key].get().strip()
+            if not text:
+                continue
+            try:
+                limits[key] = convert(text)
+            except ValueError:
+                messagebox.showerror("Ошибка", f"Неверное значение: {label}", parent=self)
+                return
+            error = self.check(key, limits[key])
+            if error:
+                messagebox.showerror("Ошибка", f"{label}: {error}", parent=self)
+                return
+        if limits:
+            limits['action'] = next(action for action in LIMIT_ACTIONS
+                                    if LIMIT_ACTION_LABELS[action] == self.action_var.get())
+        self.result = limits
         self.destroy()
 
 
+# Подписи политик перезапуска в диалоге настроек скрипта
+RESTART_POLICY_LABELS = {
+    "never": "Никогда",
+    "on-failure": "При сбое (код выхода не 0)",
+    "always": "Всегда"
+}
+
+
 class ScriptConfigDialog(tk.Toplevel):
     """Диалог для настройки скрипта"""
     def __init__(self, parent, script_info):
@@ -474,7 +5472,7 @@ class ScriptConfigDialog(tk.Toplevel):
         self.result = None
         
         self.title(f"Настройки скрипта: {script_info.get('display_name', script_info['name'])}")
-        self.geometry("500x350")
+        self.geometry("500x620")
         self.resizable(False, False)
         self.transient(parent)
         self.grab_set()
@@ -512,6 +5510,14 @@ class ScriptConfigDialog(tk.Toplevel):
         
         ttk.Button(interpreter_subframe, text="Обзор", command=self.browse_interpreter).pack(side=tk.RIGHT)
         
+        # Теги для выбора групп скриптов
+        tags_frame = ttk.Frame(main_frame)
+        tags_frame.pack(fill=tk.X, pady=(0, 10))
+
+        ttk.Label(tags_frame, text="Теги (через запятую):").pack(anchor=tk.W)
+        self.tags_var = tk.StringVar(value=", ".join(self.script_info.get('tags', [])))
+        ttk.Entry(tags_frame, textvariable=self.tags_var, width=40).pack(fill=tk.X, pady=(5, 0))
+
         # Автозапуск
         autostart_frame = ttk.Frame(main_frame)
         autostart_frame.pack(fill=tk.X, pady=(0, 10))
@@ -520,12 +5526,50 @@ class ScriptConfigDialog(tk.Toplevel):
         ttk.Checkbutton(autostart_frame, text="Запускать скрипт при старте программы",
                        variable=self.autostart_var).pack(anchor=tk.W)
         
+        # Автоперезапуск
+        restart_frame = ttk.Frame(main_frame)
+        restart_frame.pack(fill=tk.X, pady=(0, 10))
+
+        ttk.Label(restart_frame, text="Перезапуск при завершении:").pack(anchor=tk.W)
+        self.restart_var = tk.StringVar(
+            value=RESTART_POLICY_LABELS[self.script_info.get('restart_policy', 'never')])
+        ttk.Combobox(restart_frame, textvariable=self.restart_var, state="readonly",
+                     values=[RESTART_POLICY_LABELS[policy] for policy in RESTART_POLICIES]).pack(
+            fill=tk.X, pady=(5, 0))
+
+        # Порядок запуска
+        launch_frame = ttk.Frame(main_frame)
+        launch_frame.pack(fill=tk.X, pady=(0, 10))
+
+        ttk.Label(launch_frame, text="Приоритет запуска (больше - раньше):").grid(row=0, column=0, sticky=tk.W)
+        self.priority_var = tk.StringVar(value=str(self.script_info.get('priority', 0)))
+        ttk.Spinbox(launch_frame, from_=-100, to=100, textvariable=self.priority_var, width=8).grid(
+            row=0, column=1, sticky=tk.W, padx=(5, 0))
+
+        ttk.Label(launch_frame, text="Запускать после (имена через запятую):").grid(
+            row=1, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        self.depends_var = tk.StringVar(value=", ".join(self.script_info.get('depends_on', [])))
+        ttk.Entry(launch_frame, textvariable=self.depends_var).grid(row=2, column=0, columnspan=2, sticky=tk.EW)
+
+        ttk.Label(launch_frame, text="Маркер готовности в выводе (пусто - по времени работы):").grid(
+            row=3, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        self.ready_marker_var = tk.StringVar(value=self.script_info.get('ready_marker', ""))
+        ttk.Entry(launch_frame, textvariable=self.ready_marker_var).grid(row=4, column=0, columnspan=2, sticky=tk.EW)
+        launch_frame.columnconfigure(0, weight=1)
+
         # Кнопки
         buttons_frame = ttk.Frame(main_frame)
         buttons_frame.pack(fill=tk.X, pady=(10, 0))
         
+        ttk.Button(buttons_frame, text="Лимиты ресурсов...", command=self.edit_limits).pack(side=tk.LEFT)
         ttk.Button(buttons_frame, text="Сохранить", command=self.save).pack(side=tk.RIGHT)
         ttk.Button(buttons_frame, text="Отмена", command=self.destroy).pack(side=tk.RIGHT, padx=(5, 0))
+
+    def edit_limits(self):
+        dialog = ScriptLimitsDialog(self, self.script_info.get('limits', {}))
+        self.wait_window(dialog)
+        if dialog.result is not None:
+            self.script_info['limits'] = dialog.result
         
     def browse_interpreter(self):
         filetypes = [("All files", "*")]
@@ -540,10 +5584,561 @@ class ScriptConfigDialog(tk.Toplevel):
         self.script_info['display_name'] = self.name_var.get()
         self.script_info['interpreter'] = self.interpreter_var.get()
         self.script_info['autostart'] = self.autostart_var.get()
+        self.script_info['tags'] = [tag.strip() for tag in self.tags_var.get().split(',') if tag.strip()]
+        self.script_info['restart_policy'] = next(
+            policy for policy in RESTART_POLICIES if RESTART_POLICY_LABELS[policy] == self.restart_var.get())
+        try:
+            self.script_info['priority'] = int(self.priority_var.get())
+        except ValueError:
+            self.script_info['priority'] = 0
+        self.script_info['depends_on'] = [name.strip() for name in self.depends_var.get().split(',') if name.strip()]
+        marker = self.ready_marker_var.get().strip()
+        if marker:
+            self.script_info['ready_marker'] = marker
+        else:
+            self.script_info.pop('ready_marker', None)
         self.result = self.script_info
         self.destroy()
 
 
+# Число точек спарклайна в строке скрипта, шаг между ними и высота (пиксели)
+SPARKLINE_POINTS = 60
+SPARKLINE_STEP = 2
+SPARKLINE_HEIGHT = 18
+
+
+class Sparkline(tk.Canvas):
+    """Мини-график последних значений в процентах.
+
+    Новое значение дорисовывается одним отрезком: старые отрезки
+    сдвигаются влево через move(), ушедший за край удаляется. Полная
+    перерисовка нужна только при смене показываемого скрипта.
+    """
+
+    def __init__(self, parent, colors, maximum=100.0):
+        super().__init__(parent, width=(SPARKLINE_POINTS - 1) * SPARKLINE_STEP, height=SPARKLINE_HEIGHT,
+                         bg=colors["progress_bg"], highlightthickness=0)
+        self.maximum = maximum
+        self.line_color = colors["progress_fg"]
+        self._segments = deque()
+        self._last = None
+
+    def set_colors(self, colors):
+        self.line_color = colors["progress_fg"]
+        self.configure(bg=colors["progress_bg"])
+        self.itemconfigure("line", fill=self.line_color)
+
+    def _y(self, value):
+        value = min(max(value, 0.0), self.maximum)
+        return SPARKLINE_HEIGHT - 1 - value * (SPARKLINE_HEIGHT - 2) / self.maximum
+
+    def _append(self, x, value):
+        y = self._y(value)
+        if self._last is not None:
+            self._segments.append(self.create_line(self._last[0], self._last[1], x, y,
+                                                   fill=self.line_color, tags="line"))
+        self._last = (x, y)
+
+    def set_values(self, values):
+        """Полностью перерисовывает график по последним значениям"""
+        self.delete("line")
+        self._segments.clear()
+        self._last = None
+        values = list(values)[-SPARKLINE_POINTS:]
+        first = SPARKLINE_POINTS - len(values)
+        for index, value in enumerate(values):
+            self._append((first + index) * SPARKLINE_STEP, value)
+
+    def push(self, value):
+        """Сдвигает график на одну точку и дорисовывает новый отрезок"""
+        self.move("line", -SPARKLINE_STEP, 0)
+        if self._last is not None:
+            self._last = (self._last[0] - SPARKLINE_STEP, self._last[1])
+        self._append((SPARKLINE_POINTS - 1) * SPARKLINE_STEP, value)
+        while len(self._segments) > SPARKLINE_POINTS - 1:
+            self.delete(self._segments.popleft())
+
+
+# Масштабы графика истории: (подпись, охват в секундах, ярус истории)
+CHART_RANGES = (
+    ("5 минут", 5 * 60, "1s"),
+    ("1 час", 60 * 60, "1s"),
+    ("6 часов", 6 * 60 * 60, "1m"),
+    ("24 часа", 24 * 60 * 60, "1m"),
+    ("7 дней", 7 * 24 * 60 * 60, "1h"),
+    ("30 дней", 30 * 24 * 60 * 60, "1h"),
+)
+# Показатели графика: (поле истории, подпись, делитель значения)
+CHART_FIELDS = (
+    ("cpu", "CPU, %", 1),
+    ("rss", "Память, МБ", 1024 * 1024),
+    ("threads", "Потоки", 1),
+    ("fds", "Дескрипторы", 1),
+    ("io_read", "Чтение, КБ/с", 1024),
+    ("io_write", "Запись, КБ/с", 1024),
+)
+# Период дорисовки графика (миллисекунды)
+CHART_REFRESH_MS = 1000
+# Отступ области графика под подписи шкалы (пиксели)
+CHART_MARGIN = 50
+# Более короткие пропуски между точками соединяются линией: при
+# замедленном опросе точки секундного яруса идут реже (секунды)
+CHART_MAX_GAP = MONITOR_INTERVAL * MONITOR_MAX_SLOWDOWN * MONITOR_BACKGROUND_FACTOR
+
+
+class MetricsChartDialog(tk.Toplevel):
+    """График истории метрик скрипта с переключаемым масштабом.
+
+    Данные берутся из истории ядра через fetch(ярус, since) в фоновом
+    потоке (у демона это HTTP-запрос) и передаются окну через after().
+    При обновлении запрашиваются только новые точки: нарисованные отрезки сдвигаются
+    через move(), добавляются отрезки до новых точек, ушедшие за левый
+    край удаляются. Полная перерисовка - при смене показателя, масштаба,
+    размера окна или когда новое значение не помещается в шкалу.
+    Колесо мыши над графиком меняет масштаб.
+    """
+
+    def __init__(self, parent, script_name, fetch, theme="light"):
+        super().__init__(parent)
+        self.colors = THEMES.get(theme, THEMES["light"])
+        self.fetch = fetch
+        self.range_index = 0
+        self.field_index = 0
+        # Нарисованные точки: [время, значение, отрезок до неё или None]
+        self._points = deque()
+        self._right = 0.0
+        self._scale = 1.0
+        self._step = 1
+        self._refresh_job = None
+        # Номер полной перерисовки: ответы на запросы до неё отбрасываются
+        self._generation = 0
+
+        self.title(f"История ресурсов: {script_name}")
+        self.geometry("800x400")
+        self.transient(parent)
+
+        self.setup_ui()
+        self.update_idletasks()
+        self.redraw()
+
+    def setup_ui(self):
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+
+        controls_frame = ttk.Frame(main_frame)
+        controls_frame.pack(fill=tk.X, pady=(0, 10))
+
+        ttk.Label(controls_frame, text="Показатель:").pack(side=tk.LEFT)
+        self.field_var = tk.StringVar(value=CHART_FIELDS[0][1])
+        field_combo = ttk.Combobox(controls_frame, textvariable=self.field_var, state="readonly", width=16,
+                                   values=[label for _, label, _ in CHART_FIELDS])
+        field_combo.pack(side=tk.LEFT, padx=(5, 15))
+        field_combo.bind("<<ComboboxSelected>>", lambda e: self.select_field(field_combo.current()))
+
+        ttk.Label(controls_frame, text="Период:").pack(side=tk.LEFT)
+        self.range_var = tk.StringVar(value=CHART_RANGES[0][0])
+        self.range_combo = ttk.Combobox(controls_frame, textvariable=self.range_var, state="readonly", width=10,
+                                        values=[label for label, _, _ in CHART_RANGES])
+        self.range_combo.pack(side=tk.LEFT, padx=5)
+        self.range_combo.bind("<<ComboboxSelected>>", lambda e: self.select_range(self.range_combo.current()))
+
+        self.status_label = ttk.Label(controls_frame, text="")
+        self.status_label.pack(side=tk.RIGHT)
+
+        self.canvas = tk.Canvas(main_frame, bg=self.colors["listbox_bg"], highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+        self.canvas.bind("<MouseWheel>", lambda e: self.zoom(-1 if e.delta > 0 else 1))
+        self.canvas.bind("<Button-4>", lambda e: self.zoom(-1))
+        self.canvas.bind("<Button-5>", lambda e: self.zoom(1))
+
+    def destroy(self):
+        if self._refresh_job:
+            self.after_cancel(self._refresh_job)
+            self._refresh_job = None
+        self._generation += 1
+        super().destroy()
+
+    def select_field(self, index):
+        if index >= 0 and index != self.field_index:
+            self.field_index = index
+            self.redraw()
+
+    def select_range(self, index):
+        if 0 <= index < len(CHART_RANGES) and index != self.range_index:
+            self.range_index = index
+            self.range_var.set(CHART_RANGES[index][0])
+            self.redraw()
+
+    def zoom(self, direction):
+        self.select_range(self.range_index + direction)
+
+    def _load(self, since, on_loaded):
+        """Запрашивает в фоне новые точки выбранного показателя.
+
+        on_loaded(точки, шаг яруса, ошибка) вызывается в потоке Tk, если за
+        это время не было полной перерисовки; точки - [(время, значение), ...].
+        """
+        generation = self._generation
+        field, _, divisor = CHART_FIELDS[self.field_index]
+        tier = CHART_RANGES[self.range_index][2]
+
+        def worker():
+            try:
+                data = self.fetch(tier, since)
+                column = data['fields'].index(field) + 1
+                result = ([(point[0], point[column] / divisor) for point in data['points']], data['step'], None)
+            except Exception as e:
+                result = ([], 1, e)
+            try:
+                self.after(0, self._deliver, generation, on_loaded, result)
+            except (RuntimeError, tk.TclError):
+                pass  # окно уже закрыто
+
+        threading.Thread(target=worker, name="MetricsChartFetch", daemon=True).start()
+
+    def _deliver(self, generation, on_loaded, result):
+        if generation == self._generation and self.winfo_exists():
+            on_loaded(*result)
+
+    def _x(self, timestamp):
+        width = self.canvas.winfo_width() - CHART_MARGIN
+        span = CHART_RANGES[self.range_index][1]
+        return CHART_MARGIN + width - (self._right - timestamp) * width / span
+
+    def _y(self, value):
+        height = self.canvas.winfo_height()
+        return height - 10 - value * (height - 20) / self._scale
+
+    def _add_point(self, timestamp, value):
+        segment = None
+        if self._points:
+            previous_time, previous_value, _ = self._points[-1]
+            # Пропуск в данных (скрипт не работал) не соединяем линией
+            if timestamp - previous_time <= max(2 * self._step, CHART_MAX_GAP):
+                segment = self.canvas.create_line(
+                    self._x(previous_time), self._y(previous_value), self._x(timestamp), self._y(value),
+                    fill=self.colors["progress_fg"], width=2, tags="data")
+        self._points.append([timestamp, value, segment])
+
+    def _draw_axis(self):
+        width = self.canvas.winfo_width()
+        # Поле шкалы закрывает отрезки, уехавшие за левый край графика
+        self.canvas.create_rectangle(0, 0, CHART_MARGIN, self.canvas.winfo_height(),
+                                     fill=self.colors["listbox_bg"], outline="", tags="axis")
+        for fraction in (0.0, 0.5, 1.0):
+            y = self._y(self._scale * fraction)
+            self.canvas.create_line(CHART_MARGIN, y, width, y, fill=self.colors["progress_bg"], tags="grid")
+            self.canvas.create_text(CHART_MARGIN - 5, y, text=f"{self._scale * fraction:.4g}", anchor="e",
+                                    fill=self.colors["listbox_fg"], tags="axis")
+
+    def redraw(self):
+        """Полная перерисовка графика за весь выбранный период"""
+        if self._refresh_job:
+            self.after_cancel(self._refresh_job)
+            self._refresh_job = None
+        self._generation += 1
+        self._load(time.time() - CHART_RANGES[self.range_index][1], self._draw_all)
+
+    def _draw_all(self, points, step, error):
+        self.canvas.delete("all")
+        self._points.clear()
+        self._right = time.time()
+        self._step = step
+        if error is not None:
+            self.status_label.config(text=f"Ошибка загрузки истории: {error}")
+        else:
+            self.status_label.config(text="" if points else "Нет данных за период")
+        peak = max((value for _, value in points), default=0.0)
+        minimum = 100.0 if CHART_FIELDS[self.field_index][0] == "cpu" else 1.0
+        self._scale = max(minimum, peak * 1.2)
+        self._draw_axis()
+        for timestamp, value in points:
+            self._add_point(timestamp, value)
+        self.canvas.tag_raise("axis")
+        self._refresh_job = self.after(CHART_REFRESH_MS, self.refresh)
+
+    def refresh(self):
+        """Дорисовывает только новые точки"""
+        self._refresh_job = None
+        since = self._points[-1][0] if self._points else time.time() - CHART_RANGES[self.range_index][1]
+        self._load(since, self._append)
+
+    def _append(self, points, step, error):
+        if error is not None:
+            self.status_label.config(text=f"Ошибка загрузки истории: {error}")
+            self._refresh_job = self.after(CHART_REFRESH_MS, self.refresh)
+            return
+        if any(value > self._scale for _, value in points):
+            self.redraw()
+            return
+
+        now = time.time()
+        width = self.canvas.winfo_width() - CHART_MARGIN
+        self.canvas.move("data", -(now - self._right) * width / CHART_RANGES[self.range_index][1], 0)
+        self._right = now
+
+        for timestamp, value in points:
+            if self._points and timestamp == self._points[-1][0]:
+                # Текущий интервал яруса ещё копится: заменяем его последнюю точку
+                _, _, segment = self._points.pop()
+                if segment is not None:
+                    self.canvas.delete(segment)
+            self._add_point(timestamp, value)
+        self.canvas.tag_raise("axis")
+
+        left = now - CHART_RANGES[self.range_index][1]
+        while len(self._points) > 1 and self._points[1][0] < left:
+            self._points.popleft()
+            if self._points[0][2] is not None:
+                self.canvas.delete(self._points[0][2])
+                self._points[0][2] = None
+        if self._points:
+            self.status_label.config(text=f"Текущее значение: {self._points[-1][1]:.4g}")
+        self._refresh_job = self.after(CHART_REFRESH_MS, self.refresh)
+
+
+# Период обновления прогресса групповых операций (миллисекунды)
+OPERATION_POLL_MS = 100
+
+# Высота строки панели активных скриптов (пиксели)
+SCRIPT_ROW_HEIGHT = 120
+# Шаг прокрутки колесом мыши (пиксели)
+SCRIPT_ROW_SCROLL_STEP = 40
+
+
+class ScriptRow:
+    """Набор виджетов одной видимой строки панели активных скриптов.
+
+    Строка не привязана к скрипту навсегда: при прокрутке она показывает
+    другой скрипт, а кнопки вызывают команды для текущего script_uuid.
+    Спарклайны получают последние значения через commands['history'].
+    """
+
+    def __init__(self, parent, commands, colors):
+        self.script_uuid = None
+        self._shown = None
+        self.get_history = commands['history']
+
+        self.frame = ttk.LabelFrame(parent, text="", padding=10)
+
+        controls_frame = ttk.Frame(self.frame)
+        controls_frame.pack(fill="x", pady=(0, 8))
+
+        self.console_btn = ttk.Button(controls_frame, text="Консоль", state=tk.DISABLED,
+                                      command=lambda: commands['console'](self.script_uuid))
+        self.console_btn.pack(side="right", padx=2)
+
+        ttk.Button(controls_frame, text="Графики",
+                   command=lambda: commands['chart'](self.script_uuid)).pack(side="right", padx=2)
+
+        ttk.Button(controls_frame, text="Настройки",
+                   command=lambda: commands['configure'](self.script_uuid)).pack(side="right", padx=2)
+
+        ttk.Button(controls_frame, text="Удалить из активных",
+                   command=lambda: commands['remove'](self.script_uuid)).pack(side="right", padx=2)
+
+        self.toggle_btn = ttk.Button(controls_frame, text="Запуск",
+                                     command=lambda: commands['toggle'](self.script_uuid))
+        self.toggle_btn.pack(side="right", padx=2)
+
+        resources_frame = ttk.Frame(self.frame)
+        resources_frame.pack(fill="x", pady=8)
+
+        self.cpu_var = tk.IntVar()
+        self.memory_var = tk.IntVar()
+
+        ttk.Label(resources_frame, text="CPU:").grid(row=0, column=0, sticky="w")
+        ttk.Progressbar(resources_frame, variable=self.cpu_var, maximum=100).grid(
+            row=0, column=1, sticky="ew", padx=5)
+        self.cpu_label = ttk.Label(resources_frame, text="0%")
+        self.cpu_label.grid(row=0, column=2, padx=5)
+        self.cpu_sparkline = Sparkline(resources_frame, colors)
+        self.cpu_sparkline.grid(row=0, column=3)
+
+        ttk.Label(resources_frame, text="Память:").grid(row=1, column=0, sticky="w")
+        ttk.Progressbar(resources_frame, variable=self.memory_var, maximum=100).grid(
+            row=1, column=1, sticky="ew", padx=5)
+        self.memory_label = ttk.Label(resources_frame, text="0%")
+        self.memory_label.grid(row=1, column=2, padx=5)
+        self.memory_sparkline = Sparkline(resources_frame, colors)
+        self.memory_sparkline.grid(row=1, column=3, pady=(2, 0))
+
+        resources_frame.columnconfigure(1, weight=1)
+
+    def set_colors(self, colors):
+        self.cpu_sparkline.set_colors(colors)
+        self.memory_sparkline.set_colors(colors)
+
+    def show(self, script_uuid, state):
+        """Отображает состояние (имя, запущен, фаза, cpu, память, число замеров).
+
+        Фаза - None, 'queued' (ждёт в очереди запуска) или 'stopping'.
+        Без изменений ничего не трогает. Если с прошлого показа того же
+        скрипта добавился ровно один замер, спарклайны только дорисовываются.
+        """
+        shown = (script_uuid, state)
+        if shown == self._shown:
+            return
+        previous_uuid = self._shown[0] if self._shown else None
+        previous = self._shown[1] if self._shown else (None, None, None, None, None, None)
+        self._shown = shown
+        self.script_uuid = script_uuid
+        name, is_running, phase, cpu, memory, samples = state
+
+        if name != previous[0]:
+            self.frame.configure(text=name)
+        if (is_running, phase) != previous[1:3]:
+            if phase == 'stopping':
+                self.toggle_btn.config(text="Остановка...", state=tk.DISABLED)
+            elif phase == 'queued':
+                self.toggle_btn.config(text="Отменить запуск", state=tk.NORMAL)
+            else:
+                self.toggle_btn.config(text="Остановить" if is_running else "Запуск", state=tk.NORMAL)
+            self.console_btn.config(state=tk.NORMAL if is_running else tk.DISABLED)
+        if cpu != previous[3]:
+            self.cpu_var.set(int(cpu))
+            self.cpu_label.config(text=f"{cpu:.1f}%" if cpu else "0%")
+        if memory != previous[4]:
+            self.memory_var.set(int(memory))
+            self.memory_label.config(text=f"{memory:.1f}%" if memory else "0%")
+        if script_uuid != previous_uuid or samples != previous[5]:
+            cpu_values, memory_values = self.get_history(script_uuid)
+            if script_uuid == previous_uuid and samples == previous[5] + 1 and cpu_values:
+                self.cpu_sparkline.push(cpu_values[-1])
+                self.memory_sparkline.push(memory_values[-1])
+            else:
+                self.cpu_sparkline.set_values(cpu_values)
+                self.memory_sparkline.set_values(memory_values)
+
+
+class VirtualScriptList(ttk.Frame):
+    """Виртуализированный список активных скриптов.
+
+    Виджеты создаются только для видимых строк и переиспользуются при
+    прокрутке; остальные скрипты существуют лишь как данные, которые
+    возвращает get_state(script_uuid). Обновление мониторинга трогает
+    только видимые строки.
+    """
+
+    def __init__(self, parent, get_state, commands, colors):
+        super().__init__(parent)
+        self.get_state = get_state
+        self.commands = commands
+        self.colors = colors
+        self.items = []
+        self.rows = []
+        self.offset = 0
+        self._render_job = None
+
+        self.canvas = tk.Canvas(self, bg=colors["bg"], highlightthickness=0)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.canvas.bind("<Configure>", lambda e: self.render())
+        self.bind("<Enter>", lambda e: self._bind_wheel(True))
+        self.bind("<Leave>", lambda e: self._bind_wheel(False))
+
+    def _bind_wheel(self, enabled):
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            if enabled:
+                self.bind_all(sequence, self.on_mouse_wheel)
+            else:
+                self.unbind_all(sequence)
+
+    def on_mouse_wheel(self, event):
+        if event.num == 4:
+            delta = -1
+        elif event.num == 5:
+            delta = 1
+        else:
+            delta = -1 if event.delta > 0 else 1
+        self.scroll_to(self.offset + delta * SCRIPT_ROW_SCROLL_STEP)
+
+    def set_items(self, script_uuids):
+        self.items = list(script_uuids)
+        self.schedule_render()
+
+    def append(self, script_uuid):
+        self.items.append(script_uuid)
+        self.schedule_render()
+
+    def remove(self, script_uuid):
+        if script_uuid in self.items:
+            self.items.remove(script_uuid)
+            self.schedule_render()
+
+    def set_colors(self, colors):
+        self.colors = colors
+        self.canvas.configure(bg=colors["bg"])
+        for row in self.rows:
+            row.set_colors(colors)
+
+    def schedule_render(self):
+        """Откладывает перерисовку, чтобы серия изменений дала одну"""
+        if self._render_job is None:
+            self._render_job = self.after_idle(self.render)
+
+    def content_height(self):
+        return len(self.items) * SCRIPT_ROW_HEIGHT
+
+    def scroll_to(self, offset):
+        max_offset = max(0, self.content_height() - self.canvas.winfo_height())
+        self.offset = max(0, min(int(offset), max_offset))
+        self.render()
+
+    def yview(self, action, value, unit=None):
+        if action == tk.MOVETO:
+            self.scroll_to(float(value) * self.content_height())
+        elif action == tk.SCROLL:
+            step = self.canvas.winfo_height() if unit == tk.PAGES else SCRIPT_ROW_SCROLL_STEP
+            self.scroll_to(self.offset + int(value) * step)
+
+    def render(self):
+        """Раскладывает пул строк по видимой области"""
+        if self._render_job is not None:
+            self.after_cancel(self._render_job)
+            self._render_job = None
+
+        height = max(1, self.canvas.winfo_height())
+        total = self.content_height()
+        self.offset = max(0, min(self.offset, total - height))
+
+        needed = min(len(self.items), height // SCRIPT_ROW_HEIGHT + 2)
+        while len(self.rows) < needed:
+            self.rows.append(ScriptRow(self.canvas, self.commands, self.colors))
+
+        first = self.offset // SCRIPT_ROW_HEIGHT
+        for slot, row in enumerate(self.rows):
+            index = first + slot
+            if slot < needed and index < len(self.items):
+                script_uuid = self.items[index]
+                row.show(script_uuid, self.get_state(script_uuid))
+                row.frame.place(x=5, y=index * SCRIPT_ROW_HEIGHT - self.offset,
+                                relwidth=1, width=-10, height=SCRIPT_ROW_HEIGHT - 10)
+            else:
+                row.frame.place_forget()
+
+        if total > 0:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + height) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def refresh(self, script_uuid=None):
+        """Перерисовывает видимые строки (все или одного скрипта)"""
+        for row in self.rows:
+            if row.script_uuid is None or not row.frame.winfo_ismapped():
+                continue
+            if script_uuid is None or row.script_uuid == script_uuid:
+                row.show(row.script_uuid, self.get_state(row.script_uuid))
+
+
+# Идентификаторы узлов групп в каталоге скриптов
+TREE_ACTIVE_NODE = "__active__"
+TREE_INACTIVE_NODE = "__inactive__"
+
+
 class ScriptManagerTkinter:
     def __init__(self, root):
         self.root = root
@@ -559,15 +6154,32 @@ class ScriptManagerTkinter:
         self.root.geometry(f'{width}x{height}+{x}+{y}')
 
         self.current_theme = "light"
-        self.active_scripts = []
         self.saved_scripts = {}
-        self.script_frames = []
-        self.scripts_file = os.path.join(BASE_PATH, "scripts.json")
-        self.settings_file = os.path.join(BASE_PATH, "settings.json")
+        # Ядро управления процессами: локальное или подключение к демону
+        self.supervisor = None
+        # Последние показатели ресурсов: {script_uuid: (cpu, память)}
+        self.script_metrics = {}
+        # Данные спарклайнов: {script_uuid: [число замеров, deque cpu, deque памяти]}
+        self.script_sparklines = {}
+        self.open_charts = {}
+        self.scripts_file = SCRIPTS_FILE
+        self.settings_file = SETTINGS_FILE
+        # Каталог в SQLite, если он выбран в настройках, иначе JSON-файлы
+        self.catalog = open_catalog()
+        if self.catalog:
+            self.scripts_store = SqliteScriptStore(self.catalog, self.catalog_snapshot)
+            self.settings_store = SqliteSettingsStore(self.catalog, lambda: self.settings)
+            self.run_recorder = RunHistoryRecorder(self.catalog)
+        else:
+            self.scripts_store = JsonStore(self.scripts_file, self.catalog_snapshot)
+            self.settings_store = JsonStore(self.settings_file, lambda: self.settings)
+            self.run_recorder = None
+        self._persist_job = None
         self.settings = {}
         self.error_messages = {}
         self.open_consoles = {}
-        self.process_output_buffers = {}
+        self.quitting = False
+        self.search_cache = SearchCache()
         
         self.tray_icon = None
         self.tray_thread = None
@@ -580,12 +6192,134 @@ class ScriptManagerTkinter:
 
         self.setup_ui()
         self.load_settings()
+        client = DaemonClient.connect()
+        if client:
+            self.attach_supervisor(RemoteSupervisor(client, self.settings))
+        else:
+            self.attach_supervisor(ScriptSupervisor(self.settings))
         self.load_scripts()
+        self.supervisor.autostart()
         self.start_monitoring()
 
         if HAS_PYSTRAY and sys.platform != "darwin":
             self.root.after(100, self.setup_tray_icon)
 
+    @property
+    def registry(self):
+        return self.supervisor.registry
+
+    @property
+    def script_logs(self):
+        return self.supervisor.script_logs
+
+    def attach_supervisor(self, supervisor):
+        """Подключает интерфейс к ядру и подписывается на его события"""
+        self.supervisor = supervisor
+        supervisor.add_listener(self.on_supervisor_event)
+        # Запуски под демоном записывает в историю сам демон
+        if self.run_recorder and not supervisor.is_remote:
+            supervisor.add_listener(self.run_recorder)
+        self.update_daemon_menu()
+
+    def switch_supervisor(self, supervisor):
+        """Переключает интерфейс на другое ядро и переносит в него активные скрипты"""
+        active = [script_uuid for script_uuid in self.registry.uuids() if script_uuid in self.saved_scripts]
+        for console in list(self.open_consoles.values()):
+            console.destroy()
+        self.open_consoles.clear()
+        for chart in list(self.open_charts.values()):
+            chart.destroy()
+        self.open_charts.clear()
+        self.script_metrics.clear()
+        self.script_sparklines.clear()
+
+        def finish():
+            self.supervisor.remove_listener(self.on_supervisor_event)
+            self.supervisor.shutdown(stop_scripts=False)
+            self.supervisor.remove_listener(self.run_recorder)
+            self.attach_supervisor(supervisor)
+
+            for script_uuid in active:
+                try:
+                    supervisor.activate(script_uuid, self.saved_scripts[script_uuid])
+                except (OSError, RuntimeError) as e:
+                    print(f"Ошибка активации скрипта {script_uuid}: {e}")
+            self.scripts_list.set_items(self.registry.uuids())
+            self.update_saved_tree()
+
+        if self.supervisor.is_remote:
+            finish()
+        else:
+            # Остановка идёт в фоне, как при выходе; до её конца переключение недоступно
+            self.daemon_menu.entryconfig(0, state=tk.DISABLED)
+            self.daemon_menu.entryconfig(1, state=tk.DISABLED)
+            self.stop_all_scripts(on_done=lambda: self.root.after(0, finish), final=True)
+
+    def update_daemon_menu(self):
+        remote = self.supervisor.is_remote
+        self.daemon_menu.entryconfig(0, state=tk.DISABLED if remote else tk.NORMAL)
+        self.daemon_menu.entryconfig(1, state=tk.NORMAL if remote else tk.DISABLED)
+
+    def connect_daemon(self):
+        """Передаёт управление скриптами запущенному демону"""
+        client = DaemonClient.connect()
+        if client is None:
+            messagebox.showerror("Ошибка", "Демон не запущен.\n"
+                                           "Запустите его командой: main.py --daemon")
+            return
+        if self.registry.running():
+            if not messagebox.askyesno("Подтверждение",
+                                       "Запущенные скрипты будут остановлены и переданы демону. Продолжить?"):
+                return
+        try:
+            self.switch_supervisor(RemoteSupervisor(client, self.settings))
+        except (OSError, RuntimeError) as e:
+            messagebox.showerror("Ошибка", f"Не удалось подключиться к демону: {str(e)}")
+
+    def disconnect_daemon(self):
+        """Отключается от демона; его скрипты продолжают работать"""
+        self.switch_supervisor(ScriptSupervisor(self.settings))
+
+    def on_supervisor_event(self, event, script_uuid, data):
+        """События ядра; приходят из фоновых потоков"""
+        if event == 'output':
+            console = self.open_consoles.get(script_uuid)
+            if console is not None:
+                console.append_text(data)
+        elif event == 'launch_failed':
+            self.root.after(0, self.on_launch_failed, script_uuid, data)
+        elif event == 'limit_exceeded':
+            self.root.after(0, self.on_limit_exceeded, script_uuid, data)
+        elif event == 'request_failed':
+            self.root.after(0, self.on_request_failed, script_uuid, data)
+        else:
+            self.root.after(0, self.on_script_state_changed, script_uuid)
+
+    def on_launch_failed(self, script_uuid, error):
+        self.on_script_state_changed(script_uuid)
+        script_info = self.saved_scripts.get(script_uuid, {})
+        messagebox.showerror("Ошибка", f"Не удалось запустить скрипт "
+                                       f"{script_display_name(script_info) or script_uuid}: {error}")
+
+    def on_request_failed(self, script_uuid, error):
+        """Команда демону не выполнилась: панель и каталог сверяются с зеркалом демона"""
+        self.scripts_list.set_items(self.registry.uuids())
+        self.update_saved_tree()
+        self.save_scripts()
+        messagebox.showerror("Ошибка", error)
+
+    def on_limit_exceeded(self, script_uuid, breach):
+        script_info = self.saved_scripts.get(script_uuid, {})
+        ErrorDialog(self.root, script_display_name(script_info) or script_uuid, breach['message'],
+                    self.current_theme)
+
+    def on_script_state_changed(self, script_uuid):
+        if script_uuid not in self.registry:
+            return
+        self.update_script_controls(script_uuid)
+        if not self.registry.get(script_uuid).is_running:
+            self.reset_script_resources(script_uuid)
+
     def apply_theme(self, theme_name):
         """Применяет тему"""
         self.current_theme = theme_name
@@ -604,8 +6338,8 @@ class ScriptManagerTkinter:
                        foreground=colors["button_fg"])
         
         self.root.configure(bg=colors["bg"])
-        if hasattr(self, 'canvas'):
-            self.canvas.configure(bg=colors["bg"])
+        if hasattr(self, 'scripts_list'):
+            self.scripts_list.set_colors(colors)
 
     def setup_ui(self):
         """Настройка интерфейса"""
@@ -630,6 +6364,21 @@ class ScriptManagerTkinter:
         view_menu.add_command(label="Светлая тема", command=lambda: self.change_theme("light"))
         view_menu.add_command(label="Тёмная тема", command=lambda: self.change_theme("dark"))
         
+        search_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Поиск", menu=search_menu)
+        search_menu.add_command(label="Поиск в выводе скриптов...", command=self.open_search)
+
+        scripts_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Скрипты", menu=scripts_menu)
+        scripts_menu.add_command(label="Запустить все", command=self.start_all_scripts)
+        scripts_menu.add_command(label="Остановить все", command=self.stop_all_scripts)
+        scripts_menu.add_command(label="Перезапустить все", command=self.restart_all_scripts)
+
+        self.daemon_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Демон", menu=self.daemon_menu)
+        self.daemon_menu.add_command(label="Подключиться к демону", command=self.connect_daemon)
+        self.daemon_menu.add_command(label="Отключиться от демона", command=self.disconnect_daemon)
+
         help_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Справка", menu=help_menu)
         help_menu.add_command(label="О программе", command=self.show_info)
@@ -656,6 +6405,14 @@ class ScriptManagerTkinter:
 
         system_frame.columnconfigure(1, weight=1)
 
+        # Строка состояния групповых операций; показывается только во время них
+        self.operation_frame = ttk.Frame(self.root)
+        self.operation_var = tk.IntVar()
+        self.operation_label = ttk.Label(self.operation_frame, text="")
+        self.operation_label.pack(side="left", padx=(0, 10))
+        ttk.Progressbar(self.operation_frame, variable=self.operation_var, maximum=100).pack(
+            side="left", fill="x", expand=True)
+
         # Активные скрипты
         scripts_frame = ttk.Frame(self.root)
         scripts_frame.pack(side="left", fill="both", expand=True, padx=10, pady=5)
@@ -663,16 +6420,19 @@ class ScriptManagerTkinter:
         ttk.Label(scripts_frame, text="Активные скрипты:", 
                  font=("Arial", 12, "bold")).pack(anchor="w", pady=(0, 5))
 
-        self.canvas = tk.Canvas(scripts_frame, bg=THEMES[self.current_theme]["bg"], highlightthickness=0)
-        self.scrollbar = ttk.Scrollbar(scripts_frame, orient="vertical", command=self.canvas.yview)
-        self.scrollable_frame = ttk.Frame(self.canvas)
-
-        self.scrollable_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-
-        self.canvas.pack(side="left", fill="both", expand=True)
-        self.scrollbar.pack(side="right", fill="y")
+        self.scripts_list = VirtualScriptList(
+            scripts_frame, self.script_row_state,
+            {
+                'toggle': self.toggle_script,
+                'remove': self.remove_from_active,
+                'configure': self.configure_script,
+                'console': self.open_console,
+                'chart': self.open_metrics_chart,
+                'history': self.script_sparkline_values
+            },
+            THEMES[self.current_theme]
+        )
+        self.scripts_list.pack(fill="both", expand=True)
 
         # Каталог скриптов
         catalog_frame = ttk.Frame(self.root, width=400)
@@ -706,6 +6466,11 @@ class ScriptManagerTkinter:
         tree_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.saved_tree.bind("<Double-Button-1>", self.on_tree_double_click)
 
+        # Узлы групп; строки скриптов используют uuid как iid
+        self.saved_tree.insert("", "end", iid=TREE_ACTIVE_NODE, text="Активные скрипты", open=True)
+        self.saved_tree.insert("", "end", iid=TREE_INACTIVE_NODE, text="Неактивные скрипты", open=True)
+        self.tree_rows = {}
+
         self.apply_theme(self.current_theme)
 
     def setup_tray_icon(self):
@@ -734,8 +6499,10 @@ class ScriptManagerTkinter:
     def hide_to_tray(self):
         if HAS_PYSTRAY and self.tray_icon:
             self.root.withdraw()
+            self.supervisor.set_background(True)
 
     def show_from_tray(self):
+        self.supervisor.set_background(False)
         self.root.deiconify()
         self.root.lift()
         self.root.focus_force()
@@ -755,17 +6522,27 @@ Python: {sys.version.split()[0]}
         webbrowser.open("https://github.com/Vanillllla/ScriptManager")
 
     def quit_application(self):
-        self.save_scripts()
-        self.save_settings()
-        
-        for script_data in self.script_frames:
-            if script_data['is_running']:
-                self.stop_script(script_data['script_uuid'])
-        
-        if HAS_PYSTRAY and self.tray_icon:
-            self.tray_icon.stop()
-        
-        self.root.quit()
+        if self.quitting:
+            return
+        self.quitting = True
+        self.persist()
+
+        def finish():
+            self.supervisor.shutdown(stop_scripts=False)
+            if self.catalog:
+                self.catalog.close()
+
+            if HAS_PYSTRAY and self.tray_icon:
+                self.tray_icon.stop()
+
+            self.root.quit()
+
+        # Скрипты, запущенные демоном, продолжают работать после выхода
+        if self.supervisor.is_remote:
+            finish()
+        else:
+            # Очередь запусков снимается, и выход ждёт всех остановок, в том числе начатых раньше
+            self.stop_all_scripts(on_done=finish, final=True)
 
     def change_theme(self, theme_name):
         self.current_theme = theme_name
@@ -777,24 +6554,12 @@ Python: {sys.version.split()[0]}
         dialog = SettingsDialog(self.root, self.settings)
         self.root.wait_window(dialog)
         self.save_settings()
+        if not self.supervisor.is_remote:
+            self.supervisor.affinity.refresh()
 
     def load_settings(self):
-        try:
-            if os.path.exists(self.settings_file):
-                with open(self.settings_file, 'r', encoding='utf-8') as f:
-                    self.settings = json.load(f)
-            else:
-                self.settings = {
-                    'theme': 'light',
-                    'performance_monitoring': True,
-                    'autostart': False,
-                    'default_interpreter': find_system_python()
-                }
-            
-            theme = self.settings.get('theme', 'light')
-            self.change_theme(theme)
-        except Exception as e:
-            print(f"Ошибка загрузки настроек: {e}")
+        self.settings = self.settings_store.load()
+        if not self.settings:
             self.settings = {
                 'theme': 'light',
                 'performance_monitoring': True,
@@ -802,41 +6567,52 @@ Python: {sys.version.split()[0]}
                 'default_interpreter': find_system_python()
             }
 
+        # Тема из файла применяется без записи настроек обратно
+        self.current_theme = self.settings.get('theme', 'light')
+        self.apply_theme(self.current_theme)
+
+    def schedule_persist(self):
+        """Откладывает запись на диск, чтобы серия изменений дала одну"""
+        if self._persist_job is None:
+            self._persist_job = self.root.after(PERSIST_DELAY_MS, self.persist)
+
+    def persist(self):
+        """Сразу записывает изменённые каталог и настройки"""
+        if self._persist_job is not None:
+            self.root.after_cancel(self._persist_job)
+            self._persist_job = None
+        self.scripts_store.flush()
+        self.settings_store.flush()
+
     def save_settings(self):
-        try:
-            with open(self.settings_file, 'w', encoding='utf-8') as f:
-                json.dump(self.settings, f, indent=4, ensure_ascii=False)
-        except Exception as e:
-            print(f"Ошибка сохранения настроек: {e}")
+        self.settings_store.mark_dirty()
+        self.schedule_persist()
 
     def load_scripts(self):
-        try:
-            if os.path.exists(self.scripts_file):
-                with open(self.scripts_file, 'r', encoding='utf-8') as f:
-                    loaded_scripts = json.load(f)
-                
-                for script_uuid, script_info in loaded_scripts.items():
-                    self.saved_scripts[script_uuid] = script_info
-                    if script_info.get('is_active', False):
-                        self.active_scripts.append(script_uuid)
-                        self.create_script_frame(script_uuid)
-                
-                self.update_saved_tree()
-        except Exception as e:
-            print(f"Ошибка загрузки скриптов: {e}")
+        loaded_scripts = self.scripts_store.load()
+        for script_uuid, script_info in loaded_scripts.items():
+            self.saved_scripts[script_uuid] = script_info
+            if script_info.get('is_active', False):
+                self.add_script_row(script_uuid)
 
-    def save_scripts(self):
-        try:
-            scripts_to_save = {}
-            for script_uuid, script_info in self.saved_scripts.items():
-                script_copy = script_info.copy()
-                script_copy['is_active'] = script_uuid in self.active_scripts
-                scripts_to_save[script_uuid] = script_copy
-            
-            with open(self.scripts_file, 'w', encoding='utf-8') as f:
-                json.dump(scripts_to_save, f, indent=4, ensure_ascii=False)
-        except Exception as e:
-            print(f"Ошибка сохранения скриптов: {e}")
+        self.update_saved_tree()
+
+    def catalog_snapshot(self, script_uuids=None):
+        """Каталог (или только script_uuids) для записи с текущим признаком активности"""
+        scripts_to_save = {}
+        for script_uuid in self.saved_scripts if script_uuids is None else script_uuids:
+            script_info = self.saved_scripts.get(script_uuid)
+            if script_info is None:
+                continue
+            script_copy = script_info.copy()
+            script_copy['is_active'] = script_uuid in self.registry
+            scripts_to_save[script_uuid] = script_copy
+        return scripts_to_save
+
+    def save_scripts(self, script_uuids=None):
+        """Отмечает изменение каталога; script_uuids - только этих скриптов"""
+        self.scripts_store.mark_dirty(script_uuids)
+        self.schedule_persist()
 
     def add_script(self):
         filetypes = [("Python files", "*.py"), ("All files", "*")]
@@ -852,332 +6628,341 @@ Python: {sys.version.split()[0]}
                 'display_name': script_name,
                 'path': script_path,
                 'interpreter': self.settings.get('default_interpreter', find_system_python()),
-                'autostart': False
+                'autostart': False,
+                'tags': []
             }
             
             self.saved_scripts[script_uuid] = script_info
-            self.active_scripts.append(script_uuid)
-            self.create_script_frame(script_uuid)
-            self.update_saved_tree()
-            self.save_scripts()
+            self.add_script_row(script_uuid)
+            self.refresh_tree_rows([script_uuid])
+            self.save_scripts([script_uuid])
 
-    def create_script_frame(self, script_uuid):
+    def add_script_row(self, script_uuid):
+        """Делает скрипт активным и добавляет его в панель"""
         script_info = self.saved_scripts.get(script_uuid)
-        if not script_info:
+        if not script_info or script_uuid in self.registry:
             return
-        
-        display_name = script_info.get('display_name', script_info['name'])
-        
-        frame = ttk.LabelFrame(self.scrollable_frame, text=display_name, padding=10)
-        frame.pack(fill="x", pady=5, padx=5)
-        
-        controls_frame = ttk.Frame(frame)
-        controls_frame.pack(fill="x", pady=(0, 8))
-        
-        console_btn = ttk.Button(controls_frame, text="Консоль", state=tk.DISABLED,
-                                command=lambda: self.open_console(script_uuid))
-        console_btn.pack(side="right", padx=2)
-        
-        settings_btn = ttk.Button(controls_frame, text="Настройки",
-                                 command=lambda: self.configure_script(script_uuid))
-        settings_btn.pack(side="right", padx=2)
-        
-        remove_btn = ttk.Button(controls_frame, text="Удалить из активных",
-                               command=lambda: self.remove_from_active(script_uuid))
-        remove_btn.pack(side="right", padx=2)
-        
-        toggle_btn = ttk.Button(controls_frame, text="Запуск",
-                               command=lambda: self.toggle_script(script_uuid))
-        toggle_btn.pack(side="right", padx=2)
-        
-        resources_frame = ttk.Frame(frame)
-        resources_frame.pack(fill="x", pady=8)
-        
-        cpu_var = tk.IntVar()
-        memory_var = tk.IntVar()
-        
-        ttk.Label(resources_frame, text="CPU:").grid(row=0, column=0, sticky="w")
-        cpu_bar = ttk.Progressbar(resources_frame, variable=cpu_var, maximum=100)
-        cpu_bar.grid(row=0, column=1, sticky="ew", padx=5)
-        cpu_label = ttk.Label(resources_frame, text="0%")
-        cpu_label.grid(row=0, column=2, padx=5)
-        
-        ttk.Label(resources_frame, text="Память:").grid(row=1, column=0, sticky="w")
-        memory_bar = ttk.Progressbar(resources_frame, variable=memory_var, maximum=100)
-        memory_bar.grid(row=1, column=1, sticky="ew", padx=5)
-        memory_label = ttk.Label(resources_frame, text="0%")
-        memory_label.grid(row=1, column=2, padx=5)
-        
-        resources_frame.columnconfigure(1, weight=1)
-        
-        script_frame_data = {
-            'frame': frame, 'script_uuid': script_uuid,
-            'script_info': script_info, 'process': None,
-            'pid': None, 'cpu_var': cpu_var, 'memory_var': memory_var,
-            'cpu_label': cpu_label, 'memory_label': memory_label,
-            'toggle_btn': toggle_btn, 'console_btn': console_btn,
-            'is_running': False
-        }
-        
-        self.script_frames.append(script_frame_data)
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+
+        try:
+            self.supervisor.activate(script_uuid, script_info)
+        except (OSError, RuntimeError) as e:
+            messagebox.showerror("Ошибка", f"Не удалось активировать скрипт: {str(e)}")
+            return
+        self.scripts_list.append(script_uuid)
+
+    def script_row_state(self, script_uuid):
+        """Данные строки панели: (имя, запущен, фаза, cpu, память, число замеров)"""
+        runtime = self.registry.get(script_uuid)
+        if runtime is None:
+            return "", False, None, 0, 0, 0
+        cpu, memory = self.script_metrics.get(script_uuid, (0, 0))
+        sparkline = self.script_sparklines.get(script_uuid)
+        return (runtime.display_name, runtime.is_running, self.script_phase(script_uuid), cpu, memory,
+                sparkline[0] if sparkline else 0)
+
+    def script_sparkline_values(self, script_uuid):
+        """Последние значения CPU и памяти скрипта для спарклайнов строки"""
+        sparkline = self.script_sparklines.get(script_uuid)
+        if sparkline is None:
+            return (), ()
+        return sparkline[1], sparkline[2]
+
+    def script_phase(self, script_uuid):
+        if script_uuid in self.supervisor.stopping:
+            return 'stopping'
+        if script_uuid in self.supervisor.queued:
+            return 'queued'
+        return None
 
     def toggle_script(self, script_uuid):
-        for script_data in self.script_frames:
-            if script_data['script_uuid'] == script_uuid:
-                if script_data['is_running']:
-                    self.stop_script(script_uuid)
-                else:
-                    self.start_script(script_uuid)
-                break
+        runtime = self.registry.get(script_uuid)
+        if runtime is None or script_uuid in self.supervisor.stopping:
+            return
+        if runtime.is_running or script_uuid in self.supervisor.queued:
+            self.stop_script(script_uuid)
+        else:
+            self.start_script(script_uuid)
 
     def start_script(self, script_uuid):
-        for script_data in self.script_frames:
-            if script_data['script_uuid'] == script_uuid:
-                script_info = script_data['script_info']
-                
-                try:
-                    interpreter = script_info['interpreter']
-                    if not os.path.exists(interpreter):
-                        interpreter = find_system_python()
-                    
-                    if sys.platform == "win32":
-                        process = subprocess.Popen(
-                            [interpreter, script_info['path']],
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE,
-                            stdin=subprocess.PIPE,
-                            universal_newlines=False,
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                    else:
-                        process = subprocess.Popen(
-                            [interpreter, script_info['path']],
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE,
-                            stdin=subprocess.PIPE,
-                            universal_newlines=False
-                        )
-                    
-                    script_data['process'] = process
-                    script_data['pid'] = process.pid
-                    script_data['is_running'] = True
-                    script_data['toggle_btn'].config(text="Остановить")
-                    script_data['console_btn'].config(state=tk.NORMAL)
-                    
-                    self.process_output_buffers[script_uuid] = ""
-                    threading.Thread(target=self.monitor_script_output,
-                                    args=(script_data,), daemon=True).start()
-                    
-                except Exception as e:
-                    messagebox.showerror("Ошибка", f"Не удалось запустить скрипт: {str(e)}")
-                break
+        """Ставит скрипт в очередь запусков; ошибки приходят событием ядра"""
+        try:
+            self.supervisor.enqueue_start([script_uuid])
+        except (OSError, RuntimeError) as e:
+            messagebox.showerror("Ошибка", f"Не удалось запустить скрипт: {str(e)}")
+            return
+        self.update_script_controls(script_uuid)
 
     def stop_script(self, script_uuid):
-        for script_data in self.script_frames:
-            if script_data['script_uuid'] == script_uuid and script_data['process']:
-                try:
-                    script_data['process'].terminate()
-                    script_data['process'].wait(timeout=3)
-                except:
-                    try:
-                        script_data['process'].kill()
-                    except:
-                        pass
-                
-                script_data['process'] = None
-                script_data['pid'] = None
-                script_data['is_running'] = False
-                script_data['toggle_btn'].config(text="Запуск")
-                script_data['console_btn'].config(state=tk.DISABLED)
-                script_data['cpu_var'].set(0)
-                script_data['memory_var'].set(0)
-                script_data['cpu_label'].config(text="0%")
-                script_data['memory_label'].config(text="0%")
-                break
+        """Останавливает скрипт в фоне; строка обновится по событию ядра"""
+        self.supervisor.stop_many([script_uuid])
+        self.update_script_controls(script_uuid)
 
-    def monitor_script_output(self, script_data):
-        """Мониторинг вывода скрипта"""
-        process = script_data['process']
-        script_uuid = script_data['script_uuid']
-        
-        def read_stream(stream):
-            try:
-                for line in iter(stream.readline, ''):
-                    if line:
-                        decoded = line.decode('utf-8', errors='replace')
-                        if script_uuid in self.process_output_buffers:
-                            self.process_output_buffers[script_uuid] += decoded
-                        
-                        if script_uuid in self.open_consoles:
-                            console = self.open_consoles[script_uuid]
-                            if console.winfo_exists():
-                                console.after(0, lambda d=decoded: console.append_text(d))
-            except Exception as e:
-                print(f"Ошибка чтения вывода: {e}")
-        
-        threading.Thread(target=read_stream, args=(process.stdout,), daemon=True).start()
-        threading.Thread(target=read_stream, args=(process.stderr,), daemon=True).start()
-        
-        process.wait()
-        script_data['is_running'] = False
-        if script_data['toggle_btn'].winfo_exists():
-            script_data['toggle_btn'].config(text="Запуск")
-            script_data['console_btn'].config(state=tk.DISABLED)
+    def start_all_scripts(self):
+        script_uuids = [runtime.script_uuid for runtime in self.registry
+                        if not runtime.is_running and runtime.script_uuid not in self.supervisor.stopping]
+        try:
+            self.supervisor.enqueue_start(script_uuids)
+        except (OSError, RuntimeError) as e:
+            messagebox.showerror("Ошибка", f"Не удалось запустить скрипты: {str(e)}")
+
+    def stop_all_scripts(self, on_done=None, final=False):
+        operation = self.supervisor.stop_all(final=final)
+        self.track_operation(operation, "Остановка скриптов", on_done)
+
+    def restart_all_scripts(self):
+        script_uuids = [runtime.script_uuid for runtime in self.registry.running()]
+        operation = self.supervisor.restart_many(script_uuids)
+        self.track_operation(operation, "Перезапуск скриптов")
+
+    def track_operation(self, operation, title, on_done=None):
+        """Показывает прогресс групповой операции в строке состояния"""
+        if operation.total:
+            self.operation_frame.pack(side="bottom", fill="x", padx=10, pady=5,
+                                      before=self.scripts_list.master)
+
+        def poll():
+            self.operation_var.set(operation.completed * 100 // max(operation.total, 1))
+            text = f"{title}: {operation.completed} из {operation.total}"
+            if operation.killed:
+                text += f" (принудительно: {len(operation.killed)})"
+            self.operation_label.config(text=text)
+            if not operation.done.is_set():
+                self.root.after(OPERATION_POLL_MS, poll)
+                return
+            self.operation_frame.pack_forget()
+            if on_done:
+                on_done()
+
+        poll()
+
+    def update_script_controls(self, script_uuid):
+        """Приводит строку панели и каталога в соответствие с состоянием скрипта"""
+        self.refresh_tree_rows([script_uuid])
+        self.scripts_list.refresh(script_uuid)
 
     def open_console(self, script_uuid):
-        for script_data in self.script_frames:
-            if script_data['script_uuid'] == script_uuid and script_data['is_running']:
-                script_info = script_data['script_info']
-                script_name = script_info.get('display_name', script_info['name'])
-                
-                if script_uuid in self.open_consoles:
-                    try:
-                        self.open_consoles[script_uuid].lift()
-                        return
-                    except:
-                        del self.open_consoles[script_uuid]
-                
-                console = ConsoleDialog(self.root, script_name, script_data['process'], self.current_theme)
-                if script_uuid in self.process_output_buffers:
-                    console.load_historical_output(self.process_output_buffers[script_uuid])
-                
-                self.open_consoles[script_uuid] = console
-                
-                def on_close():
-                    if script_uuid in self.open_consoles:
-                        del self.open_consoles[script_uuid]
-                
-                console.protocol("WM_DELETE_WINDOW", on_close)
+        runtime = self.registry.get(script_uuid)
+        if runtime is None or not runtime.is_running:
+            return
+
+        if script_uuid in self.open_consoles:
+            try:
+                self.open_consoles[script_uuid].lift()
+                return
+            except:
+                del self.open_consoles[script_uuid]
+
+        try:
+            self.supervisor.watch(script_uuid)
+        except (OSError, RuntimeError) as e:
+            messagebox.showerror("Ошибка", f"Не удалось получить вывод скрипта: {str(e)}")
+            return
+
+        def on_close():
+            if self.open_consoles.get(script_uuid) is console:
+                del self.open_consoles[script_uuid]
+            self.supervisor.unwatch(script_uuid)
+            console.destroy()
+
+        console = ConsoleDialog(self.root, runtime.display_name,
+                                lambda text: self.supervisor.send_input(script_uuid, text),
+                                self.current_theme,
+                                self.settings.get('console_max_lines', CONSOLE_MAX_LINES),
+                                self.script_logs.path_for(script_uuid),
+                                on_search=lambda: self.open_search(script_uuid),
+                                on_close=on_close)
+        scrollback = self.supervisor.scrollback(script_uuid)
+        if scrollback is not None:
+            console.load_historical_output(scrollback)
+
+        self.open_consoles[script_uuid] = console
+
+    def open_metrics_chart(self, script_uuid):
+        runtime = self.registry.get(script_uuid)
+        if runtime is None:
+            return
+
+        if script_uuid in self.open_charts:
+            try:
+                self.open_charts[script_uuid].lift()
+                return
+            except tk.TclError:
+                del self.open_charts[script_uuid]
+
+        chart = MetricsChartDialog(self.root, runtime.display_name,
+                                   lambda tier, since: self.supervisor.metrics_history(script_uuid, tier, since),
+                                   self.current_theme)
+        self.open_charts[script_uuid] = chart
+
+        def on_close():
+            self.open_charts.pop(script_uuid, None)
+            chart.destroy()
+
+        chart.protocol("WM_DELETE_WINDOW", on_close)
+
+    def open_search(self, script_uuid=None):
+        """Открывает поиск по выводу одного скрипта или всех сразу"""
+        scripts = [(uuid_, info.get('display_name', info['name']))
+                   for uuid_, info in self.saved_scripts.items()]
+        SearchDialog(self.root, scripts, self.search_script_output, self.open_search_result,
+                     script_uuid, self.current_theme)
+
+    def search_script_output(self, search, script_uuid, stop_event):
+        """Ищет в журналах скрипта, а без журналов - в истории в памяти"""
+        results = []
+        segments = self.script_logs.segments(script_uuid)
+        for path in segments:
+            if stop_event.is_set():
                 break
+            for line, text in self.search_cache.search_file(search, path, stop_event):
+                results.append({'script_uuid': script_uuid, 'source': path, 'line': line, 'text': text})
+
+        scrollback = self.supervisor.scrollback(script_uuid)
+        if not segments and scrollback is not None:
+            for line, text in search.scan_text(scrollback.tail(len(scrollback) + 1)):
+                results.append({'script_uuid': script_uuid, 'source': 'scrollback', 'line': line, 'text': text})
+        return results
+
+    def open_search_result(self, result):
+        """Переходит к найденной строке в журнале или консоли"""
+        script_uuid = result['script_uuid']
+        script_info = self.saved_scripts.get(script_uuid, {})
+        script_name = script_info.get('display_name', script_info.get('name', script_uuid))
+
+        if result['source'] == 'scrollback':
+            self.open_console(script_uuid)
+            console = self.open_consoles.get(script_uuid)
+            if console is None or not console.goto_text(result['text']):
+                messagebox.showinfo("Поиск", f"Строка {result['line'] + 1}:\n{result['text']}")
+        elif result['source'].endswith(".gz"):
+            messagebox.showinfo("Поиск", f"Сжатый сегмент {os.path.basename(result['source'])}, "
+                                         f"строка {result['line'] + 1}:\n{result['text']}")
+        else:
+            try:
+                viewer = LogViewerDialog(self.root, script_name, result['source'], self.current_theme)
+                viewer.goto_line(result['line'])
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Ошибка", f"Не удалось открыть журнал: {str(e)}")
 
     def update_saved_tree(self):
-        self.saved_tree.delete(*self.saved_tree.get_children())
-        
-        active_node = self.saved_tree.insert("", "end", text="Активные скрипты")
-        inactive_node = self.saved_tree.insert("", "end", text="Неактивные скрипты")
-        
-        for script_uuid in self.active_scripts:
-            script_info = self.saved_scripts.get(script_uuid)
-            if script_info:
-                name = script_info.get('display_name', script_info['name'])
-                status = "Запущен" if self.is_script_running(script_uuid) else "Остановлен"
-                self.saved_tree.insert(active_node, "end", text=name, values=(status,))
-        
-        for script_uuid, script_info in self.saved_scripts.items():
-            if script_uuid not in self.active_scripts:
-                name = script_info.get('display_name', script_info['name'])
-                self.saved_tree.insert(inactive_node, "end", text=name, values=("Неактивен",))
-        
-        self.saved_tree.item(active_node, open=True)
-        self.saved_tree.item(inactive_node, open=True)
+        """Сверяет весь каталог с деревом и обновляет только изменившиеся строки"""
+        self.refresh_tree_rows(list(self.saved_scripts) + [
+            script_uuid for script_uuid in self.tree_rows if script_uuid not in self.saved_scripts
+        ])
+
+    def tree_row_state(self, script_uuid):
+        """Ожидаемое (группа, имя, статус) строки или None, если скрипта нет"""
+        script_info = self.saved_scripts.get(script_uuid)
+        if script_info is None:
+            return None
+        name = script_info.get('display_name', script_info['name'])
+        runtime = self.registry.get(script_uuid)
+        if runtime is None:
+            return TREE_INACTIVE_NODE, name, "Неактивен"
+        if script_uuid in self.supervisor.stopping:
+            return TREE_ACTIVE_NODE, name, "Остановка..."
+        if script_uuid in self.supervisor.queued:
+            return TREE_ACTIVE_NODE, name, "В очереди"
+        if runtime.is_running:
+            return TREE_ACTIVE_NODE, name, "Запущен"
+        restart = self.supervisor.restart_status(script_uuid)
+        if restart['crash_loop']:
+            return TREE_ACTIVE_NODE, name, "Цикл сбоев"
+        if restart['next_restart'] is not None:
+            return TREE_ACTIVE_NODE, name, "Перезапуск..."
+        return TREE_ACTIVE_NODE, name, "Остановлен"
+
+    def refresh_tree_rows(self, script_uuids):
+        """Обновляет в дереве только строки указанных скриптов"""
+        for script_uuid in script_uuids:
+            state = self.tree_row_state(script_uuid)
+            current = self.tree_rows.get(script_uuid)
+            if state == current:
+                continue
+
+            if state is None:
+                self.saved_tree.delete(script_uuid)
+                del self.tree_rows[script_uuid]
+                continue
+
+            parent, name, status = state
+            if current is None:
+                self.saved_tree.insert(parent, "end", iid=script_uuid, text=name, values=(status,))
+            else:
+                if current[0] != parent:
+                    self.saved_tree.move(script_uuid, parent, "end")
+                if current[1:] != (name, status):
+                    self.saved_tree.item(script_uuid, text=name, values=(status,))
+            self.tree_rows[script_uuid] = state
+
+    def selected_script_uuid(self):
+        """uuid скрипта, выбранного в каталоге, или None"""
+        selection = self.saved_tree.selection()
+        if selection and selection[0] in self.saved_scripts:
+            return selection[0]
+        return None
 
     def is_script_running(self, script_uuid):
-        for script_data in self.script_frames:
-            if script_data['script_uuid'] == script_uuid:
-                return script_data['is_running']
-        return False
+        runtime = self.registry.get(script_uuid)
+        return runtime is not None and runtime.is_running
 
     def on_tree_double_click(self, event):
-        selection = self.saved_tree.selection()
-        if not selection:
+        script_uuid = self.selected_script_uuid()
+        if not script_uuid:
             return
-        
-        item = selection[0]
-        parent = self.saved_tree.parent(item)
-        
-        if parent:
-            item_text = self.saved_tree.item(item)["text"]
-            parent_text = self.saved_tree.item(parent)["text"]
-            
-            script_uuid = None
-            for uuid, info in self.saved_scripts.items():
-                if info.get('display_name', info['name']) == item_text:
-                    script_uuid = uuid
-                    break
-            
-            if script_uuid:
-                if parent_text == "Активные скрипты":
-                    if messagebox.askyesno("Подтверждение", f"Переместить '{item_text}' в неактивные?"):
-                        self.remove_from_active(script_uuid)
-                elif parent_text == "Неактивные скрипты":
-                    self.add_to_active(script_uuid)
+
+        item_text = self.saved_tree.item(script_uuid)["text"]
+        if script_uuid in self.registry:
+            if messagebox.askyesno("Подтверждение", f"Переместить '{item_text}' в неактивные?"):
+                self.remove_from_active(script_uuid)
+        else:
+            self.add_to_active(script_uuid)
 
     def remove_from_active(self, script_uuid):
-        if script_uuid in self.active_scripts:
-            self.active_scripts.remove(script_uuid)
-        
-        for i, script_data in enumerate(self.script_frames):
-            if script_data['script_uuid'] == script_uuid:
-                if script_data['is_running']:
-                    self.stop_script(script_uuid)
-                script_data['frame'].destroy()
-                self.script_frames.pop(i)
-                break
+        try:
+            self.supervisor.deactivate(script_uuid)
+        except (OSError, RuntimeError) as e:
+            messagebox.showerror("Ошибка", f"Не удалось деактивировать скрипт: {str(e)}")
+            return
+        self.script_metrics.pop(script_uuid, None)
+        self.script_sparklines.pop(script_uuid, None)
+        self.scripts_list.remove(script_uuid)
         
-        self.update_saved_tree()
-        self.save_scripts()
+        self.refresh_tree_rows([script_uuid])
+        self.save_scripts([script_uuid])
 
     def add_to_active(self, script_uuid):
-        if script_uuid not in self.active_scripts:
-            self.active_scripts.append(script_uuid)
-            self.create_script_frame(script_uuid)
-            self.update_saved_tree()
-            self.save_scripts()
+        if script_uuid not in self.registry:
+            self.add_script_row(script_uuid)
+            self.refresh_tree_rows([script_uuid])
+            self.save_scripts([script_uuid])
 
     def delete_script(self):
-        selection = self.saved_tree.selection()
-        if not selection:
-            return
-        
-        item = selection[0]
-        parent = self.saved_tree.parent(item)
-        
-        if not parent:
+        script_uuid = self.selected_script_uuid()
+        if not script_uuid:
             return
-        
-        item_text = self.saved_tree.item(item)["text"]
-        script_uuid = None
-        
-        for uuid, info in self.saved_scripts.items():
-            if info.get('display_name', info['name']) == item_text:
-                script_uuid = uuid
-                break
-        
-        if script_uuid and messagebox.askyesno("Подтверждение", f"Удалить скрипт '{item_text}'?"):
-            if script_uuid in self.active_scripts:
+
+        item_text = self.saved_tree.item(script_uuid)["text"]
+        if messagebox.askyesno("Подтверждение", f"Удалить скрипт '{item_text}'?"):
+            if script_uuid in self.registry:
                 self.remove_from_active(script_uuid)
             
             del self.saved_scripts[script_uuid]
-            self.update_saved_tree()
-            self.save_scripts()
+            self.refresh_tree_rows([script_uuid])
+            self.save_scripts([script_uuid])
 
     def rename_script_dialog(self):
         """Диалог переименования скрипта"""
-        selection = self.saved_tree.selection()
-        if not selection:
-            return
-        
-        item = selection[0]
-        parent = self.saved_tree.parent(item)
-        
-        if not parent:
+        script_uuid = self.selected_script_uuid()
+        if not script_uuid:
             return
-        
-        item_text = self.saved_tree.item(item)["text"]
-        script_uuid = None
-        
-        for uuid, info in self.saved_scripts.items():
-            if info.get('display_name', info['name']) == item_text:
-                script_uuid = uuid
-                break
-        
-        if script_uuid:
-            new_name = simpledialog.askstring("Переименовать скрипт", 
-                                             "Введите новое имя:", 
-                                             initialvalue=item_text)
-            if new_name:
-                self.rename_script(script_uuid, new_name)
+
+        item_text = self.saved_tree.item(script_uuid)["text"]
+        new_name = simpledialog.askstring("Переименовать скрипт", 
+                                         "Введите новое имя:", 
+                                         initialvalue=item_text)
+        if new_name:
+            self.rename_script(script_uuid, new_name)
                 
     def rename_script(self, script_uuid, new_name):
         """Переименовывает скрипт"""
@@ -1186,15 +6971,14 @@ Python: {sys.version.split()[0]}
             script_info['display_name'] = new_name
             
             # Обновляем дерево
-            self.update_saved_tree()
+            self.refresh_tree_rows([script_uuid])
             
-            # Обновляем фрейм если скрипт активен
-            for script_data in self.script_frames:
-                if script_data['script_uuid'] == script_uuid:
-                    script_data['frame'].configure(text=new_name)
-                    break
+            # Обновляем строку панели если скрипт активен
+            if script_uuid in self.registry:
+                self.supervisor.update_info(script_uuid, script_info)
+            self.scripts_list.refresh(script_uuid)
             
-            self.save_scripts()
+            self.save_scripts([script_uuid])
 
     def configure_script(self, script_uuid):
         """Настройка скрипта через диалог"""
@@ -1215,76 +6999,479 @@ Python: {sys.version.split()[0]}
             new_name = dialog.result.get('display_name', dialog.result['name'])
             
             # Обновляем дерево
-            self.update_saved_tree()
+            self.refresh_tree_rows([script_uuid])
             
-            # Обновляем фрейм если скрипт активен
-            for script_data in self.script_frames:
-                if script_data['script_uuid'] == script_uuid:
-                    script_data['frame'].configure(text=new_name)
-                    script_data['script_info'] = dialog.result
-                    break
+            # Обновляем строку панели если скрипт активен
+            if script_uuid in self.registry:
+                self.supervisor.update_info(script_uuid, dialog.result)
+            self.scripts_list.refresh(script_uuid)
             
-            self.save_scripts()
+            self.save_scripts([script_uuid])
 
     def start_monitoring(self):
-        def monitor():
-            if not HAS_PSUTIL or not self.settings.get('performance_monitoring', True):
+        """Запускает периодическое применение снимков ресурсов от ядра"""
+        self.root.after(MONITOR_POLL_MS, self.apply_monitor_snapshot)
+
+    def reset_script_resources(self, script_uuid):
+        had_metrics = self.script_metrics.pop(script_uuid, None) is not None
+        if self.script_sparklines.pop(script_uuid, None) is not None or had_metrics:
+            self.scripts_list.refresh(script_uuid)
+
+    def apply_monitor_snapshot(self):
+        """Применяет последний снимок сборщика к интерфейсу одним проходом"""
+        try:
+            monitoring = HAS_PSUTIL and self.settings.get('performance_monitoring', True)
+            self.supervisor.set_monitoring(monitoring)
+            if not monitoring:
+                self.supervisor.latest_snapshot()
                 self.total_cpu_var.set(0)
                 self.total_memory_var.set(0)
                 self.total_cpu_label.config(text="0%")
                 self.total_memory_label.config(text="0%")
-                
-                for script_data in self.script_frames:
-                    if script_data['frame'].winfo_exists():
-                        script_data['cpu_var'].set(0)
-                        script_data['memory_var'].set(0)
-                        script_data['cpu_label'].config(text="0%")
-                        script_data['memory_label'].config(text="0%")
+
+                if self.script_metrics or self.script_sparklines:
+                    self.script_metrics.clear()
+                    self.script_sparklines.clear()
+                    self.scripts_list.refresh()
             else:
-                try:
-                    system_cpu = psutil.cpu_percent(interval=0.1)
-                    system_memory = psutil.virtual_memory().percent
-                    
+                snapshot = self.supervisor.latest_snapshot()
+                # Пока окно в трее, виджеты не обновляются
+                if snapshot and self.root.state() != 'withdrawn':
+                    system_cpu = snapshot['system']['cpu']
+                    system_memory = snapshot['system']['memory']
+
                     self.total_cpu_var.set(int(system_cpu))
                     self.total_memory_var.set(int(system_memory))
                     self.total_cpu_label.config(text=f"{system_cpu:.1f}%")
                     self.total_memory_label.config(text=f"{system_memory:.1f}%")
-                    
-                    for script_data in self.script_frames:
-                        if not script_data['frame'].winfo_exists():
-                            continue
-                        
-                        if script_data['is_running'] and script_data['pid']:
-                            try:
-                                process = psutil.Process(script_data['pid'])
-                                cpu = process.cpu_percent(interval=0.1)
-                                memory = process.memory_percent()
-                                
-                                script_data['cpu_var'].set(int(cpu))
-                                script_data['memory_var'].set(int(memory))
-                                script_data['cpu_label'].config(text=f"{cpu:.1f}%")
-                                script_data['memory_label'].config(text=f"{memory:.1f}%")
-                            except:
-                                script_data['is_running'] = False
-                                script_data['cpu_var'].set(0)
-                                script_data['memory_var'].set(0)
-                                script_data['cpu_label'].config(text="0%")
-                                script_data['memory_label'].config(text="0%")
-                        else:
-                            script_data['cpu_var'].set(0)
-                            script_data['memory_var'].set(0)
-                            script_data['cpu_label'].config(text="0%")
-                            script_data['memory_label'].config(text="0%")
-                except Exception as e:
-                    print(f"Ошибка мониторинга: {e}")
-            
-            self.root.after(1000, monitor)
-        
-        self.root.after(1000, monitor)
+
+                    # Данные обновляются для всех скриптов, виджеты - только видимые
+                    metrics = {}
+                    for runtime in self.registry.running():
+                        sample = snapshot['scripts'].get(runtime.script_uuid)
+                        if sample and sample['alive']:
+                            metrics[runtime.script_uuid] = (sample['cpu'], sample['memory'])
+                            sparkline = self.script_sparklines.get(runtime.script_uuid)
+                            if sparkline is None:
+                                sparkline = self.script_sparklines[runtime.script_uuid] = [
+                                    0, deque(maxlen=SPARKLINE_POINTS), deque(maxlen=SPARKLINE_POINTS)]
+                            sparkline[0] += 1
+                            sparkline[1].append(sample['cpu'])
+                            sparkline[2].append(sample['memory'])
+                    self.script_metrics = metrics
+                    self.scripts_list.refresh()
+        except Exception as e:
+            print(f"Ошибка мониторинга: {e}")
+
+        self.root.after(MONITOR_POLL_MS, self.apply_monitor_snapshot)
+
+# Сколько операций пакетной команды CLI выполняется одновременно
+CLI_JOBS = 16
+# Период опроса демона в tail -f (секунды)
+CLI_TAIL_INTERVAL = 0.5
+
+
+def script_display_name(script_info):
+    return script_info.get('display_name', script_info.get('name', ''))
+
+
+def select_scripts(catalog, patterns, tags, interpreter=None):
+    """uuid скриптов каталога, подходящих под имена или шаблоны glob, теги и интерпретатор"""
+    selected = []
+    for script_uuid, script_info in catalog.items():
+        names = (script_uuid, script_info.get('name', ''), script_display_name(script_info))
+        if patterns and not any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns for name in names):
+            continue
+        if tags and not set(tags) & set(script_info.get('tags', [])):
+            continue
+        if interpreter is not None and script_info.get('interpreter') != interpreter:
+            continue
+        selected.append(script_uuid)
+    return selected
+
+
+def run_batch(operation, script_uuids, catalog, jobs=CLI_JOBS):
+    """Выполняет operation(uuid) для всех скриптов не более чем в jobs потоков.
+
+    Печатает результат по мере завершения; возвращает число ошибок.
+    """
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = {executor.submit(operation, script_uuid): script_uuid for script_uuid in script_uuids}
+        for future in as_completed(futures):
+            name = script_display_name(catalog.get(futures[future], {})) or futures[future]
+            try:
+                print(f"{name}: {future.result()}")
+            except (OSError, RuntimeError) as e:
+                failures += 1
+                print(f"{name}: ошибка: {e}", file=sys.stderr)
+    return failures
+
+
+def cli_status(client, catalog, script_uuids):
+    remote = {}
+    metrics = {}
+    if client:
+        remote = {item['uuid']: item for item in client.request('GET', '/status')['scripts']}
+        metrics = client.request('GET', '/metrics').get('scripts', {})
+
+    rows = [("ИМЯ", "СОСТОЯНИЕ", "PID", "CPU%", "ПАМЯТЬ%", "ТЕГИ")]
+    for script_uuid in script_uuids:
+        script_info = catalog[script_uuid]
+        item = remote.get(script_uuid)
+        if item is None:
+            state, pid = "неактивен", ""
+        elif item['running']:
+            state, pid = "работает" if item.get('ready', True) else "запускается", str(item['pid'])
+        elif item.get('queued'):
+            state, pid = "в очереди", ""
+        elif item.get('crash_loop'):
+            state, pid = "цикл сбоев", ""
+        elif item.get('next_restart') is not None:
+            state, pid = f"перезапуск через {item['next_restart']:.0f} с", ""
+        elif item['exit_code'] is not None:
+            state, pid = f"завершён ({item['exit_code']})", ""
+        else:
+            state, pid = "остановлен", ""
+        sample = metrics.get(script_uuid) if pid else None
+        cpu, memory = (f"{sample['cpu']:.1f}", f"{sample['memory']:.1f}") if sample and sample['alive'] else ("", "")
+        rows.append((script_display_name(script_info), state, pid, cpu, memory,
+                     ",".join(script_info.get('tags', []))))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+    if not client:
+        print("\nДемон не запущен: состояние процессов неизвестно")
+    return 0
+
+
+def cli_history(database, catalog, script_uuid, limit):
+    """Последние запуски скрипта из истории в базе каталога"""
+    if database is None:
+        print("История запусков ведётся только в каталоге SQLite", file=sys.stderr)
+        return 1
+
+    def moment(timestamp):
+        return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S") if timestamp else ""
+
+    print(script_display_name(catalog[script_uuid]))
+    rows = [("НАЧАЛО", "КОНЕЦ", "PID", "ИТОГ")]
+    for run in database.runs(script_uuid, limit):
+        if run['ended_at'] is None:
+            result = "работает или прерван"
+        elif run['stopped']:
+            result = "остановлен"
+        elif run['exit_code'] is None:
+            result = "не запустился"
+        else:
+            result = f"код {run['exit_code']}"
+        rows.append((moment(run['started_at']), moment(run['ended_at']),
+                     str(run['pid'] or ""), result))
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+    return 0
+
+
+def cli_tail(client, catalog, script_uuid, line_count, follow):
+    """Последние строки вывода скрипта; с follow - и новые по мере появления"""
+    if client is None:
+        if follow:
+            print("Для tail -f нужен запущенный демон", file=sys.stderr)
+            return 1
+        path = ScriptLogManager(LOGS_DIR, load_json_file(SETTINGS_FILE)).path_for(script_uuid)
+        if not os.path.exists(path):
+            print("Журнал скрипта не найден", file=sys.stderr)
+            return 1
+        index = LogLineIndex(path)
+        try:
+            text, _ = index.read_lines(index.last_lines_offset(line_count), line_count)
+        finally:
+            index.close()
+        sys.stdout.write(text)
+        return 0
+
+    data = client.request('GET', f'/tail?uuid={script_uuid}&lines={line_count}')
+    sys.stdout.write(data['text'])
+    sys.stdout.flush()
+    position = data['position']
+    try:
+        while follow:
+            time.sleep(CLI_TAIL_INTERVAL)
+            chunk = client.request('POST', '/output', {'positions': {script_uuid: position}})[script_uuid]
+            position = chunk['position']
+            if chunk['text']:
+                sys.stdout.write(chunk['text'])
+                sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cli_import(client, catalog, directory, recursive, tags, interpreter, activate, database=None):
+    """Добавляет в каталог все .py файлы каталога directory"""
+    pattern = os.path.join(directory, "**", "*.py") if recursive else os.path.join(directory, "*.py")
+    known = {os.path.normcase(os.path.abspath(info.get('path', ''))) for info in catalog.values()}
+    added = []
+    for script_path in sorted(glob.glob(pattern, recursive=recursive)):
+        script_path = os.path.abspath(script_path)
+        if os.path.normcase(script_path) in known:
+            continue
+        script_name = os.path.basename(script_path).replace('.py', '')
+        script_uuid = str(uuid.uuid4())
+        catalog[script_uuid] = {
+            'uuid': script_uuid,
+            'name': script_name,
+            'display_name': script_name,
+            'path': script_path,
+            'interpreter': interpreter,
+            'autostart': False,
+            'tags': list(tags),
+            'is_active': activate
+        }
+        known.add(os.path.normcase(script_path))
+        added.append(script_uuid)
+
+    if database:
+        # В базу добавляются только новые строки
+        database.write_scripts({script_uuid: (catalog[script_uuid], catalog_row_text(catalog[script_uuid]))
+                                for script_uuid in added})
+    else:
+        write_json_atomic(SCRIPTS_FILE, catalog)
+
+    if client and activate:
+        for script_uuid in added:
+            client.request('POST', '/activate', {'uuid': script_uuid, 'info': catalog[script_uuid]})
+    print(f"Добавлено скриптов: {len(added)}")
+    return 0
+
+
+def run_cli(args):
+    """Выполняет команду CLI над каталогом (scripts.json или база) и запущенным демоном"""
+    database = open_catalog()
+    try:
+        return run_cli_command(args, database)
+    finally:
+        if database:
+            database.close()
+
+
+def run_cli_command(args, database):
+    catalog = database.load_scripts() if database else load_json_file(SCRIPTS_FILE)
+    client = DaemonClient.connect()
+
+    if args.command == 'import':
+        settings = database.load_settings() if database else load_json_file(SETTINGS_FILE)
+        interpreter = args.interpreter or settings.get('default_interpreter', find_system_python())
+        return cli_import(client, catalog, args.directory, args.recursive, args.tag or [],
+                          interpreter, args.activate, database)
+
+    if database:
+        # Отбор по индексам базы, без просмотра всего каталога
+        script_uuids = database.find(args.scripts, args.tag or (), args.interpreter)
+    else:
+        script_uuids = select_scripts(catalog, args.scripts, args.tag, args.interpreter)
+    if args.command == 'status':
+        return cli_status(client, catalog, script_uuids)
+
+    if not script_uuids:
+        print("Нет подходящих скриптов", file=sys.stderr)
+        return 1
+
+    if args.command == 'tail':
+        if len(script_uuids) > 1:
+            print("Под шаблон подходит несколько скриптов", file=sys.stderr)
+            return 1
+        return cli_tail(client, catalog, script_uuids[0], args.lines, args.follow)
+
+    if args.command == 'history':
+        if len(script_uuids) > 1:
+            print("Под шаблон подходит несколько скриптов", file=sys.stderr)
+            return 1
+        return cli_history(database, catalog, script_uuids[0], args.lines)
+
+    if client is None:
+        print("Демон не запущен. Запустите его командой: main.py --daemon", file=sys.stderr)
+        return 1
+
+    active = {item['uuid'] for item in client.request('GET', '/status')['scripts']}
+
+    def start(script_uuid):
+        if script_uuid not in active:
+            client.request('POST', '/activate', {'uuid': script_uuid, 'info': catalog[script_uuid]})
+        client.request('POST', '/start', {'uuid': script_uuid})
+        return "в очереди на запуск"
+
+    def stop(script_uuid):
+        if script_uuid not in active:
+            return "не активен"
+        result = client.request('POST', '/stop', {'uuid': script_uuid}, timeout=DAEMON_STOP_TIMEOUT)
+        return "остановлен (принудительно)" if result['killed'] else "остановлен"
+
+    def restart(script_uuid):
+        if script_uuid not in active:
+            client.request('POST', '/activate', {'uuid': script_uuid, 'info': catalog[script_uuid]})
+        result = client.request('POST', '/restart', {'uuid': script_uuid}, timeout=DAEMON_STOP_TIMEOUT)
+        return "перезапущен (принудительно)" if result['killed'] else "перезапущен"
+
+    operation = {'start': start, 'stop': stop, 'restart': restart}[args.command]
+    return 1 if run_batch(operation, script_uuids, catalog, args.jobs) else 0
+
+
+# Число процессов и тиков в сравнении источников замеров
+SAMPLER_BENCHMARK_PIDS = (10, 100, 1000)
+SAMPLER_BENCHMARK_ROUNDS = 20
+
+
+def run_sampler_benchmark(pid_counts=SAMPLER_BENCHMARK_PIDS, rounds=SAMPLER_BENCHMARK_ROUNDS):
+    """Сравнивает время одного тика источников замеров на N спящих процессах"""
+    if not HAS_PSUTIL:
+        print("Для сравнения нужен psutil", file=sys.stderr)
+        return 1
+    backends = [PsutilSamplerBackend]
+    if ProcfsSamplerBackend.available():
+        backends.append(ProcfsSamplerBackend)
+    if shutil.which("sleep"):
+        command = ["sleep", "3600"]
+    else:
+        command = [sys.executable, "-c", "import time; time.sleep(3600)"]
+
+    print(f"{'процессов':>10}" + "".join(f"{backend.name + ', мс/тик':>18}" for backend in backends))
+    processes = []
+    try:
+        for count in sorted(pid_counts):
+            while len(processes) < count:
+                processes.append(subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            targets = {str(index): process.pid for index, process in enumerate(processes[:count])}
+            timings = []
+            for backend_class in backends:
+                backend = backend_class()
+                # Первый тик открывает процессы и задаёт точку отсчёта CPU
+                backend.sample(targets)
+                started = time.perf_counter()
+                for _ in range(rounds):
+                    backend.sample(targets)
+                timings.append((time.perf_counter() - started) / rounds * 1000)
+                backend.close()
+            print(f"{count:>10}" + "".join(f"{timing:>18.2f}" for timing in timings))
+    finally:
+        for process in processes:
+            process.kill()
+        for process in processes:
+            process.wait()
+    return 0
+
+
+def run_daemon(port=None, metrics_port=None):
+    """Работа без интерфейса: скрипты и управляющий API на localhost.
+
+    Активные скрипты берутся из scripts.json; интерфейс, подключённый к
+    демону, сообщает ему об изменениях через API. Адрес и токен API
+    записываются в daemon.json, доступный только владельцу.
+    """
+    database = open_catalog()
+    settings = database.load_settings() if database else load_json_file(SETTINGS_FILE)
+    scripts = database.load_scripts() if database else load_json_file(SCRIPTS_FILE)
+    if metrics_port is not None:
+        settings['metrics_exporter_port'] = metrics_port
+
+    if DaemonClient.connect():
+        print("Демон уже запущен")
+        if database:
+            database.close()
+        return 1
+
+    supervisor = ScriptSupervisor(settings)
+    if database:
+        supervisor.add_listener(RunHistoryRecorder(database))
+    for script_uuid, script_info in scripts.items():
+        if script_info.get('is_active', False):
+            supervisor.activate(script_uuid, script_info)
+    supervisor.autostart()
+
+    if port is None:
+        port = settings.get('daemon_port', 0)
+    server = ControlServer(supervisor, DAEMON_HOST, port)
+    server.start()
+
+    host, port = server.address
+    fd = os.open(DAEMON_STATE_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'host': host, 'port': port, 'token': server.token, 'pid': os.getpid()}, f)
+    print(f"Демон слушает {host}:{port}")
+    if supervisor.exporter:
+        print("Метрики Prometheus: http://{}:{}/metrics".format(*supervisor.exporter.address))
+
+    def request_shutdown(signum, frame):
+        server.shutdown_requested.set()
+
+    signal.signal(signal.SIGINT, request_shutdown)
+    signal.signal(signal.SIGTERM, request_shutdown)
+
+    try:
+        while not server.shutdown_requested.wait(1.0):
+            pass
+    finally:
+        server.stop()
+        supervisor.shutdown(stop_scripts=True)
+        if database:
+            database.close()
+        state = read_daemon_state()
+        if state and state.get('pid') == os.getpid():
+            os.remove(DAEMON_STATE_FILE)
+    return 0
 
 
 def main():
     """Точка входа с обработкой исключений"""
+    parser = argparse.ArgumentParser(description="Python Script Manager")
+    parser.add_argument('--daemon', action='store_true',
+                        help="запустить без интерфейса с управляющим API на localhost")
+    parser.add_argument('--port', type=int, default=None, help="порт управляющего API демона")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="порт экспортёра метрик Prometheus на localhost (0 - выключен)")
+
+    commands = parser.add_subparsers(dest='command', title="команды")
+    for name, help_text in (('status', "состояние скриптов"),
+                            ('start', "запустить скрипты"),
+                            ('stop', "остановить скрипты"),
+                            ('restart', "перезапустить скрипты"),
+                            ('tail', "вывод скрипта"),
+                            ('history', "последние запуски скрипта (каталог SQLite)")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('scripts', nargs='*', metavar='ИМЯ', help="имя, uuid или шаблон glob")
+        command.add_argument('--tag', action='append', help="только скрипты с тегом (можно несколько)")
+        command.add_argument('--interpreter', help="только скрипты с этим интерпретатором")
+        if name in ('start', 'stop', 'restart'):
+            command.add_argument('-j', '--jobs', type=int, default=CLI_JOBS,
+                                 help="сколько скриптов обрабатывать одновременно")
+        if name in ('tail', 'history'):
+            command.add_argument('-n', '--lines', type=int, default=20, help="сколько последних строк показать")
+            command.add_argument('-f', '--follow', action='store_true', help="выводить новые строки")
+
+    command = commands.add_parser('bench-sampler', help="сравнить скорость источников замеров процессов")
+    command.add_argument('--pids', type=int, nargs='+', default=list(SAMPLER_BENCHMARK_PIDS),
+                         help="числа процессов для замера")
+    command.add_argument('--rounds', type=int, default=SAMPLER_BENCHMARK_ROUNDS, help="тиков на каждый замер")
+
+    command = commands.add_parser('import', help="добавить в каталог все .py файлы папки")
+    command.add_argument('directory', help="папка со скриптами")
+    command.add_argument('-r', '--recursive', action='store_true', help="включая вложенные папки")
+    command.add_argument('--tag', action='append', help="назначить тег (можно несколько)")
+    command.add_argument('--interpreter', help="интерпретатор Python для новых скриптов")
+    command.add_argument('--activate', action='store_true', help="сразу сделать скрипты активными")
+    args = parser.parse_args()
+
+    if args.daemon:
+        sys.exit(run_daemon(args.port, args.metrics_port))
+    if args.command == 'bench-sampler':
+        sys.exit(run_sampler_benchmark(args.pids, args.rounds))
+    if args.command:
+        sys.exit(run_cli(args))
+
     try:
         root = tk.Tk()
         